@@ -0,0 +1,316 @@
+"""
+Recall vs latency benchmark for reduced embedding dimensions and vector
+compression, run against a local NumPy stand-in of Weaviate's quantizers.
+
+Every (dimensions, compression) setting is scored against exact float32
+search over the full vectors:
+
+    python -m app.benchmarks.compression --dims 1536,512,256 --compression none,sq,bq,pq
+    python -m app.benchmarks.compression --vectors exported_vectors.npy
+
+Pass real embeddings (e.g. a `vectors.npy` from the local vector store or a
+snapshot export) with --vectors to pick settings on production-like data;
+without it a synthetic clustered corpus is generated.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def synthetic_corpus(size: int, dims: int, clusters: int = 64, seed: int = 0):
+    """
+    Clustered unit vectors, roughly mimicking the topical structure of
+    document chunk embeddings. Leading components carry more energy, like
+    text-embedding-3 vectors, so truncating dimensions loses less recall
+    than it would on isotropic noise.
+    """
+    rng = np.random.default_rng(seed)
+    decay = 1 / np.sqrt(1 + np.arange(dims) / 64)
+    centers = rng.normal(size=(clusters, dims)) * decay
+    labels = rng.integers(0, clusters, size=size)
+    noise = 0.6 * rng.normal(size=(size, dims)) * decay
+    return normalize(centers[labels] + noise)
+
+
+def reduce_dimensions(matrix: np.ndarray, dims: int) -> np.ndarray:
+    """
+    Shorten vectors the way text-embedding-3 `dimensions` does:
+    keep the leading components and re-normalize.
+    """
+    return normalize(matrix[:, :dims])
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    return np.take_along_axis(part, np.argsort(-part_scores, axis=1), axis=1)
+
+
+class FlatIndex:
+    """
+    Uncompressed float32 vectors.
+    """
+
+    name = "none"
+
+    def __init__(self, vectors: np.ndarray, **kwargs):
+        self.vectors = vectors
+
+    def bytes_per_vector(self) -> int:
+        return self.vectors.shape[1] * 4
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        return queries @ self.vectors.T
+
+    def search(self, queries: np.ndarray, k: int) -> np.ndarray:
+        return top_k(self.scores(queries), k)
+
+
+class RescoringIndex(FlatIndex):
+    """
+    Compressed index that ranks by approximate scores, then rescores the
+    best `rescore_limit` candidates with the float32 vectors, as Weaviate
+    does for BQ and SQ.
+    """
+
+    def __init__(self, vectors: np.ndarray, rescore_limit: int = 100, **kwargs):
+        super().__init__(vectors)
+        self.rescore_limit = rescore_limit
+
+    def search(self, queries, k):
+        candidates = top_k(self.scores(queries), max(k, self.rescore_limit))
+        exact = np.einsum("qd,qkd->qk", queries, self.vectors[candidates])
+        return np.take_along_axis(candidates, top_k(exact, k), axis=1)
+
+
+class ScalarQuantizedIndex(RescoringIndex):
+    """
+    SQ: every dimension stored as one uint8 between the corpus min and max.
+    """
+
+    name = "sq"
+
+    def __init__(self, vectors, **kwargs):
+        super().__init__(vectors, **kwargs)
+        self.low = float(vectors.min())
+        self.step = (float(vectors.max()) - self.low) / 255 or 1.0
+        self.codes = np.round((vectors - self.low) / self.step).astype(np.uint8)
+
+    def bytes_per_vector(self):
+        return self.codes.shape[1]
+
+    def scores(self, queries):
+        decoded_dot = (queries @ self.codes.T.astype(np.float32)) * self.step
+        return decoded_dot + self.low * queries.sum(axis=1, keepdims=True)
+
+
+class BinaryQuantizedIndex(RescoringIndex):
+    """
+    BQ: one sign bit per dimension, ranked by Hamming distance.
+    """
+
+    name = "bq"
+
+    def __init__(self, vectors, **kwargs):
+        super().__init__(vectors, **kwargs)
+        self.codes = np.packbits(vectors > 0, axis=1)
+
+    def bytes_per_vector(self):
+        return self.codes.shape[1]
+
+    def scores(self, queries):
+        query_codes = np.packbits(queries > 0, axis=1)
+        hamming = np.bitwise_count(
+            query_codes[:, np.newaxis, :] ^ self.codes[np.newaxis, :, :]
+        ).sum(axis=2)
+        return -hamming.astype(np.float32)
+
+
+class ProductQuantizedIndex(FlatIndex):
+    """
+    PQ: vectors split into `segments` sub-vectors, each replaced by the id
+    of its nearest of 256 k-means centroids. Scored with per-query lookup
+    tables (asymmetric distance computation), no rescoring.
+    """
+
+    name = "pq"
+
+    def __init__(self, vectors, segments: int = 0, iterations: int = 8, **kwargs):
+        super().__init__(vectors)
+        dims = vectors.shape[1]
+        self.segments = segments or max(1, dims // 8)
+        while dims % self.segments:
+            self.segments -= 1
+        self.sub_dims = dims // self.segments
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), 10000), False)]
+        self.codebooks = np.empty((self.segments, 256, self.sub_dims), dtype=np.float32)
+        self.codes = np.empty((len(vectors), self.segments), dtype=np.uint8)
+        for s in range(self.segments):
+            part = slice(s * self.sub_dims, (s + 1) * self.sub_dims)
+            centroids = self._kmeans(sample[:, part], iterations, rng)
+            self.codebooks[s] = centroids
+            self.codes[:, s] = self._assign(vectors[:, part], centroids)
+
+    @staticmethod
+    def _assign(points, centroids):
+        distances = (
+            (points**2).sum(axis=1, keepdims=True)
+            - 2 * points @ centroids.T
+            + (centroids**2).sum(axis=1)
+        )
+        return np.argmin(distances, axis=1)
+
+    def _kmeans(self, points, iterations, rng):
+        k = min(256, len(points))
+        centroids = points[rng.choice(len(points), k, replace=False)].copy()
+        if k < 256:
+            centroids = np.resize(centroids, (256, points.shape[1]))
+        for _ in range(iterations):
+            assignment = self._assign(points, centroids)
+            counts = np.bincount(assignment, minlength=256)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+        return centroids
+
+    def bytes_per_vector(self):
+        return self.segments
+
+    def scores(self, queries):
+        tables = np.einsum(
+            "qsd,scd->qsc",
+            queries.reshape(len(queries), self.segments, self.sub_dims),
+            self.codebooks,
+        )
+        segment_ids = np.arange(self.segments)
+        return np.stack(
+            [table[segment_ids, self.codes].sum(axis=1) for table in tables]
+        )
+
+
+INDEXES = {
+    index.name: index
+    for index in (
+        FlatIndex,
+        ScalarQuantizedIndex,
+        BinaryQuantizedIndex,
+        ProductQuantizedIndex,
+    )
+}
+
+
+def run_benchmark(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    dims_list: list[int],
+    compressions: list[str],
+    k: int = 3,
+    rescore_limit: int = 100,
+    pq_segments: int = 0,
+) -> list[dict]:
+    """
+    Score every (dimensions, compression) setting against exact search
+    over the full-dimension float32 corpus.
+    """
+    truth = top_k(queries @ corpus.T, k)
+    results = []
+    for dims in dims_list:
+        reduced_corpus = reduce_dimensions(corpus, dims)
+        reduced_queries = reduce_dimensions(queries, dims)
+        for compression in compressions:
+            build_start = time.perf_counter()
+            index = INDEXES[compression](
+                reduced_corpus, rescore_limit=rescore_limit, segments=pq_segments
+            )
+            build_seconds = time.perf_counter() - build_start
+
+            latencies = []
+            found = []
+            for query in reduced_queries:
+                start = time.perf_counter()
+                found.append(index.search(query[np.newaxis, :], k)[0])
+                latencies.append(time.perf_counter() - start)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            results.append(
+                {
+                    "dimensions": dims,
+                    "compression": compression,
+                    "recall_at_k": round(float(recall), 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+                    "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+                    "bytes_per_vector": index.bytes_per_vector(),
+                    "build_seconds": round(build_seconds, 3),
+                }
+            )
+    return results
+
+
+def print_table(results: list[dict], k: int):
+    header = (
+        f"{'dims':>6} {'compression':>11} {f'recall@{k}':>10} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'bytes/vec':>10} {'build s':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['dimensions']:>6} {r['compression']:>11} {r['recall_at_k']:>10.4f} "
+            f"{r['p50_ms']:>8.3f} {r['p95_ms']:>8.3f} {r['bytes_per_vector']:>10} "
+            f"{r['build_seconds']:>8.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--vectors", help="Path to a .npy matrix of real embeddings")
+    parser.add_argument("--corpus-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--full-dims", type=int, default=1536)
+    parser.add_argument("--dims", default="1536,1024,512,256")
+    parser.add_argument("--compression", default="none,sq,bq,pq")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--rescore-limit", type=int, default=100)
+    parser.add_argument("--pq-segments", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = normalize(np.load(args.vectors, mmap_mode="r")[: args.corpus_size])
+    else:
+        corpus = synthetic_corpus(args.corpus_size, args.full_dims)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors so every query has true neighbours
+    picked = corpus[rng.choice(len(corpus), args.queries, replace=False)]
+    queries = normalize(
+        picked + 0.3 * rng.normal(size=picked.shape) / np.sqrt(corpus.shape[1])
+    )
+
+    dims_list = [int(d) for d in args.dims.split(",") if int(d) <= corpus.shape[1]]
+    compressions = [c.strip() for c in args.compression.split(",")]
+    results = run_benchmark(
+        corpus,
+        queries,
+        dims_list,
+        compressions,
+        k=args.k,
+        rescore_limit=args.rescore_limit,
+        pq_segments=args.pq_segments,
+    )
+    print_table(results, args.k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
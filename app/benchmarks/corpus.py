@@ -0,0 +1,89 @@
+"""
+Deterministic generated corpora for the benchmarks.
+"""
+import io
+import json
+import random
+
+import fitz
+from PIL import Image, ImageDraw
+
+VOCABULARY = (
+    "policy employee report company data customer service contract payment "
+    "period notice agreement section clause manager review process request "
+    "approval document account invoice record annual quarterly revenue "
+    "compliance audit security access training leave benefit insurance claim "
+    "the a of to and in for on with by is are be this that from as at"
+).split()
+
+
+def generate_text(words: int, seed: int = 0) -> str:
+    """
+    Paragraphs of 20-120 random vocabulary words separated by blank lines.
+    """
+    rng = random.Random(seed)
+    paragraphs = []
+    remaining = words
+    while remaining > 0:
+        size = min(remaining, rng.randint(20, 120))
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(size))
+        paragraphs.append(sentence.capitalize() + ".")
+        remaining -= size
+    return "\n\n".join(paragraphs)
+
+
+def generate_pdf(path: str, pages: int, scanned: bool = False, seed: int = 0):
+    """
+    Write a PDF with `pages` pages of generated text. With `scanned` every
+    page is an image without a text layer, so parsing must fall back to OCR.
+    """
+    with fitz.open() as doc:
+        for number in range(pages):
+            text = generate_text(250, seed=seed + number)
+            page = doc.new_page()
+            if scanned:
+                image = Image.new("L", (1240, 1754), 255)
+                draw = ImageDraw.Draw(image)
+                words = text.split()
+                for line in range(0, len(words), 12):
+                    draw.text(
+                        (60, 60 + (line // 12) * 28),
+                        " ".join(words[line : line + 12]),
+                        fill=0,
+                    )
+                buffer = io.BytesIO()
+                image.save(buffer, format="PNG")
+                page.insert_image(page.rect, stream=buffer.getvalue())
+            else:
+                page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=9)
+        doc.save(path)
+
+
+def generate_records(count: int, seed: int = 0) -> list[dict]:
+    """
+    Nested JSON customer records for structured JSON datasets.
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "customer_id": i,
+            "name": f"customer {i}",
+            "age": rng.randint(18, 80),
+            "membership": rng.choice(["gold", "silver", "bronze"]),
+            "purchases_last_6_months": rng.randint(0, 50),
+            "total_spent": round(rng.uniform(0, 5000), 2),
+            "preferred_category": rng.choice(["books", "games", "garden"]),
+            "last_purchase_date": f"2025-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}",
+            "nearest_store": rng.choice(["north", "south", "east", "west"]),
+            "address": {
+                "city": rng.choice(["Pune", "Delhi"]),
+                "zip": rng.randint(1, 9),
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def generate_json(path: str, count: int, seed: int = 0):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(generate_records(count, seed=seed), f)
@@ -0,0 +1,555 @@
+"""
+Local stand-ins for OpenAI, Weaviate, S3 and SQS used by the benchmarks.
+
+They implement only the calls the app makes, keep everything in memory and
+can add a fixed `latency` (seconds) to every remote call to mimic the
+network round trip.
+"""
+import base64
+import fnmatch
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+from uuid import uuid4
+from collections import defaultdict
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import fitz
+import numpy as np
+from botocore.exceptions import ClientError
+
+from app.services.embedding import HashingEmbedder, OpenAIEmbedder
+from app.services.vector_store import WeaviateVectorStore
+
+
+class FakeOpenAI:
+    """
+    Mimics `OpenAI().embeddings.create`, returning deterministic
+    feature-hashing vectors.
+    """
+
+    def __init__(self, latency: float = 0.0, dimensions: int = 1536):
+        self.latency = latency
+        self.calls = 0
+        self._hashing = HashingEmbedder(dimensions=dimensions)
+        self.embeddings = SimpleNamespace(create=self._create)
+
+    def _create(self, input, model, dimensions=None, encoding_format=None, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        vectors = self._hashing.embed_batch_array(input)
+        if dimensions:
+            vectors = vectors[:, :dimensions]
+        if encoding_format == "base64":
+            embeddings = [base64.b64encode(v.tobytes()).decode() for v in vectors]
+        else:
+            embeddings = vectors.tolist()
+        return SimpleNamespace(data=[SimpleNamespace(embedding=e) for e in embeddings])
+
+
+class _FakeBatch:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_object(self, properties, vector=None, uuid=None, **kwargs):
+        self.collection.add(properties, vector, uuid=uuid)
+
+
+class _FakeBatchManager:
+    def __init__(self, collection):
+        self.collection = collection
+        self.failed_objects = []
+
+    def fixed_size(self, batch_size=100, concurrent_requests=2, **kwargs):
+        return _FakeBatch(self.collection)
+
+    def dynamic(self, **kwargs):
+        return _FakeBatch(self.collection)
+
+    def rate_limit(self, requests_per_minute, **kwargs):
+        return _FakeBatch(self.collection)
+
+
+def _matches(properties: dict, filters) -> bool:
+    """
+    Evaluate the subset of weaviate Filter objects the app builds.
+    """
+    if filters is None:
+        return True
+    if hasattr(filters, "filters"):
+        results = [_matches(properties, f) for f in filters.filters]
+        return all(results) if type(filters).__name__ == "_FilterAnd" else any(results)
+    value = properties.get(filters.target)
+    operator = filters.operator.name
+    if operator == "EQUAL":
+        return value == filters.value
+    if operator == "LIKE":
+        return value is not None and fnmatch.fnmatchcase(str(value), filters.value)
+    if operator == "CONTAINS_ANY":
+        return value in filters.value
+    raise NotImplementedError(f"Unsupported filter operator: {operator}")
+
+
+def _property_config(prop):
+    """
+    The schema read back from `config.get()` for a created `Property`.
+    """
+    return SimpleNamespace(
+        name=prop.name,
+        description=prop.description,
+        data_type=prop.dataType,
+        tokenization=prop.tokenization,
+        index_filterable=prop.indexFilterable,
+        index_range_filters=bool(prop.indexRangeFilters),
+    )
+
+
+class FakeCollection:
+    """
+    A collection, or with `tenant` one tenant's shard of a multi-tenant
+    collection. Tenants are created on first write and activated on access.
+    """
+
+    def __init__(
+        self, name: str, latency: float = 0.0, properties=None, tenant=None, parent=None
+    ):
+        self.name = name
+        self.latency = latency
+        self.tenant = tenant
+        self._parent = parent
+        self.objects = []
+        self._uuids = set()
+        self.activity_status = "ACTIVE"
+        self._tenants = {}
+        self.properties = [_property_config(p) for p in properties or []]
+        self._lock = threading.Lock()
+        self.batch = _FakeBatchManager(self)
+        self.query = SimpleNamespace(
+            near_vector=self._near_vector,
+            bm25=self._bm25,
+            fetch_objects=self._fetch_objects,
+        )
+        self.data = SimpleNamespace(
+            insert=self._insert,
+            insert_many=self._insert_many,
+            delete_many=self._delete_many,
+        )
+        self.aggregate = SimpleNamespace(over_all=self._over_all)
+        self.config = SimpleNamespace(
+            get=lambda: SimpleNamespace(properties=list(self.properties)),
+            add_property=lambda prop: self.properties.append(_property_config(prop)),
+        )
+        self.tenants = SimpleNamespace(
+            get=lambda: {
+                name: SimpleNamespace(name=name, activity_status=t.activity_status)
+                for name, t in self._tenants.items()
+            },
+            exists=lambda name: name in self._tenants,
+            create=lambda tenants: [
+                self._register(self.with_tenant(t.name)) for t in tenants
+            ],
+            update=self._update_tenants,
+        )
+
+    def with_tenant(self, tenant: str):
+        if tenant not in self._tenants:
+            return FakeCollection(
+                self.name, latency=self.latency, tenant=tenant, parent=self
+            )
+        self._tenants[tenant].activity_status = "ACTIVE"
+        return self._tenants[tenant]
+
+    def _register(self, tenant_collection):
+        self._tenants.setdefault(tenant_collection.tenant, tenant_collection)
+
+    def _update_tenants(self, tenants):
+        for tenant in tenants:
+            self._tenants[tenant.name].activity_status = tenant.activity_status.value
+
+    def _sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add(self, properties, vector=None, uuid=None):
+        """
+        Insert an object, or replace the one with the same `uuid`.
+        """
+        if isinstance(vector, dict):
+            # Named vectors: collections here have at most one
+            vector = next(iter(vector.values()), None)
+        obj = SimpleNamespace(
+            uuid=uuid or uuid4(),
+            properties=dict(properties),
+            vector=None if vector is None else np.asarray(vector, np.float32),
+            metadata=SimpleNamespace(distance=None),
+        )
+        if self._parent is not None:
+            self._parent._register(self)
+        with self._lock:
+            if str(obj.uuid) in self._uuids:
+                self.objects = [o for o in self.objects if str(o.uuid) != str(obj.uuid)]
+            self._uuids.add(str(obj.uuid))
+            self.objects.append(obj)
+
+    @staticmethod
+    def _returned(obj, include_vector):
+        return SimpleNamespace(
+            uuid=obj.uuid,
+            properties=dict(obj.properties),
+            vector=(
+                {"custom_vector": obj.vector.tolist()}
+                if include_vector and obj.vector is not None
+                else {}
+            ),
+        )
+
+    def iterator(self, include_vector=False, **kwargs):
+        for obj in list(self.objects):
+            yield self._returned(obj, include_vector)
+
+    def _insert(self, properties, vector=None, **kwargs):
+        self._sleep()
+        self.add(properties, vector)
+
+    def _insert_many(self, objects, **kwargs):
+        self._sleep()
+        for properties in objects if isinstance(objects, list) else [objects]:
+            self.add(properties)
+
+    def _delete_many(self, where, verbose=False, **kwargs):
+        self._sleep()
+        with self._lock:
+            kept = [o for o in self.objects if not _matches(o.properties, where)]
+            deleted = len(self.objects) - len(kept)
+            self.objects = kept
+            self._uuids = {str(o.uuid) for o in kept}
+        return SimpleNamespace(matches=deleted, successful=deleted, failed=0)
+
+    def _bm25(self, query, query_properties=None, limit=10, **kwargs):
+        self._sleep()
+        hits = [
+            o
+            for o in self.objects
+            if any(query in str(o.properties.get(p)) for p in query_properties or [])
+        ]
+        return SimpleNamespace(objects=hits[:limit])
+
+    def _fetch_objects(
+        self, filters=None, limit=None, offset=0, include_vector=False, **kwargs
+    ):
+        self._sleep()
+        hits = [o for o in self.objects if _matches(o.properties, filters)][offset:]
+        hits = hits[:limit] if limit else hits
+        if include_vector:
+            hits = [self._returned(o, include_vector) for o in hits]
+        return SimpleNamespace(objects=hits)
+
+    def _over_all(self, total_count=False, filters=None, return_metrics=None, **kwargs):
+        self._sleep()
+        hits = [o for o in self.objects if _matches(o.properties, filters)]
+        properties = {}
+        if return_metrics is not None:
+            field = return_metrics.property_name
+            values = [
+                o.properties[field]
+                for o in hits
+                if isinstance(o.properties.get(field), (int, float))
+            ]
+            properties[field] = SimpleNamespace(
+                count=len(values),
+                maximum=max(values) if values else None,
+                minimum=min(values) if values else None,
+                mean=sum(values) / len(values) if values else None,
+                sum_=sum(values),
+            )
+        return SimpleNamespace(total_count=len(hits), properties=properties)
+
+    def _near_vector(self, near_vector, filters=None, limit=10, **kwargs):
+        self._sleep()
+        candidates = [
+            o
+            for o in self.objects
+            if o.vector is not None and _matches(o.properties, filters)
+        ]
+        if not candidates:
+            return SimpleNamespace(objects=[])
+        matrix = np.stack([o.vector for o in candidates])
+        query = np.asarray(near_vector, dtype=np.float32)
+        scores = (
+            matrix
+            @ query
+            / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        )
+        order = np.argsort(-scores)[:limit]
+        return SimpleNamespace(
+            objects=[
+                SimpleNamespace(
+                    properties=candidates[i].properties,
+                    metadata=SimpleNamespace(distance=float(1 - scores[i])),
+                )
+                for i in order
+            ]
+        )
+
+
+class _FakeClientBatch(_FakeBatch):
+    def __init__(self, client):
+        self.client = client
+
+    def add_object(
+        self, collection, properties, vector=None, uuid=None, tenant=None, **kwargs
+    ):
+        target = self.client._get(collection)
+        if tenant is not None:
+            target = target.with_tenant(tenant)
+        target.add(properties, vector, uuid=uuid)
+
+
+class FakeWeaviateClient:
+    """
+    Mimics the weaviate client returned by `get_client`. Collections are
+    shared across client instances so data survives `client.close()`.
+    """
+
+    def __init__(self, collections: dict, latency: float = 0.0):
+        self._collections = collections
+        self.latency = latency
+        self.collections = SimpleNamespace(
+            get=self._get,
+            list_all=lambda: dict(self._collections),
+            create=self._create,
+            delete=lambda name: self._collections.pop(name, None),
+            exists=lambda name: name in self._collections,
+        )
+        self.batch = SimpleNamespace(
+            fixed_size=lambda batch_size=100, **kwargs: _FakeClientBatch(self),
+            failed_objects=[],
+        )
+
+    def _create(self, name, properties=None, **kwargs):
+        if name in self._collections:
+            raise Exception(f"Collection {name} already exists")
+        self._collections[name] = FakeCollection(
+            name, latency=self.latency, properties=properties
+        )
+        return self._collections[name]
+
+    def _get(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, latency=self.latency)
+        return self._collections[name]
+
+    def is_ready(self):
+        return True
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class FakeTextract:
+    """
+    Mimics the boto3 Textract client: LINE blocks are the text layer of the
+    PDF pages, read from bytes or from the fake S3 bucket at `s3_root`.
+    Asynchronous jobs report IN_PROGRESS for `polls_in_progress` polls and
+    return `blocks_per_response` blocks per result page.
+    """
+
+    def __init__(
+        self,
+        s3_root: str,
+        latency: float = 0.0,
+        polls_in_progress: int = 1,
+        blocks_per_response: int = 1000,
+    ):
+        self.s3_root = s3_root
+        self.latency = latency
+        self.polls_in_progress = polls_in_progress
+        self.blocks_per_response = blocks_per_response
+        self.calls = defaultdict(int)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _blocks(self, data: bytes) -> list[dict]:
+        blocks = []
+        with fitz.open(stream=data, filetype="pdf") as pdf:
+            for page_num, page in enumerate(pdf):
+                lines = [l for l in page.get_text().splitlines() if l.strip()]
+                for line in lines or [f"scanned page {page_num + 1}"]:
+                    blocks.append(
+                        {"BlockType": "LINE", "Text": line, "Page": page_num + 1}
+                    )
+        return blocks
+
+    def _call(self, name):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def detect_document_text(self, Document):
+        self._call("detect_document_text")
+        return {"Blocks": self._blocks(Document["Bytes"])}
+
+    def start_document_text_detection(self, DocumentLocation):
+        self._call("start_document_text_detection")
+        key = DocumentLocation["S3Object"]["Name"]
+        with open(os.path.join(self.s3_root, key), "rb") as f:
+            blocks = self._blocks(f.read())
+        job_id = str(uuid4())
+        self._jobs[job_id] = {"blocks": blocks, "polls": self.polls_in_progress}
+        return {"JobId": job_id}
+
+    def get_document_text_detection(self, JobId, NextToken=None, **kwargs):
+        self._call("get_document_text_detection")
+        job = self._jobs[JobId]
+        if job["polls"]:
+            job["polls"] -= 1
+            return {"JobStatus": "IN_PROGRESS"}
+        start = int(NextToken or 0)
+        end = start + self.blocks_per_response
+        response = {"JobStatus": "SUCCEEDED", "Blocks": job["blocks"][start:end]}
+        if end < len(job["blocks"]):
+            response["NextToken"] = str(end)
+        return response
+
+
+class FakeS3:
+    """
+    Mimics the boto3 S3 client with a local directory as the bucket.
+    """
+
+    def __init__(self, root_dir: str, latency: float = 0.0):
+        self.root_dir = root_dir
+        self.latency = latency
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, key)
+
+    def download_file(self, bucket, key, local_path):
+        if self.latency:
+            time.sleep(self.latency)
+        shutil.copyfile(self._path(key), local_path)
+
+    def upload_fileobj(self, fileobj, bucket, key, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        os.makedirs(os.path.dirname(self._path(key)), exist_ok=True)
+        with open(self._path(key), "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.upload_fileobj(io.BytesIO(Body), Bucket, Key)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if not os.path.exists(self._path(Key)):
+            raise ClientError(
+                {"Error": {"Code": "NoSuchKey", "Message": Key}}, "GetObject"
+            )
+        with open(self._path(Key), "rb") as f:
+            return {"Body": io.BytesIO(f.read())}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        keys = []
+        for dirpath, _, files in os.walk(self.root_dir):
+            for file_name in files:
+                key = os.path.relpath(os.path.join(dirpath, file_name), self.root_dir)
+                if key.startswith(Prefix):
+                    keys.append({"Key": key})
+        return {"Contents": keys, "IsTruncated": False}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        for obj in Delete["Objects"]:
+            if os.path.exists(self._path(obj["Key"])):
+                os.remove(self._path(obj["Key"]))
+
+    def close(self):
+        pass
+
+
+class FakeSQS:
+    """
+    Mimics the boto3 SQS client. Sent messages are kept in `messages`,
+    a thread-safe queue consumers can take them from.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.messages = queue.Queue()
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds=0, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        if DelaySeconds:
+            timer = threading.Timer(DelaySeconds, self.messages.put, (MessageBody,))
+            timer.daemon = True
+            timer.start()
+        else:
+            self.messages.put(MessageBody)
+        return {"MessageId": str(self.messages.qsize())}
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def fake_backends(s3_root: str, latency: float = 0.0):
+    """
+    Patch the app to use the fakes: OpenAI embeddings, the Weaviate vector
+    store on a fake client, S3 downloads/uploads from `s3_root` and SQS.
+    Yields a namespace exposing the fakes for inspection.
+    """
+    openai_client = FakeOpenAI(latency=latency)
+    embedder = OpenAIEmbedder()
+    embedder._client = openai_client
+    collections = {}
+    s3 = FakeS3(s3_root, latency=latency)
+    sqs = FakeSQS(latency=latency)
+    store = WeaviateVectorStore()
+
+    def fake_boto3_client(service, *args, **kwargs):
+        if service == "s3":
+            return s3
+        if service == "sqs":
+            return sqs
+        raise NotImplementedError(f"No fake for boto3 client: {service}")
+
+    with patch("app.services.embedding.get_embedder", return_value=embedder), patch(
+        "app.services.weaviate_client.get_client",
+        side_effect=lambda: FakeWeaviateClient(collections, latency=latency),
+    ), patch("app.services.ingestion.get_vector_store", return_value=store), patch(
+        "app.services.ingestion.boto3.client", side_effect=fake_boto3_client
+    ), patch(
+        "app.services.ingestion.development", False
+    ):
+        yield SimpleNamespace(
+            openai=openai_client,
+            collections=collections,
+            s3=s3,
+            sqs=sqs,
+            store=store,
+        )
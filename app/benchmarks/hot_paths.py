@@ -0,0 +1,319 @@
+"""
+Offline benchmarks of the ingestion and query hot paths.
+
+Runs chunking, PDF parsing and OCR, JSON parsing, batch embedding and a full
+`process_document` over generated corpora of several sizes, with OpenAI,
+Weaviate and S3 replaced by local fakes. Records latency, throughput and
+peak Python memory per case and compares them with a stored baseline:
+
+    python -m app.benchmarks.hot_paths                      # check against baseline
+    python -m app.benchmarks.hot_paths --sizes small        # quick run
+    python -m app.benchmarks.hot_paths --update-baseline    # accept current numbers
+
+Exits with status 1 when a case is slower or uses more memory than the
+baseline allows.
+"""
+import os
+import tempfile
+
+# Never let a benchmark touch a real database
+WORK_DIR = tempfile.mkdtemp(prefix="rag-bench-")
+os.environ["PROD_DATABASE_URL"] = f"sqlite:///{WORK_DIR}/bench.db"
+
+import argparse  # noqa: E402
+import contextlib  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import shutil  # noqa: E402
+import statistics  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+
+from app.benchmarks.corpus import (  # noqa: E402
+    generate_json,
+    generate_pdf,
+    generate_text,
+)
+from app.benchmarks.fakes import fake_backends  # noqa: E402
+from app.core import models  # noqa: E402
+from app.core.database import Base, SessionLocal, engine  # noqa: E402
+from app.services import parser  # noqa: E402
+from app.services.artifacts import LocalArtifactStore  # noqa: E402
+from app.services.chunks import Chunk  # noqa: E402
+from app.services.import_text import chunk_by_tokens  # noqa: E402
+from app.services.ingestion import (  # noqa: E402
+    batch_embedding_for_chunks,
+    process_document,
+)
+from app.services.page_cache import PageTextCache  # noqa: E402
+from app.utils.json_helper import flatten_json  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SIZES = {
+    "small": {"words": 2_000, "pages": 2, "scanned_pages": 1, "records": 100},
+    "medium": {"words": 20_000, "pages": 10, "scanned_pages": 3, "records": 400},
+    "large": {"words": 200_000, "pages": 40, "scanned_pages": 6, "records": 5_000},
+}
+
+
+class Case:
+    """
+    One benchmark: `run` is timed, `items` is the unit count used for
+    throughput (words, pages, ...).
+    """
+
+    def __init__(self, name, unit, items, run):
+        self.name = name
+        self.unit = unit
+        self.items = items
+        self.run = run
+
+
+def fake_tesseract(image):
+    """
+    Stand-in for pytesseract when the tesseract binary is not installed:
+    keeps the page rendering and image decoding cost, skips recognition.
+    """
+    image.load()
+    return "scanned page text " * 50
+
+
+def ocr_with_cache(file_path, cache):
+    """
+    OCR a PDF with the given page cache (None: no cache).
+    """
+    with patch.object(parser, "get_page_cache", lambda: cache):
+        return parser.ocr_pdf(file_path)
+
+
+def build_cases(size_name: str, size: dict, fakes) -> list[Case]:
+    prefix = os.path.join(WORK_DIR, size_name)
+    os.makedirs(prefix, exist_ok=True)
+    text = generate_text(size["words"])
+    text_pdf = f"{prefix}/text.pdf"
+    scanned_pdf = f"{prefix}/scanned.pdf"
+    json_path = f"{prefix}/records.json"
+    generate_pdf(text_pdf, size["pages"])
+    generate_pdf(scanned_pdf, size["scanned_pages"], scanned=True)
+    generate_json(json_path, size["records"])
+    with open(json_path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    embed_chunks = chunk_by_tokens("bench.txt", text, max_tokens=150, max_chunks=None)
+    page_cache = PageTextCache(LocalArtifactStore(f"{prefix}/artifacts"))
+
+    # process_document reads the upload through the fake S3 bucket
+    s3_key = f"bench@example.com/{size_name}.txt"
+    os.makedirs(os.path.dirname(os.path.join(fakes.s3.root_dir, s3_key)), exist_ok=True)
+    with open(os.path.join(fakes.s3.root_dir, s3_key), "w", encoding="utf-8") as f:
+        f.write(text)
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name=f"{size_name}.txt",
+        file_path=s3_key,
+        user_email="bench@example.com",
+        status="processing",
+    )
+    db.add(task)
+    db.commit()
+    task_id = task.task_id
+    db.close()
+
+    return [
+        Case(
+            f"chunk_by_tokens[{size_name}]",
+            "words",
+            size["words"],
+            lambda: chunk_by_tokens("bench.txt", text, max_chunks=None),
+        ),
+        Case(
+            f"parse_pdf[{size_name}]",
+            "pages",
+            size["pages"],
+            lambda: parser.parse_pdf(text_pdf),
+        ),
+        Case(
+            f"ocr_pdf[{size_name}]",
+            "pages",
+            size["scanned_pages"],
+            lambda: ocr_with_cache(scanned_pdf, None),
+        ),
+        Case(
+            f"ocr_pdf_cached[{size_name}]",
+            "pages",
+            size["scanned_pages"],
+            lambda: ocr_with_cache(scanned_pdf, page_cache),
+        ),
+        Case(
+            f"parse_json[{size_name}]",
+            "records",
+            size["records"],
+            lambda: parser.parse_json(json_path),
+        ),
+        Case(
+            f"flatten_json[{size_name}]",
+            "records",
+            size["records"],
+            lambda: flatten_json(records),
+        ),
+        Case(
+            f"batch_embedding_for_chunks[{size_name}]",
+            "chunks",
+            len(embed_chunks),
+            lambda: batch_embedding_for_chunks(
+                [Chunk(c.document_name, c.chunk_index, c.text) for c in embed_chunks]
+            ),
+        ),
+        Case(
+            f"process_document[{size_name}]",
+            "words",
+            size["words"],
+            lambda: process_document(task_id),
+        ),
+    ]
+
+
+def measure(case: Case, repeat: int, min_seconds: float = 0.2) -> dict:
+    """
+    Time at least `repeat` runs, repeating fast cases until they have run
+    for `min_seconds` (at most 100 runs) so their median is stable.
+    """
+    case.run()  # warm-up
+    durations = []
+    while len(durations) < repeat or (
+        sum(durations) < min_seconds and len(durations) < 100
+    ):
+        start = time.perf_counter()
+        case.run()
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    case.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(durations)
+    return {
+        "median_s": round(median, 6),
+        "max_s": round(max(durations), 6),
+        "throughput": round(case.items / median, 2) if median else None,
+        "unit": f"{case.unit}/s",
+        "peak_mb": round(peak / 1024 / 1024, 3),
+    }
+
+
+def compare(
+    results: dict,
+    baseline: dict,
+    time_tolerance: float,
+    memory_tolerance: float,
+    time_slack: float = 0.005,
+):
+    """
+    Return a description of every case slower or heavier than the baseline.
+    Time gets `time_slack` seconds and memory 1 MB of absolute slack so
+    tiny cases do not flap.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["median_s"] > base["median_s"] * (1 + time_tolerance) + time_slack:
+            regressions.append(
+                f"{name}: median {result['median_s']:.4f}s vs "
+                f"baseline {base['median_s']:.4f}s"
+            )
+        if result["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance) + 1:
+            regressions.append(
+                f"{name}: peak {result['peak_mb']:.2f}MB vs "
+                f"baseline {base['peak_mb']:.2f}MB"
+            )
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    header = (
+        f"{'case':<40} {'median s':>10} {'baseline':>10} "
+        f"{'throughput':>22} {'peak MB':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        base = baseline.get(name, {}).get("median_s")
+        base_text = f"{base:.4f}" if base is not None else "-"
+        throughput = f"{r['throughput']} {r['unit']}"
+        print(
+            f"{name:<40} {r['median_s']:>10.4f} {base_text:>10} "
+            f"{throughput:>22} {r['peak_mb']:>9.2f}"
+        )
+
+
+def main():
+    parser_ = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser_.add_argument("--sizes", default="small,medium,large")
+    parser_.add_argument("--only", help="Run only cases whose name contains this")
+    parser_.add_argument("--repeat", type=int, default=3)
+    parser_.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="Seconds added to every fake OpenAI/Weaviate/S3 call",
+    )
+    parser_.add_argument("--baseline", default=BASELINE_PATH)
+    parser_.add_argument("--update-baseline", action="store_true")
+    parser_.add_argument("--time-tolerance", type=float, default=0.5)
+    parser_.add_argument("--memory-tolerance", type=float, default=0.2)
+    parser_.add_argument("--output", help="Write the results as JSON to this path")
+    args = parser_.parse_args()
+
+    Base.metadata.create_all(engine)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["cases"]
+
+    ocr_patch = (
+        patch("app.services.ocr.pytesseract.image_to_string", fake_tesseract)
+        if not shutil.which("tesseract")
+        else contextlib.nullcontext()
+    )
+    results = {}
+    s3_root = os.path.join(WORK_DIR, "s3")
+    with fake_backends(s3_root, latency=args.latency) as fakes, ocr_patch:
+        for size_name in args.sizes.split(","):
+            for case in build_cases(size_name, SIZES[size_name], fakes):
+                if args.only and args.only not in case.name:
+                    continue
+                results[case.name] = measure(case, args.repeat)
+
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {"machine": platform.platform(), "cases": baseline},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+"""
+Load test of the API with stub backends.
+
+Replays a mixed workload of document uploads, task status polling, queries
+and JSON aggregations from many concurrent clients and reports throughput
+and p50/p95/p99 latency per route. OpenAI, Weaviate, S3 and SQS are replaced
+by the local fakes, with `--latency` seconds added to every call:
+
+    python -m app.benchmarks.load_test                        # in-process over ASGI
+    python -m app.benchmarks.load_test --mode uvicorn         # real HTTP, local uvicorn
+    python -m app.benchmarks.load_test --base-url http://localhost:8000
+
+Uploads are queued on the fake SQS and processed by `--workers` threads
+running the worker's `handle_message`. With `--base-url` the running server
+and its real backends are used as they are.
+"""
+import os
+import tempfile
+
+# Never let a load test touch a real database
+WORK_DIR = tempfile.mkdtemp(prefix="rag-load-")
+os.environ["PROD_DATABASE_URL"] = f"sqlite:///{WORK_DIR}/load.db"
+# Measure the API itself rather than its admission limits
+os.environ.setdefault("RATE_LIMIT_ENABLED", "False")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+import queue  # noqa: E402
+import random  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from collections import defaultdict  # noqa: E402
+from contextlib import ExitStack  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app.benchmarks.corpus import VOCABULARY, generate_records, generate_text  # noqa
+from app.benchmarks.fakes import fake_backends  # noqa: E402
+from app.core.database import Base, engine  # noqa: E402
+from app.services.job_queue import SQSJobQueue  # noqa: E402
+
+DEFAULT_WEIGHTS = "upload=1,status=4,query=4,aggregate=1"
+USERS = [f"load{i}@example.com" for i in range(4)]
+
+
+class LoadState:
+    """
+    Documents available to the workload and the latencies recorded so far.
+    """
+
+    def __init__(self):
+        self.task_ids = []
+        self.query_task_ids = []
+        self.json_task_id = None
+        self.uploads = 0
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+
+async def timed(state: LoadState, route: str, request):
+    start = time.perf_counter()
+    try:
+        response = await request
+        ok = response.status_code < 400 and "error" not in response.text[:200]
+    except httpx.HTTPError:
+        response, ok = None, False
+    state.record(route, time.perf_counter() - start, ok)
+    return response
+
+
+async def upload(client, state: LoadState, rng: random.Random, words=300):
+    state.uploads += 1
+    response = await timed(
+        state,
+        "POST /upload-document",
+        client.post(
+            "/upload-document",
+            files={
+                "file": (
+                    f"load-{state.uploads}-{rng.random():.6f}.txt",
+                    generate_text(words, seed=state.uploads).encode(),
+                    "text/plain",
+                )
+            },
+            data={"user_email": rng.choice(USERS)},
+        ),
+    )
+    if response is not None and "task_id" in response.text:
+        state.task_ids.append(response.json()["task_id"])
+
+
+async def status(client, state: LoadState, rng: random.Random):
+    task_id = rng.choice(state.task_ids)
+    await timed(
+        state, "GET /task-status/{task_id}", client.get(f"/task-status/{task_id}")
+    )
+
+
+async def query(client, state: LoadState, rng: random.Random):
+    question = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 8)))
+    await timed(
+        state,
+        "POST /document/query",
+        client.post(
+            "/document/query",
+            json={
+                "question": question,
+                "task_id": str(rng.choice(state.query_task_ids)),
+                "limit": 3,
+            },
+        ),
+    )
+
+
+async def aggregate(client, state: LoadState, rng: random.Random):
+    await timed(
+        state,
+        "POST /users/task/json-aggregator",
+        client.post(
+            "/users/task/json-aggregator",
+            json={
+                "task_id": str(state.json_task_id),
+                "field": rng.choice(["age", "purchases_last_6_months"]),
+            },
+        ),
+    )
+
+
+OPERATIONS = {
+    "upload": upload,
+    "status": status,
+    "query": query,
+    "aggregate": aggregate,
+}
+
+
+async def wait_until_completed(client, task_ids, timeout: float):
+    deadline = time.perf_counter() + timeout
+    pending = set(task_ids)
+    while pending and time.perf_counter() < deadline:
+        for task_id in list(pending):
+            response = await client.get(f"/task-status/{task_id}")
+            task_status = response.json().get("status")
+            if task_status == "failed":
+                raise RuntimeError(f"Seed document {task_id} failed to process")
+            if task_status == "completed":
+                pending.discard(task_id)
+        await asyncio.sleep(0.1)
+    if pending:
+        raise RuntimeError(f"Seed documents not processed in time: {sorted(pending)}")
+
+
+async def seed(client, state: LoadState, documents: int, words: int, timeout: float):
+    """
+    Upload the documents queried and aggregated by the workload and wait
+    for them to be processed.
+    """
+    rng = random.Random(0)
+    seed_state = LoadState()
+    for _ in range(documents):
+        await upload(client, seed_state, rng, words=words)
+    response = await client.post(
+        "/upload-document",
+        files={
+            "file": (
+                "load-records.json",
+                json.dumps(generate_records(200)).encode(),
+                "application/json",
+            )
+        },
+        data={"user_email": USERS[0], "is_structured_json": "true"},
+    )
+    json_task_id = response.json()["task_id"]
+    task_ids = seed_state.task_ids + [json_task_id]
+    if len(task_ids) != documents + 1:
+        raise RuntimeError("Seed uploads failed")
+    await wait_until_completed(client, task_ids, timeout)
+    state.task_ids.extend(task_ids)
+    state.query_task_ids.extend(seed_state.task_ids)
+    state.json_task_id = json_task_id
+
+
+async def client_loop(client, state, rng, operations, weights, deadline, budget):
+    while time.perf_counter() < deadline and budget["left"] > 0:
+        budget["left"] -= 1
+        operation = rng.choices(operations, weights)[0]
+        await OPERATIONS[operation](client, state, rng)
+
+
+async def run_workload(base_url: str, transport, args) -> tuple[LoadState, float]:
+    weights = dict(
+        (name, float(weight))
+        for name, weight in (item.split("=") for item in args.weights.split(","))
+    )
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations in --weights: {sorted(unknown)}")
+
+    state = LoadState()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, transport=transport, limits=limits, timeout=60
+    ) as client:
+        await seed(client, state, args.documents, args.words, args.seed_timeout)
+        budget = {"left": args.requests or float("inf")}
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(
+                client_loop(
+                    client,
+                    state,
+                    random.Random(args.seed + i),
+                    list(weights),
+                    list(weights.values()),
+                    deadline,
+                    budget,
+                )
+                for i in range(args.concurrency)
+            )
+        )
+        elapsed = time.perf_counter() - start
+    return state, elapsed
+
+
+def start_workers(messages: queue.Queue, count: int, stop: threading.Event):
+    """
+    Consume the fake SQS queue like the worker Lambda does.
+    """
+    from app.worker import handle_message
+
+    def consume():
+        while not stop.is_set():
+            try:
+                body = messages.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                handle_message(json.loads(body))
+            except Exception as e:
+                print(f"Worker failed: {e}")
+
+    threads = [
+        threading.Thread(target=consume, name=f"load-worker-{i}", daemon=True)
+        for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def start_uvicorn(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"uvicorn failed to start on port {port}")
+        time.sleep(0.05)
+    return server, thread
+
+
+def summarize(state: LoadState, elapsed: float) -> dict:
+    summary = {}
+    for route, latencies in sorted(state.latencies.items()):
+        ms = np.asarray(latencies) * 1000
+        summary[route] = {
+            "requests": len(latencies),
+            "errors": state.errors[route],
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        }
+    total = sum(len(latencies) for latencies in state.latencies.values())
+    summary["total"] = {
+        "requests": total,
+        "errors": sum(state.errors.values()),
+        "rps": round(total / elapsed, 2) if elapsed else None,
+    }
+    return summary
+
+
+def print_summary(summary: dict):
+    header = (
+        f"{'route':<36} {'requests':>9} {'errors':>7} {'req/s':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for route, r in summary.items():
+        if route == "total":
+            continue
+        print(
+            f"{route:<36} {r['requests']:>9} {r['errors']:>7} {r['rps']:>9.2f} "
+            f"{r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+        )
+    total = summary["total"]
+    print("-" * len(header))
+    print(
+        f"{'total':<36} {total['requests']:>9} {total['errors']:>7} "
+        f"{total['rps']:>9.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument(
+        "--base-url", help="Load an already running server instead (no fakes)"
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.02,
+        help="Seconds added to every fake OpenAI/Weaviate/S3/SQS call",
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--seed-timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    if args.base_url:
+        state, elapsed = asyncio.run(run_workload(args.base_url, None, args))
+    else:
+        from app.main import app
+
+        Base.metadata.create_all(engine)
+        stop = threading.Event()
+        with ExitStack() as stack:
+            fakes = stack.enter_context(
+                fake_backends(os.path.join(WORK_DIR, "s3"), latency=args.latency)
+            )
+            for target, value in (
+                ("app.main.get_job_queue", lambda: SQSJobQueue()),
+                ("app.main.get_vector_store", lambda: fakes.store),
+                ("app.utils.upload_files_to_s3.USE_S3", True),
+            ):
+                stack.enter_context(patch(target, value))
+            # boto3.client itself is patched by fake_backends for S3 and SQS
+            start_workers(fakes.sqs.messages, args.workers, stop)
+
+            if args.mode == "uvicorn":
+                server, thread = start_uvicorn(app, args.port)
+                try:
+                    state, elapsed = asyncio.run(
+                        run_workload(f"http://127.0.0.1:{args.port}", None, args)
+                    )
+                finally:
+                    server.should_exit = True
+                    thread.join()
+            else:
+                transport = httpx.ASGITransport(app=app)
+                state, elapsed = asyncio.run(
+                    run_workload("http://loadtest", transport, args)
+                )
+            stop.set()
+
+    summary = summarize(state, elapsed)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# Every test runs against its own SQLite database and upload directory, so
+# the suite needs no migrated ./app.db and leaves nothing in the checkout
+import pytest
+from sqlalchemy import create_engine
+
+from app.core import database
+from app.core import models  # noqa: F401  (registers the tables)
+
+
+@pytest.fixture(autouse=True)
+def test_database(monkeypatch, tmp_path_factory):
+    """
+    Bind SessionLocal, and with it get_db, to a new database with every
+    table created, and keep local uploads in a temporary directory.
+    """
+    root = tmp_path_factory.mktemp("app")
+    engine = create_engine(
+        f"sqlite:///{root / 'app.db'}", connect_args={"check_same_thread": False}
+    )
+    database.Base.metadata.create_all(engine)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr("app.services.health.engine", engine)
+    monkeypatch.setattr(
+        "app.utils.upload_files_to_s3.UPLOAD_DIR", str(root / "uploaded_files")
+    )
+    original_bind = database.SessionLocal.kw["bind"]
+    database.SessionLocal.configure(bind=engine)
+    yield engine
+    database.SessionLocal.configure(bind=original_bind)
+    engine.dispose()
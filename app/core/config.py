@@ -18,6 +18,167 @@ MAX_CHUNKS_PER_DOCUMENT = 200
 USE_S3 = os.environ.get("USE_S3", "False").lower() == "true"
 BUCKET_NAME = os.environ.get("BUCKET_NAME", "rag_backend")
 FILE_SIZE_LIMIT = 10 * 1024 * 1024  # 10MB
+# Directory of uploaded files when USE_S3 is off, one subdirectory per user
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploaded_files")
 development = os.environ.get("DEVELOPMENT", "False").lower() == "true"
 SQS_QUEUE_URL = os.environ.get("SQS_QUEUE_URL")
 ALLOWED_ORIGINS = os.environ.get("ALLOWED_ORIGINS", "*")
+
+# Vector store backend: "weaviate" (Weaviate Cloud) or "local" (in-process,
+# memory-mapped NumPy matrices for dev, tests and small-tenant deployments)
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "weaviate").lower()
+LOCAL_VECTOR_STORE_DIR = os.environ.get(
+    "LOCAL_VECTOR_STORE_DIR", "/tmp/rag_vector_store"
+)
+# Documents with at least this many chunks get an IVF index for approximate search
+LOCAL_ANN_THRESHOLD = int(os.environ.get("LOCAL_ANN_THRESHOLD", "50000"))
+LOCAL_ANN_NPROBE = int(os.environ.get("LOCAL_ANN_NPROBE", "8"))
+
+# Embedding backend: "openai" or "local" (CPU model from LOCAL_EMBEDDING_MODEL_PATH,
+# falling back to a deterministic feature-hashing vectorizer)
+EMBEDDING_BACKEND = os.environ.get(
+    "EMBEDDING_BACKEND", "local" if use_local else "openai"
+).lower()
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+# Output dimensions; text-embedding-3 models shorten their vectors natively
+EMBEDDING_DIMENSIONS = int(os.environ.get("EMBEDDING_DIMENSIONS", "1536"))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", "4"))
+LOCAL_EMBEDDING_MODEL_PATH = os.environ.get("LOCAL_EMBEDDING_MODEL_PATH")
+
+# In-process cache of /document/query answers
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get("QUERY_CACHE_TTL_SECONDS", "300"))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", "1024"))
+# Concurrent near_vector searches issued for one batch of questions
+QUERY_SEARCH_CONCURRENCY = int(os.environ.get("QUERY_SEARCH_CONCURRENCY", "8"))
+MAX_BATCH_QUESTIONS = int(os.environ.get("MAX_BATCH_QUESTIONS", "50"))
+# Documents whose chunks /users/query searches, picked by summary vector
+LIBRARY_CANDIDATE_DOCUMENTS = int(os.environ.get("LIBRARY_CANDIDATE_DOCUMENTS", "10"))
+# Most recently completed documents of a user whose summary vectors are
+# compared per query
+LIBRARY_SCANNED_DOCUMENTS = int(os.environ.get("LIBRARY_SCANNED_DOCUMENTS", "1000"))
+
+# Weaviate vector index compression for DocumentChunk: "none", "pq", "bq" or "sq"
+VECTOR_COMPRESSION = os.environ.get("VECTOR_COMPRESSION", "none").lower()
+# PQ segments (0 lets Weaviate pick) and candidates rescored with full vectors
+VECTOR_PQ_SEGMENTS = int(os.environ.get("VECTOR_PQ_SEGMENTS", "0"))
+VECTOR_RESCORE_LIMIT = int(os.environ.get("VECTOR_RESCORE_LIMIT", "100"))
+
+# Multi-tenancy: keep chunks in the TenantDocumentChunk collection with one
+# tenant (and vector index) per user instead of one global DocumentChunk index.
+# Tenants of users idle for TENANT_IDLE_SECONDS are moved to TENANT_IDLE_STATUS:
+# "INACTIVE" (on disk) or "OFFLOADED" (cloud storage, needs the offload module)
+WEAVIATE_MULTI_TENANCY = (
+    os.environ.get("WEAVIATE_MULTI_TENANCY", "False").lower() == "true"
+)
+TENANT_IDLE_SECONDS = int(os.environ.get("TENANT_IDLE_SECONDS", str(7 * 24 * 3600)))
+TENANT_IDLE_STATUS = os.environ.get("TENANT_IDLE_STATUS", "INACTIVE").upper()
+# Queries record a task's last use at most this often
+TENANT_TOUCH_SECONDS = int(os.environ.get("TENANT_TOUCH_SECONDS", "300"))
+
+# Weaviate batch writes: "dynamic" (batch size follows server load), "fixed"
+# (WEAVIATE_BATCH_SIZE objects, WEAVIATE_BATCH_CONCURRENCY requests in flight)
+# or "rate_limit" (WEAVIATE_BATCH_RATE_LIMIT objects per minute). Failed objects
+# are retried WEAVIATE_BATCH_RETRIES times before the write fails
+WEAVIATE_BATCH_MODE = os.environ.get("WEAVIATE_BATCH_MODE", "fixed").lower()
+WEAVIATE_BATCH_SIZE = int(os.environ.get("WEAVIATE_BATCH_SIZE", "200"))
+WEAVIATE_BATCH_CONCURRENCY = int(os.environ.get("WEAVIATE_BATCH_CONCURRENCY", "4"))
+WEAVIATE_BATCH_RATE_LIMIT = int(os.environ.get("WEAVIATE_BATCH_RATE_LIMIT", "6000"))
+WEAVIATE_BATCH_RETRIES = int(os.environ.get("WEAVIATE_BATCH_RETRIES", "3"))
+
+# Structured JSON uploads are stored as datasets whose field types are
+# inferred from up to DATASET_SCHEMA_SAMPLE_SIZE records spread over the file
+DATASET_SCHEMA_SAMPLE_SIZE = int(os.environ.get("DATASET_SCHEMA_SAMPLE_SIZE", "1000"))
+
+# Opt-in request profiling: a request is profiled when it sends PROFILING_HEADER
+# or is picked by PROFILING_SAMPLE_RATE (0.0 - 1.0)
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "False").lower() == "true"
+PROFILING_HEADER = os.environ.get("PROFILING_HEADER", "X-Profile")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_INTERVAL_SECONDS = float(
+    os.environ.get("PROFILING_INTERVAL_SECONDS", "0.005")
+)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/rag_profiles")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+
+# Document processing queue: "sqs" (production) or "local" (in-process worker
+# pool, the default in development). LOCAL_JOB_QUEUE_PATH persists queued jobs
+# in SQLite so they survive a restart; empty keeps them in memory only
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "local" if development else "sqs").lower()
+LOCAL_JOB_WORKERS = int(os.environ.get("LOCAL_JOB_WORKERS", "2"))
+LOCAL_JOB_QUEUE_PATH = os.environ.get("LOCAL_JOB_QUEUE_PATH", "")
+
+# Fair scheduling: uploads are routed by estimated processing cost (seconds)
+# to the "small" or "large" lane, each with its own queue and workers, and a
+# user runs at most USER_MAX_*_JOBS jobs per lane at once
+SMALL_JOB_MAX_COST = float(os.environ.get("SMALL_JOB_MAX_COST", "30"))
+SQS_LARGE_QUEUE_URL = os.environ.get("SQS_LARGE_QUEUE_URL", SQS_QUEUE_URL)
+LOCAL_LARGE_JOB_WORKERS = int(os.environ.get("LOCAL_LARGE_JOB_WORKERS", "1"))
+USER_MAX_SMALL_JOBS = int(os.environ.get("USER_MAX_SMALL_JOBS", "4"))
+USER_MAX_LARGE_JOBS = int(os.environ.get("USER_MAX_LARGE_JOBS", "1"))
+JOB_RETRY_DELAY_SECONDS = int(os.environ.get("JOB_RETRY_DELAY_SECONDS", "30"))
+# Jobs started longer ago than this are assumed dead and stop counting
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "900"))
+# A worker holds its task for INGEST_LEASE_SECONDS, renewed between stages;
+# other workers wait for it, or for the lease to expire if the worker died
+INGEST_LEASE_SECONDS = int(os.environ.get("INGEST_LEASE_SECONDS", "900"))
+
+# PDFs with more than SHARD_PAGES pages (0 disables) are split into page-range
+# shards, each processed by its own worker job and keeping up to
+# MAX_CHUNKS_PER_SHARD chunks instead of MAX_CHUNKS_PER_DOCUMENT overall
+SHARD_PAGES = int(os.environ.get("SHARD_PAGES", "25"))
+MAX_CHUNKS_PER_SHARD = int(
+    os.environ.get("MAX_CHUNKS_PER_SHARD", str(MAX_CHUNKS_PER_DOCUMENT))
+)
+
+# Checkpoints of ingestion stages (text, chunks, embeddings) so retries resume:
+# "s3" (under ARTIFACT_PREFIX in BUCKET_NAME) or "local" (default in development)
+CHECKPOINTS_ENABLED = os.environ.get("CHECKPOINTS_ENABLED", "True").lower() == "true"
+ARTIFACT_STORE = os.environ.get(
+    "ARTIFACT_STORE", "local" if development else "s3"
+).lower()
+ARTIFACT_PREFIX = os.environ.get("ARTIFACT_PREFIX", "artifacts/")
+LOCAL_ARTIFACT_DIR = os.environ.get("LOCAL_ARTIFACT_DIR", "/tmp/rag_artifacts")
+# A worker with less time left than this re-queues the job instead of
+# starting the next stage
+DEADLINE_MARGIN_SECONDS = int(os.environ.get("DEADLINE_MARGIN_SECONDS", "60"))
+
+# OCR text cache keyed by page content hash and OCR engine version, kept in
+# the artifact store under OCR_CACHE_PREFIX and bounded to OCR_CACHE_MAX_MB
+OCR_CACHE_ENABLED = os.environ.get("OCR_CACHE_ENABLED", "True").lower() == "true"
+OCR_CACHE_PREFIX = os.environ.get("OCR_CACHE_PREFIX", "ocr-cache/")
+OCR_CACHE_MAX_MB = int(os.environ.get("OCR_CACHE_MAX_MB", "1024"))
+# OCR engine for scanned PDFs: "tesseract" (in the worker) or "textract" (AWS).
+# Textract reads whole uploads of at least TEXTRACT_ASYNC_MIN_PAGES pages from
+# S3 with an asynchronous job, polled with backoff from TEXTRACT_POLL_SECONDS up
+# to TEXTRACT_MAX_POLL_SECONDS; other pages are sent one per request,
+# TEXTRACT_CONCURRENCY at once
+OCR_ENGINE = os.environ.get("OCR_ENGINE", "tesseract").lower()
+TEXTRACT_ASYNC_MIN_PAGES = int(os.environ.get("TEXTRACT_ASYNC_MIN_PAGES", "5"))
+TEXTRACT_CONCURRENCY = int(os.environ.get("TEXTRACT_CONCURRENCY", "8"))
+TEXTRACT_POLL_SECONDS = float(os.environ.get("TEXTRACT_POLL_SECONDS", "1"))
+TEXTRACT_MAX_POLL_SECONDS = float(os.environ.get("TEXTRACT_MAX_POLL_SECONDS", "10"))
+TEXTRACT_TIMEOUT_SECONDS = int(os.environ.get("TEXTRACT_TIMEOUT_SECONDS", "600"))
+
+# Admission control: token buckets of requests per minute per user and across
+# all users, kept per process ("memory") or shared by all instances through
+# DATABASE_URL ("sql"). Refused requests get 429, queries beyond
+# MAX_INFLIGHT_QUERIES in flight get 503, both with Retry-After
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "True").lower() == "true"
+RATE_LIMIT_STORE = os.environ.get("RATE_LIMIT_STORE", "memory").lower()
+UPLOAD_RATE_PER_USER = int(os.environ.get("UPLOAD_RATE_PER_USER", "10"))
+UPLOAD_RATE_GLOBAL = int(os.environ.get("UPLOAD_RATE_GLOBAL", "200"))
+QUERY_RATE_PER_USER = int(os.environ.get("QUERY_RATE_PER_USER", "60"))
+QUERY_RATE_GLOBAL = int(os.environ.get("QUERY_RATE_GLOBAL", "1200"))
+MAX_INFLIGHT_QUERIES = int(os.environ.get("MAX_INFLIGHT_QUERIES", "32"))
+RATE_LIMIT_RETRY_AFTER_SECONDS = int(
+    os.environ.get("RATE_LIMIT_RETRY_AFTER_SECONDS", "1")
+)
+
+# Startup warm-up (STARTUP_WARMUP) builds the API's clients and checks the
+# vector store schema once. /health serves the dependency status refreshed in
+# the background every HEALTH_REFRESH_SECONDS, and checks inline when the
+# status is older than HEALTH_MAX_AGE_SECONDS (e.g. a Lambda that was frozen)
+STARTUP_WARMUP = os.environ.get("STARTUP_WARMUP", "True").lower() == "true"
+HEALTH_REFRESH_SECONDS = float(os.environ.get("HEALTH_REFRESH_SECONDS", "15"))
+HEALTH_MAX_AGE_SECONDS = float(os.environ.get("HEALTH_MAX_AGE_SECONDS", "60"))
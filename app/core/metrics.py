@@ -0,0 +1,358 @@
+# Prometheus-style metrics and per-task stage timing
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = self._new_child()
+            return self._children[key]
+
+    def _default(self):
+        # Metrics without labels are used directly
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, key, child):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            lines.extend(self._samples(key, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _samples(self, key, child):
+        labels = _format_labels(self.labelnames, key)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _samples(self, key, child):
+        lines = []
+        cumulative = 0
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(
+                self.labelnames, key, [("le", _format_value(bound))]
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "rag_http_request_duration_seconds",
+    "API request latency by route.",
+    ("method", "route", "status"),
+)
+INGESTION_STAGE_DURATION = REGISTRY.histogram(
+    "rag_ingestion_stage_duration_seconds",
+    "Duration of each process_document stage.",
+    ("stage",),
+)
+TASK_STAGE_DURATION = REGISTRY.histogram(
+    "rag_task_stage_duration_seconds",
+    "Time completed ingestion tasks spent per stage in any worker process, "
+    "read from their persisted processing_metrics.",
+    ("stage",),
+)
+INGESTION_DOCUMENTS = REGISTRY.counter(
+    "rag_ingestion_documents_total",
+    "Documents processed by outcome.",
+    ("status",),
+)
+EXTERNAL_CALL_DURATION = REGISTRY.histogram(
+    "rag_external_call_duration_seconds",
+    "Duration of calls to external services.",
+    ("service", "operation", "outcome"),
+)
+JOB_WAIT_DURATION = REGISTRY.histogram(
+    "rag_job_wait_seconds",
+    "Time ingestion jobs waited between upload and start, by lane.",
+    ("lane",),
+)
+JOB_QUEUE_DEPTH = REGISTRY.gauge(
+    "rag_job_queue_depth",
+    "Ingestion jobs queued and not yet started, by lane.",
+    ("lane",),
+)
+JOB_QUEUE_OLDEST_AGE = REGISTRY.gauge(
+    "rag_job_queue_oldest_age_seconds",
+    "Age of the oldest queued ingestion job, by lane.",
+    ("lane",),
+)
+VECTOR_STORE_OBJECTS = REGISTRY.counter(
+    "rag_vector_store_objects_total",
+    "Objects batch-written to Weaviate, by collection and outcome.",
+    ("collection", "outcome"),
+)
+
+
+class StageTimer:
+    """
+    Collects the stage durations and counters (pages, chunks, bytes)
+    of one document ingestion, to be persisted on the task record.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+        # Stages also run on the OCR and embedding thread pools
+        self._lock = threading.Lock()
+
+    def add_duration(self, stage: str, seconds: float):
+        with self._lock:
+            self.stages[stage] = round(self.stages.get(stage, 0.0) + seconds, 6)
+
+    def count(self, name: str, value: int):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {"stages": dict(self.stages), "counts": dict(self.counts)}
+
+
+_current_timer = contextvars.ContextVar("current_stage_timer", default=None)
+
+
+@contextmanager
+def collect_stages(timer: StageTimer = None):
+    """
+    Make a StageTimer current, so `track_stage` and `record_count`
+    calls anywhere below (parsers, OCR, ...) are attributed to it.
+    """
+    timer = timer or StageTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def in_current_context(fn):
+    """
+    Wrap `fn` to run in a copy of the caller's context, so calls made on a
+    thread pool are attributed to the caller's StageTimer. Every call gets
+    its own copy, as one context cannot be entered by two threads at once.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+@contextmanager
+def track_stage(stage: str):
+    """
+    Time an ingestion stage into the stage histogram and the current
+    StageTimer, if any.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        INGESTION_STAGE_DURATION.labels(stage=stage).observe(duration)
+        timer = _current_timer.get()
+        if timer is not None:
+            timer.add_duration(stage, duration)
+
+
+def record_count(name: str, value: int):
+    """
+    Add to a counter (pages, chunks, bytes) of the current StageTimer.
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.count(name, value)
+
+
+@contextmanager
+def track_external_call(service: str, operation: str):
+    """
+    Time a call to an external service (OpenAI, Weaviate, S3, SQS, ...),
+    labelled with whether it raised.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_DURATION.labels(
+            service=service, operation=operation, outcome=outcome
+        ).observe(time.perf_counter() - start)
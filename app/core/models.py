@@ -1,4 +1,12 @@
-from sqlalchemy import Column, String, DateTime, Integer
+from sqlalchemy import (
+    Column,
+    String,
+    DateTime,
+    Integer,
+    Float,
+    ForeignKey,
+    LargeBinary,
+)
 from .database import Base
 import datetime
 
@@ -15,3 +23,61 @@ class TaskStatus(Base):
     additional_info = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.now(datetime.timezone.utc))
     completed_at = Column(DateTime, nullable=True)
+    # JSON with per-stage durations and page/chunk/byte counts of the last run
+    processing_metrics = Column(String, nullable=True)
+    # Scheduling: cost-based lane, and when the job was queued and picked up
+    lane = Column(String, nullable=True)
+    estimated_cost = Column(Float, nullable=True)
+    queued_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    # Last query of the document, recorded every TENANT_TOUCH_SECONDS at most,
+    # so idle tenants can be offloaded
+    last_queried_at = Column(DateTime, nullable=True)
+    # Normalized centroid of the chunk embeddings (float32), used to pick the
+    # documents /users/query searches
+    summary_vector = Column(LargeBinary, nullable=True)
+    # Bumped by every upload that queues a new job; jobs of older versions
+    # stop. Identical uploads (same content_hash) of a task in flight join
+    # its job instead of queueing another
+    ingest_version = Column(Integer, default=0)
+    content_hash = Column(String, nullable=True)
+    # The worker running the task and until when it holds it, renewed
+    # between stages
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+
+
+class DocumentShard(Base):
+    """
+    A page range of a large document, processed by its own worker job.
+    The task completes when all of its shards have.
+    """
+
+    __tablename__ = "document_shard"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    task_id = Column(Integer, ForeignKey("task_status.task_id"), index=True)
+    shard_index = Column(Integer)
+    page_start = Column(Integer)
+    page_end = Column(Integer)
+    status = Column(String)
+    chunk_count = Column(Integer, nullable=True)
+    error_message = Column(String, nullable=True)
+    processing_metrics = Column(String, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    # Sum of the normalized chunk embeddings (float32), combined into the
+    # task's summary vector when the last shard completes
+    summary_vector = Column(LargeBinary, nullable=True)
+
+
+class RateLimitBucket(Base):
+    """
+    A token bucket of the "sql" rate limit store.
+    """
+
+    __tablename__ = "rate_limit_bucket"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float)
+    # Unix time of the last refill
+    updated_at = Column(Float)
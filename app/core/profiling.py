@@ -0,0 +1,128 @@
+# Statistical (sampling) profiler for individual API requests
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import fastapi
+import starlette
+
+# Stacks without a frame from these directories are idle threads (event loop
+# waiting in select, threadpool workers waiting for work) and are skipped
+_BUSY_DIRS = (
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep,
+    os.path.dirname(fastapi.__file__) + os.sep,
+    os.path.dirname(starlette.__file__) + os.sep,
+)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all busy threads every `interval` seconds
+    until stopped.
+
+    Sampling every thread (rather than profiling one) is what captures sync
+    route handlers, which FastAPI runs on threadpool workers, and the
+    embedding/search thread pools they fan out to. Samples are wall-clock,
+    so time blocked on network calls shows up. Other requests handled at
+    the same time are sampled too; each stack starts with its thread name.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="request-profiler", daemon=True
+        )
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                busy = False
+                while frame is not None:
+                    code = frame.f_code
+                    busy = busy or code.co_filename.startswith(_BUSY_DIRS)
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}"
+                        f":{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                if busy:
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """
+        Stacks in the collapsed format read by flamegraph.pl and speedscope.
+        """
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.stacks.most_common()
+        )
+
+    def top_functions(self, limit: int = 20) -> list[dict]:
+        """
+        Functions by self time (innermost frame) and total time (anywhere
+        on the stack), as a share of all busy samples.
+        """
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        busy = sum(self.stacks.values()) or 1
+        return [
+            {
+                "function": function,
+                "self": round(count / busy, 4),
+                "total": round(total[function] / busy, 4),
+            }
+            for function, count in own.most_common(limit)
+        ]
+
+
+def save_profile(sampler: StackSampler, profile_dir: str, name: str, max_files: int):
+    """
+    Write the folded stacks to `profile_dir`, deleting the oldest profiles
+    so at most `max_files` are kept. Returns the file name.
+    """
+    os.makedirs(profile_dir, exist_ok=True)
+    file_name = f"{time.strftime('%Y%m%dT%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}.folded"
+    with open(os.path.join(profile_dir, file_name), "w", encoding="utf-8") as f:
+        f.write(sampler.folded())
+
+    profiles = sorted(
+        (
+            os.path.join(profile_dir, p)
+            for p in os.listdir(profile_dir)
+            if p.endswith(".folded")
+        ),
+        key=os.path.getmtime,
+    )
+    for old in profiles[: max(0, len(profiles) - max_files)]:
+        os.remove(old)
+    return file_name
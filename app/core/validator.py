@@ -1,5 +1,7 @@
 from typing import Any, List, Optional, Union
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
+
+from .config import LIBRARY_CANDIDATE_DOCUMENTS, MAX_BATCH_QUESTIONS
 
 
 class TaskStatusCreate(BaseModel):
@@ -10,6 +12,20 @@ class TaskStatusCreate(BaseModel):
 class QuestionRequest(BaseModel):
     question: str
     task_id: str
+    limit: int = Field(3, ge=1, le=50)
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_QUESTIONS)
+    task_id: str
+    limit: int = Field(3, ge=1, le=50)
+
+
+class LibraryQuestionRequest(BaseModel):
+    question: str
+    user_email: EmailStr
+    limit: int = Field(3, ge=1, le=50)
+    documents: int = Field(LIBRARY_CANDIDATE_DOCUMENTS, ge=1, le=200)
 
 
 class AggregationResult(BaseModel):
@@ -25,7 +41,8 @@ class AggregationResult(BaseModel):
 class AggregationResponse(BaseModel):
     task_id: str
     field: str
-    output: AggregationResult
+    output: Optional[AggregationResult] = None
+    error: Optional[str] = None
 
 
 class AggregationRequest(BaseModel):
@@ -1,34 +1,110 @@
 from fastapi import FastAPI, UploadFile, File, Depends, Form, Query
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
+import datetime
+import threading
 from mangum import Mangum
-from .services.ingestion import process_document
-from .services.weaviate_client import get_client, create_schema
+from .services.datasets import numeric_fields
+from .services.health import health_monitor, warm_up
+from .services.job_queue import get_job_queue
+from .services.library import search_library
+from .services.rate_limit import admit, query_slot
+from .services.scheduling import (
+    estimate_job_cost,
+    job_in_flight,
+    lane_for_cost,
+    queue_stats,
+    stage_metrics_export,
+    upload_fingerprint,
+)
+from .services.tenants import touch_task
+from .services.vector_store import get_vector_store
 from sqlalchemy.orm import Session
+from .core.config import STARTUP_WARMUP
 from .core.database import engine, get_db
 from .core import models
 from .core.validator import (
     AggregationRequest,
     AggregationResult,
+    BatchQuestionRequest,
+    LibraryQuestionRequest,
     TaskStatusCreate,
     QuestionRequest,
     AggregationResponse,
 )
-from .core.config import development, SQS_QUEUE_URL
 from .utils.upload_files_to_s3 import upload_file_to_s3
 from .services.embedding import generate_embedding
-from .middleware import add_cors_middleware
-from weaviate.classes.query import Filter
-import weaviate.classes as wvc
+from .services.query_cache import query_cache
+from .core.metrics import JOB_QUEUE_DEPTH, JOB_QUEUE_OLDEST_AGE, REGISTRY
+from .middleware import (
+    add_cors_middleware,
+    add_metrics_middleware,
+    add_profiling_middleware,
+    add_rate_limit_handler,
+)
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_up():
+    """
+    Connect the vector store client shared by every request, warm up the
+    clients, check the schema and start refreshing the dependency health.
+    Runs once per process; later calls return at once.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        store = get_vector_store()
+        try:
+            store.connect()
+        except Exception as e:
+            print(f"Connecting to {store.name} failed: {e}")
+        if STARTUP_WARMUP:
+            warm_up()
+        health_monitor.start()
+        _started = True
+
+
+def shut_down():
+    global _started
+    with _start_lock:
+        if not _started:
+            return
+        health_monitor.stop()
+        get_vector_store().close()
+        _started = False
 
-import json
-import boto3
 
-# from slowapi import Limiter, _rate_limit_exceeded_handler
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start up before serving and shut down on exit, when served by uvicorn.
+    """
+    await asyncio.to_thread(start_up)
+    yield
+    shut_down()
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 add_cors_middleware(app)
+add_metrics_middleware(app)
+add_profiling_middleware(app)
+add_rate_limit_handler(app)
+
+QUERY_CACHE_EVENTS = REGISTRY.gauge(
+    "rag_query_cache_events",
+    "Query cache hits, misses, evictions and invalidations since start.",
+    ("event",),
+)
+QUERY_CACHE_HIT_RATE = REGISTRY.gauge(
+    "rag_query_cache_hit_rate", "Query cache hit rate since start."
+)
 
 
 @app.get("/")
@@ -39,36 +115,159 @@ def read_root():
     return {"Hello": "World"}
 
 
+def answer_questions(task: models.TaskStatus, questions: list[str], limit: int):
+    """
+    Answer questions against one document.
+
+    Answers for completed documents are cached per (task, question, limit).
+    The questions that miss the cache are embedded in a single embedding
+    call and searched together in the vector store.
+
+    args:
+        task (TaskStatus): The task of the document to search.
+        questions (list[str]): The questions to answer.
+        limit (int): Number of answers per question.
+    returns:
+        dict: The answers keyed by question.
+    """
+    cacheable = task.status == "completed"
+    version = str(task.completed_at)
+    answers = {}
+    missing = []
+    for question in dict.fromkeys(questions):
+        cached = (
+            query_cache.get(task.task_id, question, limit, version=version)
+            if cacheable
+            else None
+        )
+        if cached is not None:
+            answers[question] = cached
+        else:
+            missing.append(question)
+
+    if missing:
+        vectors = generate_embedding([{"text": q} for q in missing])
+        results = get_vector_store().search_many(
+            task.file_path, vectors, limit=limit, tenant=task.user_email
+        )
+        for question, hits in zip(missing, results):
+            answers[question] = [hit["text"] for hit in hits]
+            if cacheable:
+                query_cache.set(
+                    task.task_id, question, limit, answers[question], version=version
+                )
+    return answers
+
+
 @app.post("/document/query")
 def answer_question(request: QuestionRequest, db: Session = Depends(get_db)):
     """
     Endpoint to answer questions based on the document
-    chunks stored in Weaviate.
+    chunks stored in the vector store.
+    Over the owner's query rate limit it answers 429, with too many
+    queries in flight 503.
 
     args:
         request (QuestionRequest): The request containing the
-            question and task ID.
+            question, task ID and number of answers.
         db (Session): The database session dependency.
     returns:
         dict: A dictionary containing the answers to the question.
     """
-    question_vec = generate_embedding([{"text": request.question}])
     doc_id = request.task_id
     task = (
         db.query(models.TaskStatus).filter(models.TaskStatus.task_id == doc_id).first()
     )
     if not task:
         return {"error": "Task not found"}
-    with get_client() as client:
-        results = client.collections.get("DocumentChunk").query.near_vector(
-            near_vector=question_vec[0].embedding,
-            filters=Filter.by_property("document_name").equal(task.file_path),
-            limit=3,
-        )
-        answers = [obj.properties["text"] for obj in results.objects]
+    admit("query", task.user_email)
+    with query_slot():
+        answers = answer_questions(task, [request.question], request.limit)
+    touch_task(db, task)
+    return {"answers": answers[request.question]}
+
+
+@app.post("/document/query/batch")
+def answer_question_batch(request: BatchQuestionRequest, db: Session = Depends(get_db)):
+    """
+    Endpoint to answer several questions about one document at once.
+    All questions are embedded in one call and the vector searches
+    run concurrently. Every distinct question counts against the query
+    rate limit.
+
+    args:
+        request (BatchQuestionRequest): The request containing the
+            questions, task ID and number of answers per question.
+        db (Session): The database session dependency.
+    returns:
+        dict: A dictionary containing the answers keyed by question.
+    """
+    task = (
+        db.query(models.TaskStatus)
+        .filter(models.TaskStatus.task_id == request.task_id)
+        .first()
+    )
+    if not task:
+        return {"error": "Task not found"}
+    admit("query", task.user_email, cost=len(set(request.questions)))
+    with query_slot():
+        answers = answer_questions(task, request.questions, request.limit)
+    touch_task(db, task)
     return {"answers": answers}
 
 
+@app.post("/users/query")
+def answer_library_question(
+    request: LibraryQuestionRequest, db: Session = Depends(get_db)
+):
+    """
+    Endpoint to answer a question from all completed documents of a user.
+    The documents whose summary vectors are closest to the question are
+    picked first, then their chunks are searched together.
+
+    args:
+        request (LibraryQuestionRequest): The request containing the
+            question, user email, number of answers and number of
+            documents to search.
+        db (Session): The database session dependency.
+    returns:
+        dict: The answers, closest first, with the task ID and file name
+            of their document.
+    """
+    admit("query", request.user_email)
+    with query_slot():
+        vector = generate_embedding([{"text": request.question}])[0]
+        hits = search_library(
+            db,
+            get_vector_store(),
+            request.user_email,
+            vector,
+            limit=request.limit,
+            documents=request.documents,
+        )
+    if hits:
+        touch_task(db, db.get(models.TaskStatus, hits[0]["task_id"]))
+    return {
+        "answers": [
+            {
+                "task_id": hit["task_id"],
+                "file_name": hit["file_name"],
+                "text": hit["text"],
+                "distance": hit["distance"],
+            }
+            for hit in hits
+        ]
+    }
+
+
+@app.get("/document/query/cache-stats")
+def query_cache_stats():
+    """
+    Hit-rate statistics of the /document/query answer cache.
+    """
+    return query_cache.stats()
+
+
 @app.post("/upload-document")
 async def doc_upload(
     file: UploadFile = File(...),
@@ -84,8 +283,13 @@ async def doc_upload(
     - Accepts a document file and the user's email.
     - Stores file locally or uploads to S3 based on environment.
     - Creates a processing task in the database.
-    - Sends a task to SQS queue (in production) or
-    processes it directly (in development).
+    - Estimates the processing cost and queues the task on the matching
+    lane: on SQS in production, on an in-process worker pool in
+    development. Returns without waiting.
+    - Refuses uploads over the user's or the global rate limit with 429.
+    - An identical upload of a document still being processed joins the
+    running job; a changed one queues a new job, which the running one
+    gives way to.
 
     args:
         - **file**: The document file to be uploaded.
@@ -93,10 +297,16 @@ async def doc_upload(
         - **is_structured_json**: Whether to process the document as structured JSON.
     Returns the file name, processing status.
     """
+    # The SQL bucket store locks its row, so keep it off the event loop
+    await asyncio.to_thread(admit, "upload", user_email)
     try:
         if is_structured_json and "json" not in file.filename:
             return {"error": "File must be a JSON file for structured JSON processing."}
         file_path = await upload_file_to_s3(file, user_email)
+        await file.seek(0)
+        contents = await file.read()
+        estimated_cost = estimate_job_cost(file.filename, contents)
+        content_hash = upload_fingerprint(contents, is_structured_json)
     except Exception as e:
         return {"error": f"Failed to upload file: {str(e)}"}
 
@@ -111,8 +321,19 @@ async def doc_upload(
         )
         .first()
     )
+    if (
+        existing_task
+        and existing_task.content_hash == content_hash
+        and job_in_flight(existing_task)
+    ):
+        return {
+            "Status": "Processing",
+            "task_id": existing_task.task_id,
+        }
     if existing_task:
         existing_task.status = "processing"
+        # Incremented in SQL so concurrent uploads get distinct versions
+        existing_task.ingest_version = models.TaskStatus.ingest_version + 1
         db_task = existing_task
     else:
         db_task = models.TaskStatus(
@@ -120,35 +341,31 @@ async def doc_upload(
             user_email=validated.user_email,
             status="processing",
             file_path=file_path,
+            ingest_version=1,
         )
         db.add(db_task)
+    db_task.content_hash = content_hash
+    db_task.estimated_cost = estimated_cost
+    db_task.lane = lane_for_cost(estimated_cost)
+    db_task.queued_at = datetime.datetime.now(datetime.timezone.utc)
+    db_task.started_at = None
     db.commit()
     db.refresh(db_task)
-    if development:
-        # For local development, process the document synchronously
-        process_document(
-            task_id=db_task.task_id, structured_json=str(is_structured_json).lower()
-        )
-    else:
-        sqs = boto3.client(
-            "sqs",
+    try:
+        get_job_queue().enqueue(
+            {
+                "task_id": db_task.task_id,
+                "structured_json": str(is_structured_json),
+                "lane": db_task.lane,
+                "ingest_version": db_task.ingest_version,
+            }
         )
-        try:
-            sqs.send_message(
-                QueueUrl=SQS_QUEUE_URL,
-                MessageBody=json.dumps(
-                    {
-                        "task_id": db_task.task_id,
-                        "structured_json": str(is_structured_json),
-                    }
-                ),
-            )
-        except Exception as e:
-            db_task.status = "failed"
-            db_task.error_message = f"Failed to send message to SQS: {str(e)}"
-            db.commit()
-            db.refresh(db_task)
-            return {"error": f"Failed to send message to SQS: {str(e)}"}
+    except Exception as e:
+        db_task.status = "failed"
+        db_task.error_message = f"Failed to queue task: {str(e)}"
+        db.commit()
+        db.refresh(db_task)
+        return {"error": f"Failed to queue task: {str(e)}"}
     return {
         "Status": "Processing",
         "task_id": db_task.task_id,
@@ -160,11 +377,33 @@ def test():
     """
     Health check endpoint
 
-    Verifies the readiness of the Weaviate client.
+    Returns the last status of the vector store and the database, with the
+    latency of each check, refreshed in the background so probes do not
+    connect to them.
     """
-    with get_client() as client:
-        ready = client.is_ready()
-    return {"weaviate": ready}
+    return health_monitor.status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(db: Session = Depends(get_db)):
+    """
+    Prometheus metrics: API route latency, ingestion stage durations,
+    external call latency and query cache statistics of this process,
+    plus the depth and oldest job age of each ingestion lane.
+
+    Worker Lambdas run in their own processes; their per-stage timings are
+    persisted on each task as `processing_metrics` and exported here per
+    completed task.
+    """
+    stats = query_cache.stats()
+    for event in ("hits", "misses", "evictions", "invalidations"):
+        QUERY_CACHE_EVENTS.labels(event=event).set(stats[event])
+    QUERY_CACHE_HIT_RATE.set(stats["hit_rate"])
+    for lane, lane_stats in queue_stats(db).items():
+        JOB_QUEUE_DEPTH.labels(lane=lane).set(lane_stats["depth"])
+        JOB_QUEUE_OLDEST_AGE.labels(lane=lane).set(lane_stats["oldest_age_seconds"])
+    stage_metrics_export.collect(db)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/task-status/{task_id}")
@@ -214,17 +453,41 @@ def get_users_tasks(
     return tasks
 
 
+@app.get("/users/task/{task_id}/json-fields")
+def json_data_fields(task_id: str, db: Session = Depends(get_db)):
+    """
+    Fields of the structured JSON dataset of a task, with the types
+    inferred at upload, and the numeric ones the aggregator accepts.
+    - **task_id**: The ID of the task to query.
+    """
+    task = (
+        db.query(models.TaskStatus).filter(models.TaskStatus.task_id == task_id).first()
+    )
+    if not task:
+        return {"error": "Task not found"}
+    try:
+        schema = get_vector_store().structured_json_schema(task.file_path)
+    except Exception as e:
+        return {"task_id": task_id, "error": str(e)}
+    return {
+        "task_id": task_id,
+        "fields": {field: spec["type"] for field, spec in schema.items()},
+        "aggregatable": numeric_fields(schema),
+    }
+
+
 @app.post("/users/task/json-aggregator", response_model=AggregationResponse)
 def json_data_aggregator(
     request: AggregationRequest,
     db: Session = Depends(get_db),
 ):
     """
-    Custom JSON data aggregator for Weaviate queries.
+    Custom JSON data aggregator over the vector store.
     Get sum, maximum, minimum, mean, and count of a specified field
     for a given task ID.
     - **task_id**: The ID of the task to query.
-    - **field**: The field to aggregate (e.g., "score").
+    - **field**: The numeric field to aggregate (e.g., "score"), nested
+    fields joined with "." (e.g., "address.zip").
     Returns a dictionary with the aggregated results.
     """
     task_id = request.task_id
@@ -235,59 +498,11 @@ def json_data_aggregator(
     if not task:
         return {"error": "Task not found"}
     try:
-        with get_client() as client:
-            agg_result = client.collections.get(
-                "StructureJSONPlayer"
-            ).aggregate.over_all(
-                total_count=True,
-                filters=Filter.by_property("document_name").like(task.file_path),
-                return_metrics=wvc.query.Metrics(field).integer(
-                    count=True,
-                    maximum=True,
-                    minimum=True,
-                    mean=True,
-                    sum_=True,
-                ),
-            )
-            max_user_details = client.collections.get(
-                "StructureJSONPlayer"
-            ).query.fetch_objects(
-                filters=(
-                    Filter.by_property("document_name").like(task.file_path)
-                    & Filter.by_property(field).equal(
-                        agg_result.properties[field].maximum
-                    )
-                )
-            )
-            min_user_details = client.collections.get(
-                "StructureJSONPlayer"
-            ).query.fetch_objects(
-                filters=(
-                    Filter.by_property("document_name").like(task.file_path)
-                    & Filter.by_property(field).equal(
-                        agg_result.properties[field].minimum
-                    )
-                )
-            )
-            max_user_data = []
-            if max_user_details and max_user_details.objects:
-                for obj in max_user_details.objects:
-                    max_user_data.append(obj.properties)
-            min_user_data = []
-            if min_user_details and min_user_details.objects:
-                for obj in min_user_details.objects:
-                    min_user_data.append(obj.properties)
-
-        output = AggregationResult(
-            count=agg_result.total_count,
-            maximum=agg_result.properties[field].maximum,
-            minimum=agg_result.properties[field].minimum,
-            mean=agg_result.properties[field].mean,
-            total=agg_result.properties[field].sum_,
-            max_user_details=max_user_data,
-            min_user_details=min_user_data,
-        )
+        result = get_vector_store().aggregate(task.file_path, field)
+        output = AggregationResult(**result)
 
+    except ValueError as e:
+        return {"task_id": task_id, "field": field, "error": str(e)}
     except Exception as e:
         return {
             "task_id": task_id,
@@ -298,4 +513,14 @@ def json_data_aggregator(
     return {"task_id": task_id, "field": field, "output": output}
 
 
-handler = Mangum(app)  # For AWS Lambda compatibility
+# Mangum would run the lifespan around every invocation, so Lambda starts up
+# on the first invocation of a container instead and never shuts down
+asgi_handler = Mangum(app, lifespan="off")
+
+
+def handler(event, context):
+    """
+    AWS Lambda entry point.
+    """
+    start_up()
+    return asgi_handler(event, context)
@@ -1,5 +1,21 @@
+import random
+import re
+import time
+
 from fastapi.middleware.cors import CORSMiddleware
-from .core.config import ALLOWED_ORIGINS
+from fastapi.responses import JSONResponse
+from .core.config import (
+    ALLOWED_ORIGINS,
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+    PROFILING_ENABLED,
+    PROFILING_HEADER,
+    PROFILING_INTERVAL_SECONDS,
+    PROFILING_SAMPLE_RATE,
+)
+from .core.metrics import HTTP_REQUEST_DURATION
+from .core.profiling import StackSampler, save_profile
+from .services.rate_limit import RateLimitExceeded
 
 
 def add_cors_middleware(app):
@@ -19,3 +35,109 @@ def add_cors_middleware(app):
         allow_methods=["*"],
         allow_headers=["*"],
     )
+
+
+def add_rate_limit_handler(app):
+    """
+    Answers requests refused by admission control (RateLimitExceeded) with
+    their 429 or 503 status and a Retry-After header, so clients back off.
+
+    Args:
+        app (FastAPI): The FastAPI application instance.
+    """
+
+    @app.exception_handler(RateLimitExceeded)
+    async def rate_limit_exceeded(request, exc):
+        return JSONResponse(
+            {"error": str(exc)},
+            status_code=exc.status_code,
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+
+def add_metrics_middleware(app):
+    """
+    Adds a middleware recording the latency of every request in the
+    `rag_http_request_duration_seconds` histogram.
+
+    Requests are labelled with the route template (e.g. /task-status/{task_id})
+    rather than the raw path, so label cardinality stays bounded.
+
+    Args:
+        app (FastAPI): The FastAPI application instance.
+    """
+
+    @app.middleware("http")
+    async def record_request_duration(request, call_next):
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=request.method,
+                route=route.path if route else "unmatched",
+                status=status,
+            ).observe(time.perf_counter() - start)
+
+
+def add_profiling_middleware(app):
+    """
+    Adds an opt-in sampling profiler for individual requests.
+
+    Only active when PROFILING_ENABLED is set. A request is profiled when it
+    sends the PROFILING_HEADER header or is picked at random with probability
+    PROFILING_SAMPLE_RATE. Profiles are written as folded stacks (flamegraph.pl,
+    speedscope) to PROFILE_DIR, keeping the newest PROFILE_MAX_FILES, and the
+    file name is returned in the `X-Profile-File` response header.
+    With `X-Profile: inline` the response is replaced by a JSON debug body
+    holding the hottest functions and the folded stacks.
+
+    Args:
+        app (FastAPI): The FastAPI application instance.
+    """
+    if not PROFILING_ENABLED:
+        return
+
+    @app.middleware("http")
+    async def profile_request(request, call_next):
+        requested = request.headers.get(PROFILING_HEADER, "").lower()
+        if not requested and random.random() >= PROFILING_SAMPLE_RATE:
+            return await call_next(request)
+
+        sampler = StackSampler(interval=PROFILING_INTERVAL_SECONDS).start()
+        try:
+            response = await call_next(request)
+        finally:
+            sampler.stop()
+
+        route = request.scope.get("route")
+        name = re.sub(
+            r"[^A-Za-z0-9]+",
+            "_",
+            f"{request.method}-{route.path if route else request.url.path}",
+        ).strip("_")
+        name = f"{name}-{int(sampler.duration * 1000)}ms"
+        try:
+            file_name = save_profile(sampler, PROFILE_DIR, name, PROFILE_MAX_FILES)
+        except OSError as e:
+            print(f"Error saving request profile: {e}")
+            file_name = None
+
+        if requested == "inline":
+            return JSONResponse(
+                {
+                    "status_code": response.status_code,
+                    "duration_ms": round(sampler.duration * 1000, 2),
+                    "samples": sampler.samples,
+                    "profile_file": file_name,
+                    "top_functions": sampler.top_functions(),
+                    "folded": sampler.folded(),
+                }
+            )
+        if file_name:
+            response.headers["X-Profile-File"] = file_name
+        return response
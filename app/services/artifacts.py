@@ -0,0 +1,280 @@
+# Durable, checksummed intermediate artifacts of document ingestion
+import hashlib
+import io
+import json
+import os
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+
+from ..core.config import (
+    ARTIFACT_PREFIX,
+    ARTIFACT_STORE,
+    BUCKET_NAME,
+    LOCAL_ARTIFACT_DIR,
+)
+from ..core.metrics import track_external_call
+
+_MAGIC = b"RAGA1 "
+
+
+def _wrap(data: bytes) -> bytes:
+    return _MAGIC + hashlib.sha256(data).hexdigest().encode() + b"\n" + data
+
+
+def _unwrap(blob: bytes):
+    """
+    Return the payload of an artifact, or None when it is truncated or
+    does not match its checksum.
+    """
+    header, _, data = blob.partition(b"\n")
+    if not header.startswith(_MAGIC):
+        return None
+    if hashlib.sha256(data).hexdigest().encode() != header[len(_MAGIC) :]:
+        return None
+    return data
+
+
+class ArtifactStore:
+    """
+    Blob store for ingestion artifacts. Every blob carries a sha256 of its
+    payload; corrupt or partial blobs read as missing.
+    """
+
+    name = ""
+
+    def put(self, key: str, data: bytes):
+        self._write(key, _wrap(data))
+
+    def get(self, key: str):
+        blob = self._read(key)
+        if blob is None:
+            return None
+        data = _unwrap(blob)
+        if data is None:
+            print(f"Discarding corrupt artifact {key}")
+        return data
+
+    def _write(self, key: str, blob: bytes):
+        raise NotImplementedError
+
+    def _read(self, key: str):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str):
+        raise NotImplementedError
+
+    def list_blobs(self, prefix: str) -> list[tuple[str, int, float]]:
+        """
+        (key, size in bytes, last used or modified timestamp) of every
+        blob under the prefix.
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: list[str]):
+        raise NotImplementedError
+
+
+class LocalArtifactStore(ArtifactStore):
+    name = "local"
+
+    def __init__(self, root_dir: str = None):
+        self.root_dir = root_dir or LOCAL_ARTIFACT_DIR
+
+    def _path(self, key):
+        return os.path.join(self.root_dir, key)
+
+    def _write(self, key, blob):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        # Bump the modification time so `list_blobs` reports least recently used
+        os.utime(self._path(key))
+        return blob
+
+    def delete_prefix(self, prefix):
+        root = self._path(prefix)
+        for dirpath, _, files in os.walk(root, topdown=False):
+            for file_name in files:
+                os.remove(os.path.join(dirpath, file_name))
+            os.rmdir(dirpath)
+
+    def list_blobs(self, prefix):
+        blobs = []
+        for dirpath, _, files in os.walk(self._path(prefix)):
+            for file_name in files:
+                if file_name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root_dir).replace(os.sep, "/")
+                blobs.append((key, stat.st_size, stat.st_mtime))
+        return blobs
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+
+class S3ArtifactStore(ArtifactStore):
+    name = "s3"
+
+    def __init__(self, bucket: str = None, prefix: str = None):
+        self.bucket = bucket or BUCKET_NAME
+        self.prefix = ARTIFACT_PREFIX if prefix is None else prefix
+
+    def _write(self, key, blob):
+        with track_external_call("s3", "put_object"):
+            boto3.client("s3").put_object(
+                Bucket=self.bucket, Key=self.prefix + key, Body=blob
+            )
+
+    def _read(self, key):
+        try:
+            with track_external_call("s3", "get_object"):
+                response = boto3.client("s3").get_object(
+                    Bucket=self.bucket, Key=self.prefix + key
+                )
+                return response["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def delete_prefix(self, prefix):
+        s3 = boto3.client("s3")
+        request = {"Bucket": self.bucket, "Prefix": self.prefix + prefix}
+        while True:
+            with track_external_call("s3", "list_objects_v2"):
+                listing = s3.list_objects_v2(**request)
+            keys = [{"Key": obj["Key"]} for obj in listing.get("Contents", [])]
+            # A listing page holds at most 1000 keys, the delete_objects limit
+            if keys:
+                with track_external_call("s3", "delete_objects"):
+                    s3.delete_objects(Bucket=self.bucket, Delete={"Objects": keys})
+            if not listing.get("IsTruncated"):
+                return
+            request["ContinuationToken"] = listing["NextContinuationToken"]
+
+    def list_blobs(self, prefix):
+        s3 = boto3.client("s3")
+        request = {"Bucket": self.bucket, "Prefix": self.prefix + prefix}
+        blobs = []
+        while True:
+            with track_external_call("s3", "list_objects_v2"):
+                listing = s3.list_objects_v2(**request)
+            for obj in listing.get("Contents", []):
+                blobs.append(
+                    (
+                        obj["Key"][len(self.prefix) :],
+                        obj["Size"],
+                        obj["LastModified"].timestamp(),
+                    )
+                )
+            if not listing.get("IsTruncated"):
+                return blobs
+            request["ContinuationToken"] = listing["NextContinuationToken"]
+
+    def delete(self, keys):
+        s3 = boto3.client("s3")
+        for start in range(0, len(keys), 1000):
+            objects = [{"Key": self.prefix + key} for key in keys[start : start + 1000]]
+            with track_external_call("s3", "delete_objects"):
+                s3.delete_objects(Bucket=self.bucket, Delete={"Objects": objects})
+
+
+_stores = {}
+
+
+def get_artifact_store(backend: str = None) -> ArtifactStore:
+    """
+    Return the artifact store selected by the ARTIFACT_STORE config.
+    """
+    backend = backend or ARTIFACT_STORE
+    if backend not in _stores:
+        if backend == "local":
+            _stores[backend] = LocalArtifactStore()
+        elif backend == "s3":
+            _stores[backend] = S3ArtifactStore()
+        else:
+            raise ValueError(f"Unsupported artifact store: {backend}")
+    return _stores[backend]
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Checkpoints:
+    """
+    The stage outputs of one ingestion run (extracted text, chunks,
+    embeddings), keyed by task and the hash of the document's content, so a
+    retry of the same upload resumes after the last completed stage.
+
+    Checkpoints are an optimisation: failing to read or write one is logged
+    and the stage simply runs.
+    """
+
+    def __init__(self, store: ArtifactStore, task_id: int, content_hash: str):
+        self.store = store
+        self.prefix = f"checkpoints/{task_id}/"
+        self.key_prefix = f"{self.prefix}{content_hash}/"
+
+    def _get(self, name):
+        try:
+            return self.store.get(self.key_prefix + name)
+        except Exception as e:
+            print(f"Error reading checkpoint {name}: {e}")
+            return None
+
+    def _put(self, name, data: bytes):
+        try:
+            self.store.put(self.key_prefix + name, data)
+        except Exception as e:
+            print(f"Error writing checkpoint {name}: {e}")
+
+    def load_json(self, name: str):
+        data = self._get(f"{name}.json")
+        return None if data is None else json.loads(data)
+
+    def save_json(self, name: str, value):
+        self._put(f"{name}.json", json.dumps(value).encode())
+
+    def load_array(self, name: str):
+        data = self._get(f"{name}.npy")
+        return None if data is None else np.load(io.BytesIO(data))
+
+    def save_array(self, name: str, value):
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(value, dtype=np.float32))
+        self._put(f"{name}.npy", buffer.getvalue())
+
+    def clear(self):
+        """
+        Delete the checkpoints of every run of the task.
+        """
+        try:
+            self.store.delete_prefix(self.prefix)
+        except Exception as e:
+            print(f"Error deleting checkpoints {self.prefix}: {e}")
@@ -0,0 +1,86 @@
+# Compact chunk records passed through ingestion: slotted objects whose
+# embeddings are row views of one float32 matrix per embedded batch
+import numpy as np
+
+
+class Chunk:
+    """
+    A chunk of a document. `embedding` is a float32 vector, usually a row
+    of the matrix its batch was embedded into, or None before embedding.
+
+    Chunks can be read by key like the dicts they replaced; the former
+    'tokenized_para' key returns the text, which is no longer stored twice.
+    """
+
+    __slots__ = ("document_name", "chunk_index", "text", "embedding")
+
+    def __init__(self, document_name: str, chunk_index: int, text: str, embedding=None):
+        self.document_name = document_name
+        self.chunk_index = chunk_index
+        self.text = text
+        self.embedding = embedding
+
+    @classmethod
+    def coerce(cls, chunk) -> "Chunk":
+        """
+        The chunk itself, or a Chunk made from a chunk dict.
+        """
+        if isinstance(chunk, cls):
+            return chunk
+        embedding = chunk.get("embedding")
+        return cls(
+            chunk["document_name"],
+            chunk["chunk_index"],
+            chunk["text"],
+            None if embedding is None else np.asarray(embedding, dtype=np.float32),
+        )
+
+    def properties(self) -> dict:
+        """
+        The properties stored with the chunk's vector.
+        """
+        return {
+            "document_name": self.document_name,
+            "chunk_index": self.chunk_index,
+            "text": self.text,
+        }
+
+    def __getitem__(self, key: str):
+        if key == "tokenized_para":
+            return self.text
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key: str) -> bool:
+        return key == "tokenized_para" or (
+            key in self.__slots__ and getattr(self, key) is not None
+        )
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def __repr__(self):
+        return f"Chunk({self.document_name!r}, {self.chunk_index}, {self.text[:30]!r})"
+
+
+def attach_embeddings(chunks: list[Chunk], matrix: np.ndarray) -> list[Chunk]:
+    """
+    Give every chunk its row of the embedding matrix, as a view.
+    """
+    if len(matrix) != len(chunks):
+        raise ValueError(f"Got {len(matrix)} embeddings for {len(chunks)} chunks")
+    for chunk, row in zip(chunks, matrix):
+        chunk.embedding = row
+    return chunks
+
+
+def embedding_matrix(chunks: list) -> np.ndarray:
+    """
+    The float32 embeddings of the chunks (or chunk dicts) as one matrix.
+    """
+    if not chunks:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.stack([Chunk.coerce(c).embedding for c in chunks]).astype(
+        np.float32, copy=False
+    )
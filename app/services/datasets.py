@@ -0,0 +1,189 @@
+# Structured JSON datasets: field types inferred from a sample of the records,
+# so any tabular JSON is stored with typed properties and can be aggregated
+import json
+import re
+
+from ..core.config import DATASET_SCHEMA_SAMPLE_SIZE
+
+FIELD_TYPES = ("int", "number", "boolean", "text")
+NUMERIC_TYPES = ("int", "number")
+# Property names Weaviate reserves for itself
+RESERVED_PROPERTIES = {"id", "_id", "_additional", "vector"}
+
+_INT = re.compile(r"[+-]?(0|[1-9]\d*)")
+_NUMBER = re.compile(r"[+-]?(0|[1-9]\d*)?(\.\d+)?([eE][+-]?\d+)?")
+
+
+def flatten_record(record: dict, prefix: str = "") -> dict:
+    """
+    Flatten nested objects into dot-separated fields; lists are kept whole
+    and stored as JSON text.
+    """
+    out = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            out.update(flatten_record(value, f"{prefix}{key}."))
+        else:
+            out[f"{prefix}{key}"] = value
+    return out
+
+
+def value_type(value) -> str | None:
+    """
+    The field type a value fits, or None for missing values. Numbers and
+    booleans written as strings count as such, except integers with leading
+    zeros (codes, zip codes), which stay text.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "number"
+    if isinstance(value, str):
+        text = value.strip()
+        if _INT.fullmatch(text):
+            return "int"
+        if any(c.isdigit() for c in text) and _NUMBER.fullmatch(text):
+            return "number"
+        if text.lower() in ("true", "false"):
+            return "boolean"
+    return "text"
+
+
+def _merge_types(current: str | None, new: str | None) -> str | None:
+    if current is None:
+        return new
+    if new is None or new == current:
+        return current
+    if {current, new} == {"int", "number"}:
+        return "number"
+    return "text"
+
+
+def property_names(fields: list[str]) -> dict:
+    """
+    A unique Weaviate property name for every field: letters, digits and
+    "_" only, starting with a lowercase letter or "_".
+    """
+    names = {}
+    used = set()
+    for field in fields:
+        name = re.sub(r"[^0-9A-Za-z_]", "_", field) or "field"
+        if name[0].isdigit():
+            name = f"f_{name}"
+        name = name[0].lower() + name[1:]
+        if name in RESERVED_PROPERTIES:
+            name = f"{name}_"
+        base, suffix = name, 2
+        while name.lower() in used:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        used.add(name.lower())
+        names[field] = name
+    return names
+
+
+def infer_schema(
+    rows: list[dict], sample_size: int = DATASET_SCHEMA_SAMPLE_SIZE
+) -> dict:
+    """
+    Infer the type of every field of flattened records from up to
+    `sample_size` of them, evenly spread. Fields holding mixed types, or
+    not seen in the sample, are text.
+    :param rows: Records flattened with `flatten_record`
+    :return: {field: {"property": Weaviate property name, "type": field type}}
+        in order of first appearance
+    """
+    sample = rows[:: max(1, len(rows) // sample_size)][:sample_size]
+    types = {}
+    for row in sample:
+        for field, value in row.items():
+            types[field] = _merge_types(types.get(field), value_type(value))
+    fields = list(types)
+    seen = set(fields)
+    for row in rows:
+        for field in row:
+            if field not in seen:
+                seen.add(field)
+                fields.append(field)
+    names = property_names(fields)
+    return {
+        field: {"property": names[field], "type": types.get(field) or "text"}
+        for field in fields
+    }
+
+
+def numeric_fields(schema: dict) -> list[str]:
+    """
+    Fields of a dataset that can be aggregated.
+    """
+    return [field for field, spec in schema.items() if spec["type"] in NUMERIC_TYPES]
+
+
+def coerce_value(value, field_type: str):
+    """
+    Convert a value to the field's type; values that do not fit become None.
+    """
+    if value is None:
+        return None
+    if field_type == "text":
+        return value if isinstance(value, str) else json.dumps(value)
+    kind = value_type(value)
+    if field_type == "boolean" and kind == "boolean":
+        return value if isinstance(value, bool) else value.strip().lower() == "true"
+    if field_type in NUMERIC_TYPES and kind in NUMERIC_TYPES:
+        number = float(value)
+        if field_type == "number":
+            return number
+        if number.is_integer():
+            return int(value) if kind == "int" else int(number)
+    return None
+
+
+def dataset_rows(rows: list[dict], schema: dict) -> list[dict]:
+    """
+    The flattened records with their values converted to the schema's
+    types. Missing values and values that do not fit their field are left out.
+    """
+    converted = []
+    dropped = 0
+    for row in rows:
+        record = {}
+        for field, value in row.items():
+            spec = schema.get(field)
+            coerced = coerce_value(value, spec["type"]) if spec else None
+            if coerced is None:
+                dropped += value is not None and value != ""
+                continue
+            record[field] = coerced
+        converted.append(record)
+    if dropped:
+        print(f"Dropped {dropped} values not matching their inferred field type")
+    return converted
+
+
+def aggregatable_field(schema: dict, field: str) -> dict:
+    """
+    The schema entry of a numeric field, raising ValueError for any other.
+    """
+    spec = schema.get(field)
+    if spec is None or spec["type"] not in NUMERIC_TYPES:
+        raise ValueError(
+            f"Field {field} cannot be aggregated, numeric fields: "
+            f"{', '.join(numeric_fields(schema)) or 'none'}"
+        )
+    return spec
+
+
+def record_from_properties(properties: dict, schema: dict) -> dict:
+    """
+    A stored object's properties keyed by the original field names.
+    """
+    return {
+        field: properties[spec["property"]]
+        for field, spec in schema.items()
+        if properties.get(spec["property"]) is not None
+    }
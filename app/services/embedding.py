@@ -1,30 +1,267 @@
+import base64
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import openai
 from openai import OpenAI
 
+from ..core.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL,
+    EMBEDDING_WORKERS,
+    LOCAL_EMBEDDING_MODEL_PATH,
+)
+from ..core.metrics import in_current_context, track_external_call
+from .chunks import Chunk, attach_embeddings
+from .import_text import simple_tokenize
+
+
+class Embedder:
+    """
+    Interface for turning texts into embedding vectors.
+
+    Inputs are split into batches of `batch_size` texts and the batches are
+    embedded concurrently on a thread pool of `workers` threads.
+    """
+
+    name = ""
+
+    def __init__(
+        self, batch_size: int = EMBEDDING_BATCH_SIZE, workers: int = EMBEDDING_WORKERS
+    ):
+        self.batch_size = batch_size
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=f"embed-{self.name}"
+        )
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embed the texts, preserving their order.
+        """
+        if not texts:
+            return []
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) == 1:
+            return self.embed_batch(batches[0])
+        vectors = []
+        for batch_vectors in self._executor.map(
+            in_current_context(self.embed_batch), batches
+        ):
+            vectors.extend(batch_vectors)
+        return vectors
+
+    def embed_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed the texts into one contiguous float32 matrix, a row per text
+        in input order. Batches are copied in as they complete, so vectors
+        never exist as Python floats beyond the batch being copied.
+        """
+        batches = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        if len(batches) <= 1:
+            results = map(self.embed_batch_array, batches)
+        else:
+            results = self._executor.map(
+                in_current_context(self.embed_batch_array), batches
+            )
+        matrix = None
+        start = 0
+        for vectors in results:
+            if matrix is None:
+                matrix = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            matrix[start : start + len(vectors)] = vectors
+            start += len(vectors)
+        return matrix if matrix is not None else np.empty((0, 0), dtype=np.float32)
+
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        raise NotImplementedError
+
+    def embed_batch_array(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed one batch as a float32 matrix. Embedders that produce arrays
+        natively override this to skip the lists of `embed_batch`.
+        """
+        return np.asarray(self.embed_batch(texts), dtype=np.float32)
+
+
+class OpenAIEmbedder(Embedder):
+    """
+    Embeddings from the OpenAI embeddings API.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        model: str = EMBEDDING_MODEL,
+        dimensions: int = EMBEDDING_DIMENSIONS,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.model = model
+        self.dimensions = dimensions
+        self._client = None
+
+    @property
+    def client(self):
+        # Created lazily so importing the module does not require an API key
+        if self._client is None:
+            self._client = OpenAI()
+        return self._client
+
+    def embed_batch(self, texts):
+        return [item.embedding for item in self._create(texts).data]
+
+    def embed_batch_array(self, texts):
+        # Base64 responses decode straight into float32, without a Python
+        # float per dimension
+        response = self._create(texts, encoding_format="base64")
+        return np.stack(
+            [
+                np.frombuffer(base64.b64decode(item.embedding), dtype=np.float32)
+                for item in response.data
+            ]
+        )
+
+    def _create(self, texts, **options):
+        try:
+            # Only the text-embedding-3 models accept reduced dimensions
+            if self.model.startswith("text-embedding-3"):
+                options["dimensions"] = self.dimensions
+            with track_external_call("openai", "embeddings"):
+                return self.client.embeddings.create(
+                    input=texts, model=self.model, **options
+                )
+
+        except openai.APIConnectionError as e:
+            raise Exception(f"API connection error: {e}")
+        except openai.RateLimitError as e:
+            raise Exception(f"API connection error: {e}")
+        except Exception as e:
+            raise Exception(f"API connection error: {e}")
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    Embeddings from a sentence-transformers model loaded from a local path,
+    run on the CPU.
+    """
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_path: str, **kwargs):
+        super().__init__(**kwargs)
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_path, device="cpu")
+
+    def embed_batch(self, texts):
+        return self.embed_batch_array(texts).tolist()
+
+    def embed_batch_array(self, texts):
+        return self.model.encode(
+            texts, batch_size=len(texts), normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic feature-hashing vectorizer.
+
+    Word unigrams and bigrams are hashed into `dimensions` signed buckets and
+    the result is L2-normalized. Texts sharing words get similar vectors, which
+    is enough for offline load tests and for wiring checks without a model.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int = EMBEDDING_DIMENSIONS, **kwargs):
+        super().__init__(**kwargs)
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> list[str]:
+        tokens = simple_tokenize(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed_batch(self, texts):
+        return self.embed_batch_array(texts).tolist()
+
+    def embed_batch_array(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(
+                    feature.encode("utf-8"), digest_size=8
+                ).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dimensions] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+_embedders = {}
+
+
+def get_embedder(backend: str = None) -> Embedder:
+    """
+    Return the embedder selected by the EMBEDDING_BACKEND config.
+    The local backend uses the model at LOCAL_EMBEDDING_MODEL_PATH when it
+    exists and sentence-transformers is installed, else the hashing vectorizer.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in _embedders:
+        if backend == "openai":
+            _embedders[backend] = OpenAIEmbedder()
+        elif backend == "local":
+            if LOCAL_EMBEDDING_MODEL_PATH and os.path.exists(
+                LOCAL_EMBEDDING_MODEL_PATH
+            ):
+                try:
+                    _embedders[backend] = SentenceTransformerEmbedder(
+                        LOCAL_EMBEDDING_MODEL_PATH
+                    )
+                except ImportError:
+                    print(
+                        "sentence-transformers is not installed, "
+                        "falling back to the hashing embedder"
+                    )
+            _embedders.setdefault(backend, HashingEmbedder())
+        else:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+    return _embedders[backend]
+
 
 def generate_embedding(text: list[dict]) -> list:
     """
-    Generate an embedding for the given text using OpenAI's API.
+    Generate embeddings for the given texts with the configured embedder.
 
     Args:
         text (list[dict]): A list of dictionaries containing
             text to be embedded.
 
     Returns:
-        list: The generated embedding.
+        list: One embedding vector per input, in input order.
     """
-    # model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
-    client = OpenAI()
-    try:
-        response = client.embeddings.create(
-            input=[t["text"] for t in text], model="text-embedding-3-small"
-        )
-        embedding = response.data
-        return embedding
-
-    except openai.APIConnectionError as e:
-        raise Exception(f"API connection error: {e}")
-    except openai.RateLimitError as e:
-        raise Exception(f"API connection error: {e}")
-    except Exception as e:
-        raise Exception(f"API connection error: {e}")
+    return get_embedder().embed([t["text"] for t in text])
+
+
+def embed_chunks(chunks: list[Chunk]) -> list[Chunk]:
+    """
+    Embed the chunks with the configured embedder into one float32 matrix
+    and give every chunk its row.
+    """
+    return attach_embeddings(
+        chunks, get_embedder().embed_array([chunk.text for chunk in chunks])
+    )
@@ -0,0 +1,155 @@
+# Startup warm-up of the API's clients, and dependency health checked in the
+# background so /health probes only read the last result
+import threading
+import time
+
+import boto3
+from sqlalchemy import text
+
+from ..core.config import (
+    HEALTH_MAX_AGE_SECONDS,
+    HEALTH_REFRESH_SECONDS,
+    JOB_QUEUE,
+    USE_S3,
+)
+from ..core.database import engine
+from .embedding import get_embedder
+from .vector_store import get_vector_store
+
+
+def check_vector_store() -> dict:
+    store = get_vector_store()
+    if not store.is_ready():
+        raise Exception(f"{store.name} is not ready")
+    return {"backend": store.name}
+
+
+def check_database() -> dict:
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    return {"backend": engine.dialect.name}
+
+
+# Dependencies reported by /health, each checked by a function returning
+# details of the dependency or raising when it is unavailable
+DEPENDENCY_CHECKS = {
+    "vector_store": check_vector_store,
+    "database": check_database,
+}
+
+
+class HealthMonitor:
+    """
+    Runs the dependency checks and keeps the last result, with the latency
+    of every check. A background thread refreshes it every `interval`
+    seconds; a result older than `max_age` is refreshed by the caller.
+    """
+
+    def __init__(
+        self,
+        checks: dict = None,
+        interval: float = HEALTH_REFRESH_SECONDS,
+        max_age: float = HEALTH_MAX_AGE_SECONDS,
+    ):
+        self.checks = checks if checks is not None else DEPENDENCY_CHECKS
+        self.interval = interval
+        self.max_age = max_age
+        self._status = None
+        self._checked_at = 0.0
+        self._refreshing = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self) -> dict:
+        """
+        Run every check now and keep the result.
+        """
+        with self._refreshing:
+            dependencies = {}
+            for name, check in self.checks.items():
+                started = time.perf_counter()
+                try:
+                    details = {"ok": True, **(check() or {})}
+                except Exception as e:
+                    details = {"ok": False, "error": str(e)}
+                details["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                dependencies[name] = details
+            self._status = {
+                "status": (
+                    "ok" if all(d["ok"] for d in dependencies.values()) else "degraded"
+                ),
+                "dependencies": dependencies,
+            }
+            self._checked_at = time.monotonic()
+            return self._status
+
+    def status(self) -> dict:
+        """
+        The last result and its age. A missing or expired result is
+        refreshed first, unless another caller is already refreshing it.
+        """
+        if self._status is None or time.monotonic() - self._checked_at > self.max_age:
+            if self._status is None or not self._refreshing.locked():
+                self.refresh()
+        return {
+            **self._status,
+            "age_seconds": round(time.monotonic() - self._checked_at, 1),
+        }
+
+    def start(self):
+        """
+        Check once, then keep refreshing on a daemon thread.
+        """
+        self.refresh()
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="health-monitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Health check failed: {e}")
+
+
+health_monitor = HealthMonitor()
+
+
+def warm_up():
+    """
+    Build the clients the first requests would otherwise create, connect to
+    the database and make sure the vector store schema exists. A failing
+    step is logged and skipped, so the API still starts and /health reports
+    the broken dependency.
+    """
+    steps = {
+        # Creates the OpenAI client of the OpenAI embedder
+        "embedder": lambda: getattr(get_embedder(), "client", None),
+        # Runs on the store's shared client when the lifespan connected one
+        "vector_store": lambda: get_vector_store().ensure_schema(),
+        "database": lambda: engine.connect().close(),
+    }
+    # boto3 clients are created per call; the first one loads the service model
+    if USE_S3:
+        steps["s3"] = lambda: boto3.client("s3")
+    if JOB_QUEUE == "sqs":
+        steps["sqs"] = lambda: boto3.client("sqs")
+    for name, step in steps.items():
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+            continue
+        print(f"Warmed up {name} in {(time.perf_counter() - started) * 1000:.0f} ms")
@@ -1,5 +1,6 @@
 # Text Parsing and Chunking Service
 from ..core.config import MAX_CHUNKS_PER_DOCUMENT
+from .chunks import Chunk
 
 import re
 
@@ -26,17 +27,11 @@ def chunk_by_tokens(
     """Efficiently split text into token-limited chunks by merging paragraphs.
     Large paragraphs are split into sub-chunks.
     Optionally limit number of chunks.
+    Returns a list of Chunk records, not yet embedded.
     """
 
     def add_chunk(chunks, text, idx):
-        chunks.append(
-            {
-                "document_name": document_name,
-                "chunk_index": idx,
-                "text": text.strip(),
-                "tokenized_para": text.strip(),
-            }
-        )
+        chunks.append(Chunk(document_name, idx, text.strip()))
 
     if not text or not isinstance(text, str):
         raise ValueError("chunk_by_tokens: Text must be a non-empty string")
@@ -1,21 +1,71 @@
 import json
 import os
-from app.utils.json_helper import validate_json
+import re
+import time
 import boto3
-from app.core.config import BUCKET_NAME, development
+from sqlalchemy import select
+from sqlalchemy.orm.exc import StaleDataError
+from app.core.config import (
+    BUCKET_NAME,
+    CHECKPOINTS_ENABLED,
+    DEADLINE_MARGIN_SECONDS,
+    EMBEDDING_BACKEND,
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL,
+    MAX_CHUNKS_PER_DOCUMENT,
+    MAX_CHUNKS_PER_SHARD,
+    SHARD_PAGES,
+    development,
+)
 from app.core import models
+from app.core.metrics import (
+    INGESTION_DOCUMENTS,
+    StageTimer,
+    collect_stages,
+    record_count,
+    track_external_call,
+    track_stage,
+)
 from app.core.database import get_db
-from app.services.embedding import generate_embedding
+from app.services.artifacts import Checkpoints, file_sha256, get_artifact_store
+from app.services.chunks import Chunk, attach_embeddings, embedding_matrix
+from app.services.datasets import flatten_record, infer_schema
+from app.services.embedding import embed_chunks
 from app.services.import_text import chunk_by_tokens
-from app.services.parser import parse_docx, parse_json, parse_pdf, parse_text
-from app.services.weaviate_client import (
-    delete_existing_document_chunks,
-    delete_existing_json_agg,
-    store_batch_chunks_in_weaviate,
-    store_structured_json_in_weaviate,
+from app.services.job_queue import get_job_queue
+from app.services.library import (
+    embedding_sum,
+    pack_vector,
+    summary_vector,
+    unpack_vector,
+)
+from app.services.parser import (
+    parse_docx,
+    parse_json,
+    parse_pdf,
+    parse_text,
+    pdf_page_count,
+)
+from app.services.query_cache import query_cache
+from app.services.scheduling import (
+    IngestionLease,
+    IngestionSuperseded,
+    ShardGuard,
 )
+from app.services.vector_store import get_vector_store
 import datetime
 
+# Chunk indices of shard n start at n * SHARD_CHUNK_STRIDE, keeping them
+# unique and in page order across shards
+SHARD_CHUNK_STRIDE = 100_000
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised between stages when the worker is about to run out of time.
+    The job is re-queued and resumes from its checkpoints.
+    """
+
 
 def mark_task_as_failed(task: models.TaskStatus, error_message: str):
     """
@@ -41,7 +91,8 @@ def get_file_from_s3(file_key: str):
 
     s3 = boto3.client("s3")
     try:
-        s3.download_file(BUCKET_NAME, file_key, local_path)
+        with track_external_call("s3", "download_file"):
+            s3.download_file(BUCKET_NAME, file_key, local_path)
     except Exception as e:
         error = f"Error downloading file from S3: {e}"
         raise Exception(error)
@@ -51,46 +102,116 @@ def get_file_from_s3(file_key: str):
     return local_path
 
 
-def process_document(task_id: int, structured_json: str = None):
+def process_document(
+    task_id: int,
+    structured_json: str = None,
+    deadline: float = None,
+    lease: IngestionLease = None,
+):
     """
     THis function will contain pdf/doc file, will call chunk_text function and
     then call the embedding function to generate the embedding for each chunk.
     Process the document and store the chunks in Weaviate.
+
+    Stage outputs are checkpointed, so a retry resumes after the last
+    completed stage. With a `deadline` (time.monotonic() value) it raises
+    DeadlineExceeded instead of starting a stage it may not finish. With the
+    worker's `lease` it raises IngestionSuperseded between stages once the
+    document was uploaded again, leaving the task to the newer job.
     """
 
     db = next(get_db())
+    store = get_vector_store()
 
     task = (
         db.query(models.TaskStatus).filter(models.TaskStatus.task_id == task_id).first()
     )
 
-    try:
-        file_path = (
-            get_file_from_s3(task.file_path) if not development else task.file_path
+    timer = StageTimer()
+    if task.queued_at and task.started_at:
+        timer.add_duration(
+            "queue_wait", (task.started_at - task.queued_at).total_seconds()
         )
-        delete_existing_document_chunks(task.file_path)
+    try:
+        with collect_stages(timer):
+            with track_stage("download"):
+                file_path = (
+                    get_file_from_s3(task.file_path)
+                    if not development
+                    else task.file_path
+                )
+            record_count("bytes", os.path.getsize(file_path))
+            check_superseded(lease)
+            with track_stage("delete_existing"):
+                store.delete_document_chunks(task.file_path, tenant=task.user_email)
+                db.query(models.DocumentShard).filter(
+                    models.DocumentShard.task_id == task_id
+                ).delete()
+                # Committed now so the lease can be renewed meanwhile
+                db.commit()
+            query_cache.invalidate(task_id)
+
+            if structured_json and structured_json == "true":
+                with track_stage("structured_json"):
+                    store.delete_structured_json(task.file_path)
+                    structured_json_parse(file_path, s3_key=task.file_path)
+                task.additional_info = "structured_json"
 
-        if structured_json and structured_json == "true":
-            delete_existing_json_agg(task.file_path)
-            structured_json_parse(file_path, s3_key=task.file_path)
-            task.additional_info = "structured_json"
+            shards = plan_shards(file_path)
+            if shards:
+                check_superseded(lease)
+                with track_stage("fan_out"):
+                    fan_out_shards(db, task, shards)
+                task.processing_metrics = json.dumps(timer.as_dict())
+                db.commit()
+                return
 
-        chunks = parse_and_chunk_document(file_path, s3_key=task.file_path)
-        _embedded = batch_embedding_for_chunks(chunks)
-        store_batch_chunks_in_weaviate(_embedded)
-        # for i in _embedded:
-        #     store_chunks_in_weaviate(i)
+            checkpoints = open_checkpoints(task, file_path)
+            _embedded = embed_document(
+                file_path,
+                task.file_path,
+                checkpoints=checkpoints,
+                deadline=deadline,
+                lease=lease,
+            )
+            record_count("chunks", len(_embedded))
+            check_deadline(deadline)
+            check_superseded(lease)
+            with track_stage("store"):
+                store.store_chunks(_embedded, tenant=task.user_email)
+            # for i in _embedded:
+            #     store_chunks_in_weaviate(i)
+            task.summary_vector = summary_vector(embedding_sum(_embedded))
 
+        check_superseded(lease)
         task.status = "completed"
         task.completed_at = datetime.datetime.now(datetime.timezone.utc)
+        task.processing_metrics = json.dumps(timer.as_dict())
         db.commit()
         db.refresh(task)
+        query_cache.invalidate(task_id)
+        INGESTION_DOCUMENTS.labels(status="completed").inc()
+        if checkpoints:
+            checkpoints.clear()
+
+    except DeadlineExceeded:
+        # Not a failure: the job is re-queued and resumes from checkpoints
+        task.processing_metrics = json.dumps(timer.as_dict())
+        db.commit()
+        raise
+
+    except IngestionSuperseded:
+        # The task now belongs to the job of the newer upload
+        db.rollback()
+        raise
 
     except Exception as e:
         # Handle any errors by marking the task as failed
         mark_task_as_failed(task, str(e))
+        task.processing_metrics = json.dumps(timer.as_dict())
         db.commit()
         db.refresh(task)
+        INGESTION_DOCUMENTS.labels(status="failed").inc()
         raise Exception(f"Error processing document: {e}")
 
     finally:
@@ -99,60 +220,413 @@ def process_document(task_id: int, structured_json: str = None):
 
 def batch_embedding_for_chunks(chunks):
     """
-    Generate an embedding for the given chunk of text.
+    Generate the embeddings of the chunks as one float32 matrix; every
+    chunk's 'embedding' is a view of its row.
     """
+    return embed_chunks(chunks)
 
-    embedding = generate_embedding(chunks)
 
-    for i, embedding_info in enumerate(embedding):
-        chunks[i]["embedding"] = embedding_info.embedding
+def parse_document(file_path: str, pages: range = None, s3_key: str = None) -> str:
+    """
+    Extract the text of a document.
 
-    return chunks
+    Args:
+        file_path (str): The path to the file.
+        pages (range): Page numbers of a PDF shard to parse (default: all).
+        s3_key (str): Key of the upload in S3, which OCR may read directly.
+
+    Returns:
+        str: The extracted text.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    with track_stage("parse"):
+        if ext == ".pdf":
+            return parse_pdf(
+                file_path=file_path,
+                s3_key=None if development else s3_key,
+                pages=pages,
+            )
+        elif ext == ".docx":
+            return parse_docx(file_path=file_path)
+        elif ext == ".txt":
+            return parse_text(file_path=file_path)
+        elif ext == ".json":
+            return parse_json(file_path=file_path)
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
 
 
-def parse_and_chunk_document(file_path: str, s3_key: str = None) -> list:
+def chunk_document(
+    text: str, s3_key: str = None, max_chunks: int = MAX_CHUNKS_PER_DOCUMENT
+) -> list:
+    """
+    Chunk the text into smaller pieces for processing.
+    """
+    max_tokens = 100 if len(text) < 1000 else 200
+    with track_stage("chunk"):
+        return chunk_by_tokens(
+            s3_key, text, max_tokens=max_tokens, max_chunks=max_chunks
+        )
+
+
+def parse_and_chunk_document(
+    file_path: str,
+    s3_key: str = None,
+    pages: range = None,
+    max_chunks: int = MAX_CHUNKS_PER_DOCUMENT,
+) -> list:
     """
     Chunk the text into smaller pieces for processing.
 
     Args:
         file_path (str): The path to the file.
+        pages (range): Page numbers of a PDF shard to parse (default: all).
+        max_chunks (int): Maximum number of chunks kept.
 
     Returns:
         list: A list of text chunks.
     """
-    ext = os.path.splitext(file_path)[1].lower()
-    if ext == ".pdf":
-        text = parse_pdf(file_path=file_path)
-    elif ext == ".docx":
-        text = parse_docx(file_path=file_path)
-    elif ext == ".txt":
-        text = parse_text(file_path=file_path)
-    elif ext == ".json":
-        text = parse_json(file_path=file_path)
+    return chunk_document(
+        parse_document(file_path, pages=pages), s3_key=s3_key, max_chunks=max_chunks
+    )
+
+
+def check_deadline(deadline: float = None):
+    """
+    Raise DeadlineExceeded when less than DEADLINE_MARGIN_SECONDS remain
+    before `deadline` (a time.monotonic() value).
+    """
+    if deadline is not None and deadline - time.monotonic() < DEADLINE_MARGIN_SECONDS:
+        raise DeadlineExceeded(
+            f"Less than {DEADLINE_MARGIN_SECONDS}s left before the worker deadline"
+        )
+
+
+def check_superseded(lease: IngestionLease = None):
+    """
+    Renew the job's lease, raising IngestionSuperseded when the document
+    was uploaded again since the job started.
+    """
+    if lease is not None:
+        lease.check()
+
+
+def open_checkpoints(task: models.TaskStatus, file_path: str):
+    """
+    The checkpoints of this task for the downloaded content, if enabled.
+    """
+    if not CHECKPOINTS_ENABLED:
+        return None
+    return Checkpoints(get_artifact_store(), task.task_id, file_sha256(file_path))
+
+
+def embed_document(
+    file_path: str,
+    s3_key: str,
+    checkpoints: Checkpoints = None,
+    deadline: float = None,
+    scope: str = "document",
+    pages: range = None,
+    max_chunks: int = MAX_CHUNKS_PER_DOCUMENT,
+    lease: IngestionLease = None,
+) -> list:
+    """
+    Parse, chunk and embed a document (or the pages of one shard),
+    resuming from the text, chunks and embeddings checkpointed by an
+    earlier attempt and checkpointing each stage it runs.
+
+    Args:
+        scope (str): Name of the checkpoints, unique per shard.
+    Returns:
+        list: The Chunk records with their 'embedding'.
+    """
+    chunks = checkpoints.load_json(f"{scope}-chunks") if checkpoints else None
+    if chunks is None:
+        text = checkpoints.load_json(f"{scope}-text") if checkpoints else None
+        if text is None:
+            check_deadline(deadline)
+            check_superseded(lease)
+            text = parse_document(file_path, pages=pages, s3_key=s3_key)
+            if checkpoints:
+                checkpoints.save_json(f"{scope}-text", text)
+        chunks = chunk_document(text, s3_key=s3_key, max_chunks=max_chunks)
+        if checkpoints:
+            checkpoints.save_json(f"{scope}-chunks", [c.properties() for c in chunks])
     else:
-        raise ValueError(f"Unsupported file type: {ext}")
-    max_tokens = 100 if len(text) < 1000 else 200
-    chunks = chunk_by_tokens(s3_key, text, max_tokens=max_tokens)
+        chunks = [Chunk.coerce(c) for c in chunks]
 
+    # Embeddings are only reused from the same embedding configuration
+    embedder = re.sub(
+        r"[^A-Za-z0-9.-]+",
+        "_",
+        f"{EMBEDDING_BACKEND}-{EMBEDDING_MODEL}-{EMBEDDING_DIMENSIONS}",
+    )
+    embeddings_name = f"{scope}-embeddings-{embedder}"
+    vectors = checkpoints.load_array(embeddings_name) if checkpoints else None
+    if vectors is not None and len(vectors) == len(chunks):
+        return attach_embeddings(chunks, vectors)
+
+    check_deadline(deadline)
+    check_superseded(lease)
+    with track_stage("embed"):
+        chunks = batch_embedding_for_chunks(chunks)
+    if checkpoints:
+        checkpoints.save_array(embeddings_name, embedding_matrix(chunks))
     return chunks
 
 
-def structured_json_parse(file_path: str, s3_key: str):
+def structured_json_parse(file_path: str, s3_key: str) -> dict:
     """
-    Parse a structured JSON file and store the data in Weaviate.
+    Parse a structured JSON file and store its records in the vector store
+    as a dataset, with field types inferred from a sample of the records.
     :param file_path: Path to the structured JSON file
+    :param s3_key: Name of the document the dataset belongs to
+    :return: The inferred dataset schema
     """
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             data = json.load(f)
-            if not isinstance(data, list):
-                data["document_name"] = s3_key
-                store_structured_json_in_weaviate(data)
-                validate_json(data)
-            else:
-                for item in data:
-                    validate_json(item)
-                    item["document_name"] = s3_key
-                store_structured_json_in_weaviate(data)
+        records = data if isinstance(data, list) else [data]
+        if not all(isinstance(record, dict) for record in records):
+            raise ValueError("Structured JSON must be an object or a list of objects")
+        rows = [flatten_record(record) for record in records]
+        schema = infer_schema(rows)
+        record_count("records", len(rows))
+        get_vector_store().store_structured_json(s3_key, rows, schema)
+        return schema
     except Exception as e:
         raise Exception(f"Error parsing structured JSON: {e}")
+
+
+def plan_shards(file_path: str) -> list[tuple[int, int]]:
+    """
+    Split a PDF longer than SHARD_PAGES pages into page ranges.
+    :param file_path: Path to the downloaded document
+    :return: (page_start, page_end) pairs, or an empty list when the
+        document is processed in one piece
+    """
+    if not SHARD_PAGES or os.path.splitext(file_path)[1].lower() != ".pdf":
+        return []
+    pages = pdf_page_count(file_path)
+    if pages <= SHARD_PAGES:
+        return []
+    return [
+        (start, min(start + SHARD_PAGES, pages))
+        for start in range(0, pages, SHARD_PAGES)
+    ]
+
+
+def fan_out_shards(db, task: models.TaskStatus, shards: list[tuple[int, int]]):
+    """
+    Record the shards of a task and queue one worker job per shard.
+    """
+    for shard_index, (page_start, page_end) in enumerate(shards):
+        db.add(
+            models.DocumentShard(
+                task_id=task.task_id,
+                shard_index=shard_index,
+                page_start=page_start,
+                page_end=page_end,
+                status="queued",
+            )
+        )
+    db.commit()
+    record_count("shards", len(shards))
+    for shard_index in range(len(shards)):
+        get_job_queue().enqueue(
+            {
+                "task_id": task.task_id,
+                "shard_index": shard_index,
+                "lane": task.lane,
+                "ingest_version": task.ingest_version,
+            }
+        )
+
+
+def process_document_shard(
+    task_id: int, shard_index: int, deadline: float = None, version: int = None
+):
+    """
+    Parse, embed and store the pages of one shard of a document, then
+    complete the task if this was the last shard to finish.
+    A failing shard fails the whole task; like process_document it
+    resumes from checkpoints and stops early before `deadline`. It stops
+    with IngestionSuperseded between stages once the document was
+    uploaded again after `version` was queued, its shard rows were
+    replaced, or a sibling shard failed the task.
+    """
+    db = next(get_db())
+    store = get_vector_store()
+
+    task = (
+        db.query(models.TaskStatus).filter(models.TaskStatus.task_id == task_id).first()
+    )
+    shard = (
+        db.query(models.DocumentShard)
+        .filter(
+            models.DocumentShard.task_id == task_id,
+            models.DocumentShard.shard_index == shard_index,
+        )
+        .first()
+    )
+    # Redelivered message, or the task failed or was uploaded again
+    if (
+        shard is None
+        or shard.status == "completed"
+        or task.status != "processing"
+        or (version is not None and task.ingest_version != version)
+    ):
+        db.close()
+        return
+
+    guard = ShardGuard(task_id, version)
+    timer = StageTimer()
+    try:
+        with collect_stages(timer):
+            with track_stage("download"):
+                file_path = (
+                    get_file_from_s3(task.file_path)
+                    if not development
+                    else task.file_path
+                )
+            chunks = embed_document(
+                file_path,
+                task.file_path,
+                checkpoints=open_checkpoints(task, file_path),
+                deadline=deadline,
+                scope=f"shard-{shard_index}",
+                pages=range(shard.page_start, shard.page_end),
+                max_chunks=MAX_CHUNKS_PER_SHARD,
+                lease=guard,
+            )
+            for chunk in chunks:
+                chunk.chunk_index += shard_index * SHARD_CHUNK_STRIDE
+            record_count("chunks", len(chunks))
+            check_deadline(deadline)
+            guard.check()
+            with track_stage("store"):
+                store.store_chunks(chunks, tenant=task.user_email)
+
+        shard.status = "completed"
+        shard.chunk_count = len(chunks)
+        shard.summary_vector = pack_vector(embedding_sum(chunks))
+        shard.completed_at = datetime.datetime.now(datetime.timezone.utc)
+        shard.processing_metrics = json.dumps(timer.as_dict())
+        db.commit()
+
+    except StaleDataError:
+        # The shard rows were replaced by a newer upload of the document
+        db.rollback()
+        raise IngestionSuperseded(f"Shard {shard_index} of task {task_id} was removed")
+
+    except DeadlineExceeded:
+        shard.processing_metrics = json.dumps(timer.as_dict())
+        db.commit()
+        raise
+
+    except IngestionSuperseded:
+        db.rollback()
+        raise
+
+    except Exception as e:
+        db.rollback()
+        # A stale shard failing must not fail the newer version of the task
+        guard.check()
+        shard.status = "failed"
+        shard.error_message = str(e)
+        shard.processing_metrics = json.dumps(timer.as_dict())
+        mark_task_as_failed(
+            task,
+            f"Shard {shard_index} (pages {shard.page_start + 1}-{shard.page_end}) "
+            f"failed: {e}",
+        )
+        db.commit()
+        INGESTION_DOCUMENTS.labels(status="failed").inc()
+        raise Exception(f"Error processing document shard: {e}")
+
+    finally:
+        db.close()
+
+    complete_sharded_task(task_id, version)
+
+
+def complete_sharded_task(task_id: int, version: int = None) -> bool:
+    """
+    Mark a sharded task completed once none of its shards is unfinished.
+    The check and the update are one statement, so exactly one of the
+    shards finishing last completes the task, and only while the task is
+    still at `version`.
+    :return: True when this call completed the task
+    """
+    db = next(get_db())
+    try:
+        unfinished = (
+            select(models.DocumentShard.id)
+            .where(
+                models.DocumentShard.task_id == task_id,
+                models.DocumentShard.status != "completed",
+            )
+            .exists()
+        )
+        completed = (
+            db.query(models.TaskStatus)
+            .filter(
+                models.TaskStatus.task_id == task_id,
+                models.TaskStatus.status == "processing",
+                ~unfinished,
+                *(
+                    [models.TaskStatus.ingest_version == version]
+                    if version is not None
+                    else []
+                ),
+            )
+            .update(
+                {
+                    models.TaskStatus.status: "completed",
+                    models.TaskStatus.completed_at: datetime.datetime.now(
+                        datetime.timezone.utc
+                    ),
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if not completed:
+            return False
+
+        # Total worker time of the fan-out pass and every shard
+        task = (
+            db.query(models.TaskStatus)
+            .filter(models.TaskStatus.task_id == task_id)
+            .first()
+        )
+        shards = (
+            db.query(models.DocumentShard)
+            .filter(models.DocumentShard.task_id == task_id)
+            .all()
+        )
+        timer = StageTimer()
+        runs = [task.processing_metrics] + [
+            shard.processing_metrics for shard in shards
+        ]
+        for run in filter(None, runs):
+            metrics = json.loads(run)
+            for stage, seconds in metrics["stages"].items():
+                timer.add_duration(stage, seconds)
+            for name, value in metrics["counts"].items():
+                timer.count(name, value)
+        task.processing_metrics = json.dumps(timer.as_dict())
+        sums = [
+            unpack_vector(shard.summary_vector)
+            for shard in shards
+            if shard.summary_vector is not None
+        ]
+        task.summary_vector = summary_vector(sum(sums) if sums else None)
+        db.commit()
+        query_cache.invalidate(task_id)
+        INGESTION_DOCUMENTS.labels(status="completed").inc()
+        if CHECKPOINTS_ENABLED:
+            Checkpoints(get_artifact_store(), task_id, "").clear()
+        return True
+    finally:
+        db.close()
@@ -0,0 +1,188 @@
+# Document processing job queue: SQS in production, an in-process worker
+# pool for development
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+
+import boto3
+
+from ..core.config import (
+    JOB_QUEUE,
+    LOCAL_JOB_QUEUE_PATH,
+    LOCAL_JOB_WORKERS,
+    LOCAL_LARGE_JOB_WORKERS,
+    SQS_LARGE_QUEUE_URL,
+    SQS_QUEUE_URL,
+)
+from ..core.metrics import track_external_call
+
+
+class JobQueue:
+    """
+    Interface of the queue `/upload-document` hands processing jobs to.
+    A job is a JSON-serialisable dict consumed by `app.worker.handle_message`;
+    its "lane" ("small" or "large", see `scheduling`) picks the queue.
+    """
+
+    name = ""
+
+    def enqueue(self, job: dict, delay_seconds: int = 0):
+        raise NotImplementedError
+
+
+class SQSJobQueue(JobQueue):
+    """
+    Sends jobs to SQS, consumed by the worker Lambda (`app.worker.lambda_handler`).
+    Large jobs go to SQS_LARGE_QUEUE_URL, whose event source mapping should
+    have a low maximum concurrency so they cannot starve small jobs.
+    """
+
+    name = "sqs"
+
+    def __init__(self, queue_url: str = None, large_queue_url: str = None):
+        self.queue_urls = {
+            "small": queue_url or SQS_QUEUE_URL,
+            "large": large_queue_url or SQS_LARGE_QUEUE_URL,
+        }
+
+    def enqueue(self, job: dict, delay_seconds: int = 0):
+        sqs = boto3.client("sqs")
+        message = {
+            "QueueUrl": self.queue_urls.get(job.get("lane"), self.queue_urls["small"]),
+            "MessageBody": json.dumps(job),
+        }
+        if delay_seconds:
+            # SQS allows delays of at most 15 minutes
+            message["DelaySeconds"] = min(int(delay_seconds), 900)
+        with track_external_call("sqs", "send_message"):
+            sqs.send_message(**message)
+
+
+class LocalJobQueue(JobQueue):
+    """
+    Processes jobs on background threads in the API process, through the
+    same `handle_message` as the worker Lambda. Each lane has its own queue
+    and worker pool.
+
+    With `db_path` jobs are also written to a SQLite table and only removed
+    once processed, so jobs queued or running when the process stopped are
+    picked up again on the next start.
+    """
+
+    name = "local"
+
+    def __init__(
+        self, workers: int = None, large_workers: int = None, db_path: str = None
+    ):
+        self.db_path = db_path if db_path is not None else LOCAL_JOB_QUEUE_PATH
+        self._lanes = {"small": queue.Queue(), "large": queue.Queue()}
+        self._timers = []
+        self._lock = threading.Lock()
+        if self.db_path:
+            self._execute(
+                "CREATE TABLE IF NOT EXISTS jobs "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL)"
+            )
+            for job_id, body in self._execute("SELECT id, body FROM jobs ORDER BY id"):
+                self._put(job_id, json.loads(body))
+        pools = {
+            "small": LOCAL_JOB_WORKERS if workers is None else workers,
+            "large": LOCAL_LARGE_JOB_WORKERS
+            if large_workers is None
+            else large_workers,
+        }
+        self._threads = [
+            threading.Thread(
+                target=self._work,
+                args=(self._lanes[lane],),
+                name=f"job-worker-{lane}-{i}",
+                daemon=True,
+            )
+            for lane, count in pools.items()
+            for i in range(count)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def _execute(self, sql: str, params=()):
+        """
+        Run one statement in its own connection; returns the fetched rows,
+        or the new row id for an INSERT.
+        """
+        with self._lock, closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            with conn:
+                cursor = conn.execute(sql, params)
+                rows = cursor.fetchall()
+            return cursor.lastrowid if sql.startswith("INSERT") else rows
+
+    def _put(self, job_id, job: dict):
+        self._lanes.get(job.get("lane"), self._lanes["small"]).put((job_id, job))
+
+    def enqueue(self, job: dict, delay_seconds: int = 0):
+        job_id = None
+        if self.db_path:
+            job_id = self._execute(
+                "INSERT INTO jobs (body) VALUES (?)", (json.dumps(job),)
+            )
+        if not delay_seconds:
+            self._put(job_id, job)
+            return
+        timer = threading.Timer(delay_seconds, self._put, args=(job_id, job))
+        timer.daemon = True
+        with self._lock:
+            self._timers = [t for t in self._timers if t.is_alive()] + [timer]
+        timer.start()
+
+    def _work(self, jobs: queue.Queue):
+        # Imported here: the worker imports the ingestion pipeline
+        from ..worker import handle_message
+
+        while True:
+            job_id, job = jobs.get()
+            try:
+                handle_message(job)
+            except Exception as e:
+                # process_document has already marked the task as failed
+                print(f"Error processing job {job}: {e}")
+            finally:
+                if job_id is not None:
+                    self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                jobs.task_done()
+
+    def join(self):
+        """
+        Block until every queued and delayed job has been processed.
+        """
+        while True:
+            with self._lock:
+                timers = list(self._timers)
+            for timer in timers:
+                timer.join()
+            for jobs in self._lanes.values():
+                jobs.join()
+            with self._lock:
+                if not any(t.is_alive() for t in self._timers):
+                    return
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_job_queue(backend: str = None) -> JobQueue:
+    """
+    Return the job queue selected by the JOB_QUEUE config.
+    Queues (and the local worker pool) are created once per process.
+    """
+    backend = backend or JOB_QUEUE
+    with _queues_lock:
+        if backend not in _queues:
+            if backend == "sqs":
+                _queues[backend] = SQSJobQueue()
+            elif backend == "local":
+                _queues[backend] = LocalJobQueue()
+            else:
+                raise ValueError(f"Unsupported job queue: {backend}")
+        return _queues[backend]
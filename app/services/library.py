@@ -0,0 +1,161 @@
+# Search across all documents of a user: per-document summary vectors pick
+# the candidate documents, then chunks are searched only within those
+import numpy as np
+from sqlalchemy import func
+
+from ..core import models
+from ..core.config import LIBRARY_CANDIDATE_DOCUMENTS, LIBRARY_SCANNED_DOCUMENTS
+from .chunks import embedding_matrix
+
+
+def embedding_sum(chunks: list[dict]):
+    """
+    Sum of the normalized 'embedding' of the chunks, or None without chunks.
+    Sums of a document's parts add up to the sum of the whole document.
+    """
+    if not chunks:
+        return None
+    return normalized_sum(embedding_matrix(chunks))
+
+
+def normalized_sum(matrix: np.ndarray):
+    """
+    Sum of the rows of a matrix of vectors, each normalized first.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).sum(axis=0)
+
+
+def pack_vector(vector) -> bytes:
+    return None if vector is None else np.asarray(vector, np.float32).tobytes()
+
+
+def unpack_vector(data: bytes):
+    return None if data is None else np.frombuffer(data, dtype=np.float32)
+
+
+def summary_vector(vector_sum) -> bytes:
+    """
+    The packed summary vector of a document: its normalized centroid.
+    """
+    if vector_sum is None:
+        return None
+    norm = np.linalg.norm(vector_sum)
+    return pack_vector(vector_sum / norm if norm else vector_sum)
+
+
+def candidate_tasks(
+    db,
+    user_email: str,
+    vector,
+    limit: int = LIBRARY_CANDIDATE_DOCUMENTS,
+    scanned: int = LIBRARY_SCANNED_DOCUMENTS,
+) -> list[models.TaskStatus]:
+    """
+    The completed documents of a user closest to the query vector by
+    summary vector, best first, among the `scanned` most recently completed
+    ones. Documents processed before summary vectors existed have none;
+    the most recent of them fill what is left of the `scanned` budget and
+    are always candidates until backfill_summary_vectors gives them one.
+    Documents embedded with another number of dimensions cannot be
+    compared and are skipped.
+    """
+    query = np.asarray(vector, dtype=np.float32)
+    completed = (
+        models.TaskStatus.user_email == user_email,
+        models.TaskStatus.status == "completed",
+    )
+    rows = (
+        db.query(models.TaskStatus.task_id, models.TaskStatus.summary_vector)
+        .filter(
+            *completed,
+            func.length(models.TaskStatus.summary_vector) == query.nbytes,
+        )
+        .order_by(models.TaskStatus.completed_at.desc())
+        .limit(scanned)
+        .all()
+    )
+    task_ids = [task_id for task_id, _ in rows]
+    if len(rows) > limit:
+        matrix = np.stack([unpack_vector(summary) for _, summary in rows])
+        scores = matrix @ query
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        task_ids = [task_ids[i] for i in top[np.argsort(-scores[top])]]
+    by_id = {
+        task.task_id: task
+        for task in db.query(models.TaskStatus).filter(
+            models.TaskStatus.task_id.in_(task_ids)
+        )
+    }
+    unsummarized = []
+    if len(rows) < scanned:
+        unsummarized = (
+            db.query(models.TaskStatus)
+            .filter(*completed, models.TaskStatus.summary_vector.is_(None))
+            .order_by(models.TaskStatus.completed_at.desc())
+            .limit(scanned - len(rows))
+            .all()
+        )
+    return [by_id[task_id] for task_id in task_ids] + unsummarized
+
+
+def search_library(
+    db, store, user_email: str, vector, limit: int = 3, documents: int = None
+) -> list[dict]:
+    """
+    The `limit` chunks closest to the query vector across the candidate
+    documents of a user, each with the 'task_id' and 'file_name' of its
+    document.
+    """
+    tasks = candidate_tasks(
+        db, user_email, vector, documents or LIBRARY_CANDIDATE_DOCUMENTS
+    )
+    if not tasks:
+        return []
+    by_document = {task.file_path: task for task in tasks}
+    hits = store.search_documents(
+        list(by_document), vector, limit=limit, tenant=user_email
+    )
+    return [
+        {
+            **hit,
+            "task_id": by_document[hit["document_name"]].task_id,
+            "file_name": by_document[hit["document_name"]].file_name,
+        }
+        for hit in hits
+    ]
+
+
+def backfill_summary_vectors(db, store, batch_size: int = 100) -> dict:
+    """
+    Compute the summary vector of the completed documents processed before
+    summary vectors were stored, newest first, from the chunk vectors kept
+    in the vector store. Documents without stored chunks are left as is.
+    :return: Numbers of documents updated and skipped
+    """
+    task_ids = [
+        task_id
+        for (task_id,) in db.query(models.TaskStatus.task_id)
+        .filter(
+            models.TaskStatus.status == "completed",
+            models.TaskStatus.summary_vector.is_(None),
+        )
+        .order_by(models.TaskStatus.completed_at.desc())
+    ]
+    updated = skipped = 0
+    for start in range(0, len(task_ids), batch_size):
+        tasks = (
+            db.query(models.TaskStatus)
+            .filter(models.TaskStatus.task_id.in_(task_ids[start : start + batch_size]))
+            .all()
+        )
+        for task in tasks:
+            vectors = store.document_vectors(task.file_path, tenant=task.user_email)
+            if len(vectors) == 0:
+                skipped += 1
+                continue
+            task.summary_vector = summary_vector(normalized_sum(vectors))
+            updated += 1
+        db.commit()
+    return {"updated": updated, "skipped": skipped}
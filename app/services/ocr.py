@@ -0,0 +1,219 @@
+# OCR engines for scanned PDFs: Tesseract in the worker or AWS Textract
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import boto3
+import fitz
+import pytesseract
+from botocore.exceptions import ClientError
+from PIL import Image
+
+from ..core.config import (
+    BUCKET_NAME,
+    OCR_ENGINE,
+    TEXTRACT_ASYNC_MIN_PAGES,
+    TEXTRACT_CONCURRENCY,
+    TEXTRACT_MAX_POLL_SECONDS,
+    TEXTRACT_POLL_SECONDS,
+    TEXTRACT_TIMEOUT_SECONDS,
+)
+from ..core.metrics import in_current_context, record_count, track_external_call
+
+OCR_DPI = 300
+
+
+class OCREngine:
+    """
+    Interface for reading the text of scanned PDF pages.
+    """
+
+    name = ""
+
+    def version(self) -> str:
+        """
+        Identifies the engine's output; cached page text of another version
+        is never reused.
+        """
+        raise NotImplementedError
+
+    def ocr_pages(
+        self, pdf, page_nums: list[int], s3_key: str = None
+    ) -> Iterator[tuple[int, str]]:
+        """
+        Yield (page number, text) for the given pages of an open PDF.
+        :param s3_key: Key of the same PDF in BUCKET_NAME, if uploaded
+        """
+        raise NotImplementedError
+
+
+class TesseractOCR(OCREngine):
+    """
+    Tesseract run locally on every page rendered at OCR_DPI.
+    """
+
+    name = "tesseract"
+
+    def __init__(self):
+        self._version = None
+
+    def version(self):
+        if self._version is None:
+            try:
+                tesseract = pytesseract.get_tesseract_version()
+            except Exception as e:
+                print(f"Could not read Tesseract version: {e}")
+                tesseract = "unknown"
+            self._version = f"tesseract-{tesseract}-{OCR_DPI}dpi"
+        return self._version
+
+    def ocr_pages(self, pdf, page_nums, s3_key=None):
+        for page_num in page_nums:
+            pix = pdf[page_num].get_pixmap(dpi=OCR_DPI)
+            img = Image.open(io.BytesIO(pix.tobytes()))
+            yield page_num, pytesseract.image_to_string(img)
+
+
+def _lines_by_page(blocks: list[dict], lines: dict):
+    for block in blocks:
+        if block["BlockType"] == "LINE":
+            lines.setdefault(block.get("Page", 1) - 1, []).append(block["Text"])
+
+
+class TextractOCR(OCREngine):
+    """
+    AWS Textract. A whole document of at least `async_min_pages` pages
+    already in S3 is read by one asynchronous text detection job, polled
+    with exponential backoff. Other pages (shards, small documents, pages
+    missing from the cache) are sent as single-page PDFs to the synchronous
+    API, `concurrency` at a time.
+    """
+
+    name = "textract"
+
+    def __init__(
+        self,
+        bucket: str = BUCKET_NAME,
+        concurrency: int = TEXTRACT_CONCURRENCY,
+        async_min_pages: int = TEXTRACT_ASYNC_MIN_PAGES,
+        poll_seconds: float = TEXTRACT_POLL_SECONDS,
+        max_poll_seconds: float = TEXTRACT_MAX_POLL_SECONDS,
+        timeout_seconds: float = TEXTRACT_TIMEOUT_SECONDS,
+        client=None,
+    ):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.async_min_pages = async_min_pages
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+        self.timeout_seconds = timeout_seconds
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client("textract")
+        return self._client
+
+    def version(self):
+        return "textract"
+
+    def ocr_pages(self, pdf, page_nums, s3_key=None):
+        page_nums = list(page_nums)
+        try:
+            if (
+                s3_key
+                and len(page_nums) == len(pdf)
+                and len(page_nums) >= self.async_min_pages
+            ):
+                pages = self._detect_document(s3_key)
+                for page_num in page_nums:
+                    yield page_num, "\n".join(pages.get(page_num, []))
+            else:
+                yield from self._detect_pages(pdf, page_nums)
+        except ClientError as e:
+            raise Exception(f"Error processing document with AWS Textract: {e}")
+
+    def _detect_pages(self, pdf, page_nums):
+        # PyMuPDF documents are not thread safe: split the pages up front
+        documents = []
+        for page_num in page_nums:
+            with fitz.open() as single:
+                single.insert_pdf(pdf, from_page=page_num, to_page=page_num)
+                documents.append(single.tobytes())
+
+        def detect(document):
+            with track_external_call("textract", "detect_document_text"):
+                response = self.client.detect_document_text(
+                    Document={"Bytes": document}
+                )
+            lines = {}
+            _lines_by_page(response["Blocks"], lines)
+            return "\n".join(lines.get(0, []))
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.concurrency, len(documents)))
+        ) as executor:
+            yield from zip(
+                page_nums, executor.map(in_current_context(detect), documents)
+            )
+
+    def _detect_document(self, s3_key: str) -> dict:
+        """
+        Lines of every page of a PDF in S3, keyed by page number.
+        """
+        with track_external_call("textract", "start_document_text_detection"):
+            job_id = self.client.start_document_text_detection(
+                DocumentLocation={"S3Object": {"Bucket": self.bucket, "Name": s3_key}}
+            )["JobId"]
+        record_count("textract_jobs", 1)
+
+        deadline = time.monotonic() + self.timeout_seconds
+        delay = self.poll_seconds
+        while True:
+            time.sleep(delay)
+            with track_external_call("textract", "get_document_text_detection"):
+                response = self.client.get_document_text_detection(JobId=job_id)
+            status = response["JobStatus"]
+            if status in ("SUCCEEDED", "PARTIAL_SUCCESS"):
+                break
+            if status != "IN_PROGRESS":
+                raise Exception(
+                    f"Textract job {job_id} {status}: {response.get('StatusMessage')}"
+                )
+            if time.monotonic() > deadline:
+                raise Exception(
+                    f"Textract job {job_id} not done after {self.timeout_seconds}s"
+                )
+            delay = min(delay * 2, self.max_poll_seconds)
+        if status == "PARTIAL_SUCCESS":
+            print(f"Textract job {job_id} only partially succeeded")
+
+        lines = {}
+        _lines_by_page(response["Blocks"], lines)
+        while response.get("NextToken"):
+            with track_external_call("textract", "get_document_text_detection"):
+                response = self.client.get_document_text_detection(
+                    JobId=job_id, NextToken=response["NextToken"]
+                )
+            _lines_by_page(response["Blocks"], lines)
+        return lines
+
+
+_engines = {}
+
+
+def get_ocr_engine(engine: str = None) -> OCREngine:
+    """
+    Return the OCR engine selected by the OCR_ENGINE config.
+    """
+    engine = engine or OCR_ENGINE
+    if engine not in _engines:
+        if engine == "tesseract":
+            _engines[engine] = TesseractOCR()
+        elif engine == "textract":
+            _engines[engine] = TextractOCR()
+        else:
+            raise ValueError(f"Unsupported OCR engine: {engine}")
+    return _engines[engine]
@@ -0,0 +1,125 @@
+# Cache of OCR text per PDF page, keyed by page content and OCR engine version
+import hashlib
+import threading
+
+from ..core.config import OCR_CACHE_ENABLED, OCR_CACHE_MAX_MB, OCR_CACHE_PREFIX
+from .artifacts import ArtifactStore, get_artifact_store
+
+# Eviction trims the cache to this fraction of its bound, so the store is
+# only listed again after that much new text was cached
+EVICT_TO_FRACTION = 0.9
+
+
+def page_hash(pdf, page_num: int) -> str:
+    """
+    Hash of what a page renders from: its content stream, the raw streams
+    of its images, its size and rotation. Identical pages in different
+    files (or uploads) share a hash.
+    """
+    page = pdf[page_num]
+    digest = hashlib.sha256(page.read_contents())
+    for image in page.get_images(full=True):
+        digest.update(pdf.xref_stream_raw(image[0]) or b"")
+    digest.update(f"{tuple(page.rect)}:{page.rotation}".encode())
+    return digest.hexdigest()
+
+
+class PageTextCache:
+    """
+    Extracted text per page, in an artifact store (local directory or S3),
+    so re-processing a file (new chunking, new embeddings, re-indexing)
+    never repeats OCR.
+
+    Entries are keyed by `page_hash` and the extractor version, so
+    upgrading Tesseract or changing the DPI starts a new namespace. The
+    cache is trimmed to `max_bytes` by deleting the least recently used
+    (local) or oldest written (S3, whose reads do not update
+    LastModified) entries.
+
+    The store is listed once per process; afterwards a running size of the
+    cache, grown by every entry written, decides when it must be listed
+    and trimmed again.
+    """
+
+    def __init__(
+        self,
+        store: ArtifactStore,
+        prefix: str = None,
+        max_bytes: int = None,
+    ):
+        self.store = store
+        self.prefix = OCR_CACHE_PREFIX if prefix is None else prefix
+        self.max_bytes = (
+            OCR_CACHE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        )
+        # Size of the cache when last listed plus the text written since
+        self._estimated_bytes = None
+        self._lock = threading.Lock()
+
+    def _key(self, extractor: str, digest: str) -> str:
+        return f"{self.prefix}{extractor}/{digest[:2]}/{digest}.txt"
+
+    def get(self, extractor: str, digest: str):
+        try:
+            data = self.store.get(self._key(extractor, digest))
+        except Exception as e:
+            print(f"Error reading OCR cache: {e}")
+            return None
+        return None if data is None else data.decode("utf-8")
+
+    def put(self, extractor: str, digest: str, text: str):
+        data = text.encode("utf-8")
+        try:
+            self.store.put(self._key(extractor, digest), data)
+        except Exception as e:
+            print(f"Error writing OCR cache: {e}")
+            return
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += len(data)
+
+    def evict(self):
+        """
+        When the cache may have outgrown `max_bytes`, list it and delete
+        the least recently used entries until it is back under
+        EVICT_TO_FRACTION of the bound.
+        """
+        with self._lock:
+            if (
+                self._estimated_bytes is not None
+                and self._estimated_bytes <= self.max_bytes
+            ):
+                return
+            try:
+                entries = self.store.list_blobs(self.prefix)
+                total = sum(size for _, size, _ in entries)
+                if total > self.max_bytes:
+                    target = self.max_bytes * EVICT_TO_FRACTION
+                    expired = []
+                    for key, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                        if total <= target:
+                            break
+                        expired.append(key)
+                        total -= size
+                    self.store.delete(expired)
+                self._estimated_bytes = total
+            except Exception as e:
+                print(f"Error evicting OCR cache: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_page_cache():
+    """
+    The OCR page cache in the configured artifact store, or None when
+    OCR_CACHE_ENABLED is off.
+    """
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = PageTextCache(get_artifact_store())
+        return _cache
@@ -4,76 +4,99 @@ import fitz
 from docx import Document
 import json
 
-import pytesseract
-from PIL import Image
-import io
-import boto3
-from botocore.exceptions import ClientError
-from ..core.config import BUCKET_NAME
+from ..core.metrics import record_count, track_stage
+from .ocr import get_ocr_engine
+from .page_cache import get_page_cache, page_hash
 
 
-def is_usable_text_pdf(file_path, min_chars=100):
+def ocr_extractor_version():
+    """
+    Identifies the OCR output of the configured engine (e.g. Tesseract
+    version and rendering DPI). Cached page text from another version is
+    never reused.
+    """
+    return get_ocr_engine().version()
+
+
+def is_usable_text_pdf(file_path, min_chars=100, pages=None):
     total_text = ""
     with fitz.open(file_path) as doc:
-        for page in doc:
-            text = page.get_text()
+        for page_num in pages or range(len(doc)):
+            text = doc[page_num].get_text()
             total_text += text.strip()
 
     return len(total_text) > min_chars
 
 
-def ocr_pdf(file_path):
+def ocr_pdf(file_path, pages=None, s3_key=None):
     """
-    Uses Tesseract OCR to extract text from a PDF file for development.
+    Extract the text of a scanned PDF with the configured OCR engine
+    (OCR_ENGINE). Pages already in the OCR page cache are not OCR'd again.
     :param file_path: Path to the PDF file
+    :param pages: Page numbers to read (default: all)
+    :param s3_key: Key of the PDF in S3, letting Textract read it from there
     :return: Extracted text from the PDF
     """
-    text = ""
+    engine = get_ocr_engine()
+    cache = get_page_cache()
+    version = ocr_extractor_version() if cache else None
+    texts = {}
+    digests = {}
     with fitz.open(file_path) as pdf:
-        for page_num in range(len(pdf)):
-            pix = pdf[page_num].get_pixmap(dpi=300)
-            img = Image.open(io.BytesIO(pix.tobytes()))
-            page_text = pytesseract.image_to_string(img)
-            text += f"\n\n--- Page {page_num+1} ---\n{page_text}"
-    return text
-
-
-def aws_ocr_pdf(file_path):
-    """
-    Uses AWS Textract to perform OCR on a PDF file stored in S3.
-    :param file_path: Path to the PDF file in S3
-    :return: Extracted text from the PDF
-    """
-    client = boto3.client("textract")
-
-    try:
-        response = client.detect_document_text(
-            Document={"S3Object": {"Bucket": BUCKET_NAME, "Name": file_path}}
-        )
-
-        text = ""
-        for item in response["Blocks"]:
-            if item["BlockType"] == "LINE":
-                text += item["Text"] + "\n"
-
-        return text.strip()
-    except ClientError as e:
-        raise Exception(f"Error processing document with AWS Textract: {e}")
-
-
-def extract_text_with_pymupdf(file_path):
+        pages = pages or range(len(pdf))
+        record_count("pages", len(pages))
+        if cache:
+            for page_num in pages:
+                digests[page_num] = page_hash(pdf, page_num)
+                page_text = cache.get(version, digests[page_num])
+                if page_text is not None:
+                    texts[page_num] = page_text
+        missing = [page_num for page_num in pages if page_num not in texts]
+        if missing:
+            for page_num, page_text in engine.ocr_pages(pdf, missing, s3_key=s3_key):
+                texts[page_num] = page_text
+                if cache:
+                    cache.put(version, digests[page_num], page_text)
+    hits = len(pages) - len(missing)
+    record_count("ocr_pages", len(missing))
+    record_count("ocr_cache_hits", hits)
+    if cache and missing:
+        cache.evict()
+    return "".join(
+        f"\n\n--- Page {page_num+1} ---\n{texts[page_num]}" for page_num in pages
+    )
+
+
+def extract_text_with_pymupdf(file_path, pages=None):
     doc = pymupdf.open(file_path)
+    pages = pages or range(len(doc))
+    record_count("pages", len(pages))
     text = ""
-    for page in doc:
-        text += page.get_text()
+    for page_num in pages:
+        text += doc[page_num].get_text()
     return text
 
 
-def parse_pdf(file_path, s3_key=None):
-    if is_usable_text_pdf(file_path):
-        text = extract_text_with_pymupdf(file_path)
+def pdf_page_count(file_path):
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+
+def parse_pdf(file_path, s3_key=None, pages=None):
+    """
+    Extract the text of a PDF, falling back to OCR for scanned documents.
+    :param file_path: Path to the PDF file
+    :param s3_key: Key of the PDF in S3, if it was uploaded there
+    :param pages: Page numbers to read (default: all), e.g. a shard's range
+    """
+    with track_stage("is_usable_text_pdf"):
+        usable = is_usable_text_pdf(file_path, pages=pages)
+    if usable:
+        with track_stage("extract_text"):
+            text = extract_text_with_pymupdf(file_path, pages=pages)
     else:
-        text = ocr_pdf(file_path)
+        with track_stage("ocr"):
+            text = ocr_pdf(file_path, pages=pages, s3_key=s3_key)
     return text
 
 
@@ -93,7 +116,6 @@ def parse_json(file_path):
         json_array = json.load(f)
         if json_array and isinstance(json_array, list):
             for obj in json_array:
-                flat_json = flatten_json(json_array)
                 snippets += json_to_text_snippet(obj)
         else:
             flat_json = flatten_json(json_array)
@@ -0,0 +1,114 @@
+# Cache of question answers per document
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from ..core.config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL_SECONDS
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize a question so trivially different spellings share a cache entry.
+    """
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+class QueryCache:
+    """
+    LRU cache with a TTL mapping (task_id, normalized question, limit)
+    to the answers returned by /document/query.
+
+    Every entry also stores the ingestion `version` of the task it was
+    computed from. A lookup with a different version is a miss, so answers
+    computed before a re-ingest are never served, even when the re-ingest
+    ran in another process (e.g. the worker Lambda).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = QUERY_CACHE_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._keys_by_task = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _key(self, task_id, question: str, limit: int):
+        return (str(task_id), normalize_question(question), limit)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        task_keys = self._keys_by_task.get(key[0])
+        if task_keys is not None:
+            task_keys.discard(key)
+            if not task_keys:
+                del self._keys_by_task[key[0]]
+
+    def get(self, task_id, question: str, limit: int, version=None):
+        """
+        Return the cached answers, or None on a miss.
+        """
+        key = self._key(task_id, question, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_version, answers = entry
+                if expires_at > time.monotonic() and entry_version == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return answers
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def set(self, task_id, question: str, limit: int, answers, version=None):
+        key = self._key(task_id, question, limit)
+        with self._lock:
+            self._entries[key] = (
+                time.monotonic() + self.ttl_seconds,
+                version,
+                answers,
+            )
+            self._entries.move_to_end(key)
+            self._keys_by_task.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, task_id):
+        """
+        Drop every cached answer of a task.
+        """
+        with self._lock:
+            for key in list(self._keys_by_task.get(str(task_id), ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_task.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+query_cache = QueryCache()
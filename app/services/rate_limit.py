@@ -0,0 +1,227 @@
+# Admission control for the expensive API paths: token buckets per user and
+# across all users, and a cap on queries in flight
+import math
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy.exc import IntegrityError
+
+from ..core import models
+from ..core.config import (
+    MAX_INFLIGHT_QUERIES,
+    QUERY_RATE_GLOBAL,
+    QUERY_RATE_PER_USER,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_RETRY_AFTER_SECONDS,
+    RATE_LIMIT_STORE,
+    UPLOAD_RATE_GLOBAL,
+    UPLOAD_RATE_PER_USER,
+)
+from ..core.database import SessionLocal
+
+# Requests per minute per user and across all users, by action. A bucket
+# holds a minute's worth of tokens, so a full minute's quota may be spent
+# in one burst.
+RATE_LIMITS = {
+    "upload": (UPLOAD_RATE_PER_USER, UPLOAD_RATE_GLOBAL),
+    "query": (QUERY_RATE_PER_USER, QUERY_RATE_GLOBAL),
+}
+
+
+class RateLimitExceeded(Exception):
+    """
+    A request was refused: 429 when over a rate limit, 503 when too many
+    requests are in flight. Clients may retry after `retry_after` seconds.
+    """
+
+    def __init__(self, message: str, retry_after: float, status_code: int = 429):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+
+
+def _refill(tokens: float, elapsed: float, rate: float, capacity: float) -> float:
+    return min(capacity, tokens + max(0.0, elapsed) * rate)
+
+
+class BucketStore:
+    """
+    Interface of the place token buckets are kept.
+    """
+
+    name = ""
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        """
+        Take `cost` tokens from a bucket refilled with `rate` tokens per
+        second up to `capacity`, created full.
+        :return: 0 when the tokens were taken, otherwise the seconds until
+            the bucket holds enough of them
+        """
+        raise NotImplementedError
+
+    def refund(self, key: str, capacity: float, cost: float = 1):
+        """
+        Put back `cost` tokens taken from a bucket, up to its `capacity`.
+        """
+        raise NotImplementedError
+
+
+class MemoryBucketStore(BucketStore):
+    """
+    Buckets of this process only, for development and single instances.
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, now - updated, rate, capacity)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                return (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            return 0.0
+
+    def refund(self, key, capacity, cost=1):
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(capacity, tokens + cost), updated)
+
+
+class SQLBucketStore(BucketStore):
+    """
+    Buckets in the `rate_limit_bucket` table, shared by every API instance
+    using the same DATABASE_URL. A bucket row is locked while it is updated.
+    """
+
+    name = "sql"
+
+    def take(self, key, rate, capacity, cost=1):
+        for attempt in range(2):
+            db = SessionLocal()
+            try:
+                now = time.time()
+                bucket = (
+                    db.query(models.RateLimitBucket)
+                    .filter(models.RateLimitBucket.key == key)
+                    .with_for_update()
+                    .first()
+                )
+                if bucket is None:
+                    bucket = models.RateLimitBucket(
+                        key=key, tokens=capacity, updated_at=now
+                    )
+                    db.add(bucket)
+                tokens = _refill(bucket.tokens, now - bucket.updated_at, rate, capacity)
+                wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+                bucket.tokens = tokens if wait else tokens - cost
+                bucket.updated_at = now
+                db.commit()
+                return wait
+            except IntegrityError:
+                # Another instance created the bucket first
+                db.rollback()
+                if attempt:
+                    raise
+            finally:
+                db.close()
+
+    def refund(self, key, capacity, cost=1):
+        db = SessionLocal()
+        try:
+            bucket = (
+                db.query(models.RateLimitBucket)
+                .filter(models.RateLimitBucket.key == key)
+                .with_for_update()
+                .first()
+            )
+            if bucket is not None:
+                bucket.tokens = min(capacity, bucket.tokens + cost)
+                db.commit()
+        finally:
+            db.close()
+
+
+_stores = {}
+
+
+def get_bucket_store(backend: str = None) -> BucketStore:
+    """
+    Return the bucket store selected by the RATE_LIMIT_STORE config.
+    """
+    backend = backend or RATE_LIMIT_STORE
+    if backend not in _stores:
+        if backend == "memory":
+            _stores[backend] = MemoryBucketStore()
+        elif backend == "sql":
+            _stores[backend] = SQLBucketStore()
+        else:
+            raise ValueError(f"Unsupported rate limit store: {backend}")
+    return _stores[backend]
+
+
+def admit(action: str, user_email: str, cost: int = 1):
+    """
+    Take `cost` requests of an action from the user's and the global
+    bucket, raising RateLimitExceeded when either is empty. A request the
+    global bucket refuses gets its tokens back in the user's bucket, so
+    users are not charged while everyone is throttled.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+    per_user, total = RATE_LIMITS[action]
+    store = get_bucket_store()
+    user_key = f"{action}:user:{user_email}"
+    user_cost = min(cost, per_user)
+    wait = store.take(user_key, per_user / 60, per_user, user_cost)
+    if wait:
+        raise RateLimitExceeded(f"Too many {action} requests", wait)
+    wait = store.take(action, total / 60, total, min(cost, total))
+    if wait:
+        store.refund(user_key, per_user, user_cost)
+        raise RateLimitExceeded(f"Too many {action} requests", wait)
+
+
+class ConcurrencyLimiter:
+    """
+    At most `limit` holders at once; further callers are refused at once
+    rather than queued.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._slots = threading.BoundedSemaphore(limit)
+
+    @contextmanager
+    def slot(self, name: str = "requests"):
+        if not self._slots.acquire(blocking=False):
+            raise RateLimitExceeded(
+                f"Too many {name} in flight",
+                RATE_LIMIT_RETRY_AFTER_SECONDS,
+                status_code=503,
+            )
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+query_limiter = ConcurrencyLimiter(MAX_INFLIGHT_QUERIES)
+
+
+def query_slot():
+    """
+    Hold one of the MAX_INFLIGHT_QUERIES query slots for a request.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return nullcontext()
+    return query_limiter.slot("queries")
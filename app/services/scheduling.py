@@ -0,0 +1,419 @@
+# Cost-based lanes and per-user concurrency caps for ingestion jobs
+import datetime
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+import fitz
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+
+from ..core import models
+from ..core.config import (
+    INGEST_LEASE_SECONDS,
+    JOB_STALE_SECONDS,
+    SMALL_JOB_MAX_COST,
+    USER_MAX_LARGE_JOBS,
+    USER_MAX_SMALL_JOBS,
+)
+from ..core.database import get_db
+from ..core.metrics import JOB_WAIT_DURATION, TASK_STAGE_DURATION
+
+LANES = ("small", "large")
+USER_JOB_CAPS = {"small": USER_MAX_SMALL_JOBS, "large": USER_MAX_LARGE_JOBS}
+
+# Rough processing seconds per MB and per page, including embedding and storing
+BASE_COST = 1.0
+COST_PER_MB = 5.0
+COST_PER_TEXT_PAGE = 0.05
+COST_PER_OCR_PAGE = 3.0
+# Completed tasks are exported to /metrics this long after they completed,
+# once the totals of a sharded task are written
+STAGE_METRICS_SETTLE_SECONDS = 60
+# Same threshold as parser.is_usable_text_pdf, over the sampled pages
+MIN_TEXT_CHARS = 100
+SAMPLED_PAGES = 3
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _as_utc(value: datetime.datetime) -> datetime.datetime:
+    # SQLite hands back naive datetimes
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def estimate_job_cost(file_name: str, contents: bytes) -> float:
+    """
+    Estimate the processing time of an upload in seconds, from its size,
+    type, page count and whether its pages need OCR.
+    :param file_name: Name of the uploaded file
+    :param contents: Bytes of the uploaded file
+    :return: Estimated cost in seconds
+    """
+    cost = BASE_COST + len(contents) / (1024 * 1024) * COST_PER_MB
+    if os.path.splitext(file_name)[1].lower() == ".pdf":
+        try:
+            with fitz.open(stream=contents, filetype="pdf") as doc:
+                pages = len(doc)
+                sample = "".join(
+                    doc[i].get_text().strip() for i in range(min(pages, SAMPLED_PAGES))
+                )
+        except Exception as e:
+            # Unreadable PDFs fail fast in the parser
+            print(f"Could not inspect PDF {file_name} for scheduling: {e}")
+            return round(cost, 2)
+        needs_ocr = len(sample) <= MIN_TEXT_CHARS
+        cost += pages * (COST_PER_OCR_PAGE if needs_ocr else COST_PER_TEXT_PAGE)
+    return round(cost, 2)
+
+
+def lane_for_cost(cost: float) -> str:
+    """
+    The lane a job of the given estimated cost is queued on.
+    """
+    return "small" if cost <= SMALL_JOB_MAX_COST else "large"
+
+
+def claim_task(task_id: int) -> bool:
+    """
+    Mark a queued task as started, unless its user already runs as many
+    jobs in the task's lane as the lane allows.
+
+    The check and the update are one statement. The cap is best effort
+    under concurrent claims, which may let it be exceeded briefly.
+    Jobs started more than JOB_STALE_SECONDS ago are treated as dead.
+    :param task_id: ID of the task to start
+    :return: False when the job should be retried later
+    """
+    db = next(get_db())
+    try:
+        task = (
+            db.query(models.TaskStatus)
+            .filter(models.TaskStatus.task_id == task_id)
+            .first()
+        )
+        if task is None:
+            return True
+
+        now = _utcnow()
+        lane = task.lane or "small"
+        running = aliased(models.TaskStatus)
+        active = (
+            select(func.count())
+            .select_from(running)
+            .where(
+                running.user_email == task.user_email,
+                # Tasks queued before lanes existed have none
+                func.coalesce(running.lane, "small") == lane,
+                running.status == "processing",
+                running.task_id != task.task_id,
+                running.started_at
+                > now - datetime.timedelta(seconds=JOB_STALE_SECONDS),
+            )
+            .scalar_subquery()
+        )
+        claimed = (
+            db.query(models.TaskStatus)
+            .filter(
+                models.TaskStatus.task_id == task_id,
+                active < USER_JOB_CAPS.get(lane, USER_MAX_SMALL_JOBS),
+            )
+            .update({models.TaskStatus.started_at: now}, synchronize_session=False)
+        )
+        db.commit()
+        if claimed and task.queued_at:
+            JOB_WAIT_DURATION.labels(lane=lane).observe(
+                (now - _as_utc(task.queued_at)).total_seconds()
+            )
+        return bool(claimed)
+    finally:
+        db.close()
+
+
+def upload_fingerprint(contents: bytes, structured_json: bool = False) -> str:
+    """
+    SHA-256 of an upload and how it is processed, stored as the task's
+    content_hash.
+    """
+    digest = hashlib.sha256(contents)
+    if structured_json:
+        digest.update(b"structured_json")
+    return digest.hexdigest()
+
+
+def job_in_flight(task: models.TaskStatus) -> bool:
+    """
+    Whether the task has a live job: a worker holds its lease, or it is
+    queued or running and not older than JOB_STALE_SECONDS.
+    """
+    if task.status != "processing":
+        return False
+    now = _utcnow()
+    if task.lease_expires_at is not None:
+        return _as_utc(task.lease_expires_at) > now
+    since = task.started_at or task.queued_at
+    return since is not None and _as_utc(since) > now - datetime.timedelta(
+        seconds=JOB_STALE_SECONDS
+    )
+
+
+class IngestionSuperseded(Exception):
+    """
+    The job belongs to an older upload of the document, or its upload was
+    already processed. The job is dropped.
+    """
+
+
+def check_version(task_id: int, version: int = None):
+    """
+    Raise IngestionSuperseded when the task was uploaded again after the
+    job of `version` was queued. Jobs without a version are never stale.
+    """
+    if version is None:
+        return
+    db = next(get_db())
+    try:
+        current = (
+            db.query(models.TaskStatus.ingest_version)
+            .filter(models.TaskStatus.task_id == task_id)
+            .scalar()
+        )
+    finally:
+        db.close()
+    if current != version:
+        raise IngestionSuperseded(
+            f"Task {task_id} version {version} superseded by version {current}"
+        )
+
+
+class ShardGuard:
+    """
+    Stops a shard job between stages once its task is no longer being
+    processed as version `version`: the document was uploaded again, or
+    another shard failed the task. Used in place of a lease, which shard
+    jobs do not hold.
+    """
+
+    def __init__(self, task_id: int, version: int = None):
+        self.task_id = task_id
+        self.version = version
+
+    def check(self):
+        db = next(get_db())
+        try:
+            task = (
+                db.query(models.TaskStatus.status, models.TaskStatus.ingest_version)
+                .filter(models.TaskStatus.task_id == self.task_id)
+                .first()
+            )
+        finally:
+            db.close()
+        if task is None:
+            raise IngestionSuperseded(f"Task {self.task_id} no longer exists")
+        if self.version is not None and task.ingest_version != self.version:
+            raise IngestionSuperseded(
+                f"Task {self.task_id} version {self.version} superseded "
+                f"by version {task.ingest_version}"
+            )
+        if task.status != "processing":
+            raise IngestionSuperseded(
+                f"Task {self.task_id} is {task.status}, stopping its shards"
+            )
+
+
+class IngestionLease:
+    """
+    Exclusive hold of a task by the worker processing version `version` of
+    it, so two jobs never delete and store the same document at once.
+    The lease expires INGEST_LEASE_SECONDS after it was last renewed,
+    letting another worker take over from one that died.
+    """
+
+    def __init__(self, task_id: int, version: int = None):
+        self.task_id = task_id
+        self.version = version
+        self.owner = uuid.uuid4().hex
+
+    def _current(self, query):
+        if self.version is None:
+            return query
+        return query.filter(models.TaskStatus.ingest_version == self.version)
+
+    def acquire(self) -> bool:
+        """
+        Take the lease unless another worker holds it.
+        :return: False when the job should be retried later
+        :raises IngestionSuperseded: When the job is stale or its version
+            already completed
+        """
+        db = next(get_db())
+        try:
+            task = (
+                db.query(models.TaskStatus)
+                .filter(models.TaskStatus.task_id == self.task_id)
+                .first()
+            )
+            if task is None:
+                return True
+            if self.version is not None:
+                if task.ingest_version != self.version:
+                    raise IngestionSuperseded(
+                        f"Task {self.task_id} version {self.version} superseded "
+                        f"by version {task.ingest_version}"
+                    )
+                if task.status == "completed":
+                    raise IngestionSuperseded(
+                        f"Task {self.task_id} version {self.version} already completed"
+                    )
+            now = _utcnow()
+            taken = (
+                self._current(
+                    db.query(models.TaskStatus).filter(
+                        models.TaskStatus.task_id == self.task_id,
+                        (models.TaskStatus.lease_expires_at.is_(None))
+                        | (models.TaskStatus.lease_expires_at <= now),
+                    )
+                )
+            ).update(
+                {
+                    models.TaskStatus.lease_owner: self.owner,
+                    models.TaskStatus.lease_expires_at: now
+                    + datetime.timedelta(seconds=INGEST_LEASE_SECONDS),
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            if taken:
+                return True
+            # Lost a race with a newer upload, or another worker holds it
+            check_version(self.task_id, self.version)
+            return False
+        finally:
+            db.close()
+
+    def check(self):
+        """
+        Renew the lease, raising IngestionSuperseded when the task was
+        uploaded again or another worker took the lease over.
+        """
+        db = next(get_db())
+        try:
+            renewed = (
+                self._current(
+                    db.query(models.TaskStatus).filter(
+                        models.TaskStatus.task_id == self.task_id,
+                        models.TaskStatus.lease_owner == self.owner,
+                    )
+                )
+            ).update(
+                {
+                    models.TaskStatus.lease_expires_at: _utcnow()
+                    + datetime.timedelta(seconds=INGEST_LEASE_SECONDS)
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+        if not renewed:
+            raise IngestionSuperseded(
+                f"Task {self.task_id} version {self.version} lost its lease"
+            )
+
+    def release(self):
+        """
+        Give the lease up, if still held.
+        """
+        db = next(get_db())
+        try:
+            db.query(models.TaskStatus).filter(
+                models.TaskStatus.task_id == self.task_id,
+                models.TaskStatus.lease_owner == self.owner,
+            ).update(
+                {
+                    models.TaskStatus.lease_owner: None,
+                    models.TaskStatus.lease_expires_at: None,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+def queue_stats(db) -> dict:
+    """
+    Queued (not yet started) jobs per lane and the age of the oldest one.
+    Read from the task table, so it covers every API and worker process.
+    """
+    rows = (
+        db.query(
+            models.TaskStatus.lane,
+            func.count(models.TaskStatus.task_id),
+            func.min(models.TaskStatus.queued_at),
+        )
+        .filter(
+            models.TaskStatus.status == "processing",
+            models.TaskStatus.started_at.is_(None),
+            models.TaskStatus.queued_at.isnot(None),
+        )
+        .group_by(models.TaskStatus.lane)
+        .all()
+    )
+    now = _utcnow()
+    stats = {lane: {"depth": 0, "oldest_age_seconds": 0.0} for lane in LANES}
+    for lane, depth, oldest in rows:
+        lane_stats = stats.setdefault(
+            lane or "small", {"depth": 0, "oldest_age_seconds": 0.0}
+        )
+        lane_stats["depth"] += depth
+        lane_stats["oldest_age_seconds"] = max(
+            lane_stats["oldest_age_seconds"],
+            round((now - _as_utc(oldest)).total_seconds(), 3),
+        )
+    return stats
+
+
+class StageMetricsExport:
+    """
+    Observes the stage timings persisted on tasks into TASK_STAGE_DURATION
+    at scrape time, so the API's /metrics covers the stages run by worker
+    processes. Each call reads only the tasks completed since the previous
+    one, starting from when the export was created.
+    """
+
+    def __init__(self, settle_seconds: float = STAGE_METRICS_SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._since = _utcnow() - datetime.timedelta(seconds=settle_seconds)
+        self._lock = threading.Lock()
+
+    def collect(self, db) -> int:
+        """
+        :return: Number of tasks observed
+        """
+        with self._lock:
+            until = _utcnow() - datetime.timedelta(seconds=self.settle_seconds)
+            rows = (
+                db.query(models.TaskStatus.processing_metrics)
+                .filter(
+                    models.TaskStatus.status == "completed",
+                    models.TaskStatus.processing_metrics.isnot(None),
+                    models.TaskStatus.completed_at > self._since,
+                    models.TaskStatus.completed_at <= until,
+                )
+                .all()
+            )
+            self._since = until
+        for (metrics,) in rows:
+            for stage, seconds in json.loads(metrics)["stages"].items():
+                TASK_STAGE_DURATION.labels(stage=stage).observe(seconds)
+        return len(rows)
+
+
+stage_metrics_export = StageMetricsExport()
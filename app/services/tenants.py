@@ -0,0 +1,143 @@
+# Per-user Weaviate tenants: activity tracking, offloading idle tenants and
+# moving chunks from the global DocumentChunk collection
+import datetime
+
+from sqlalchemy import case, func
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+
+from ..core import models
+from ..core.config import (
+    TENANT_IDLE_SECONDS,
+    TENANT_IDLE_STATUS,
+    TENANT_TOUCH_SECONDS,
+    WEAVIATE_MULTI_TENANCY,
+)
+from .scheduling import _as_utc, _utcnow
+from .weaviate_client import (
+    TENANT_CHUNK_COLLECTION,
+    create_document_chunk_collection,
+    tenant_name,
+    with_document_id,
+)
+
+# Tenants created or updated per request
+TENANT_BATCH_SIZE = 100
+
+
+def touch_task(db, task: models.TaskStatus):
+    """
+    Record that a task's document was queried, at most once every
+    TENANT_TOUCH_SECONDS so queries rarely write.
+    """
+    if not WEAVIATE_MULTI_TENANCY:
+        return
+    now = _utcnow()
+    if (
+        task.last_queried_at
+        and (now - _as_utc(task.last_queried_at)).total_seconds() < TENANT_TOUCH_SECONDS
+    ):
+        return
+    task.last_queried_at = now
+    db.commit()
+
+
+def idle_users(db, idle_seconds: int = TENANT_IDLE_SECONDS) -> list[str]:
+    """
+    Users with no upload, processing job or query in the last `idle_seconds`.
+    """
+    cutoff = _utcnow() - datetime.timedelta(seconds=idle_seconds)
+    last_used = func.max(
+        func.coalesce(
+            models.TaskStatus.last_queried_at,
+            models.TaskStatus.completed_at,
+            models.TaskStatus.created_at,
+        )
+    )
+    processing = func.sum(case((models.TaskStatus.status == "processing", 1), else_=0))
+    rows = (
+        db.query(models.TaskStatus.user_email)
+        .group_by(models.TaskStatus.user_email)
+        .having(last_used < cutoff, processing == 0)
+        .all()
+    )
+    return [user_email for user_email, in rows if user_email]
+
+
+def offload_idle_tenants(
+    client, db, idle_seconds: int = TENANT_IDLE_SECONDS, status: str = None
+) -> list[str]:
+    """
+    Move the active tenants of idle users to TENANT_IDLE_STATUS, freeing
+    their memory. They are reactivated automatically on their next use.
+    :return: Names of the tenants moved
+    """
+    activity = TenantActivityStatus[status or TENANT_IDLE_STATUS]
+    collection = client.collections.get(TENANT_CHUNK_COLLECTION)
+    tenants = collection.tenants.get()
+    updates = [
+        Tenant(name=name, activity_status=activity)
+        for name in sorted(tenant_name(user) for user in idle_users(db, idle_seconds))
+        if name in tenants
+        and tenants[name].activity_status == TenantActivityStatus.ACTIVE
+    ]
+    for start in range(0, len(updates), TENANT_BATCH_SIZE):
+        collection.tenants.update(updates[start : start + TENANT_BATCH_SIZE])
+    return [tenant.name for tenant in updates]
+
+
+def migrate_to_tenants(client, db, delete_source: bool = False) -> dict:
+    """
+    Copy the chunks of the global DocumentChunk collection to their owner's
+    tenant of TenantDocumentChunk, keeping UUIDs and vectors. Owners are
+    looked up by document (S3 key) in the task table.
+    :param delete_source: Delete DocumentChunk afterwards, unless some
+        chunks had no known owner
+    :return: Counts of chunks moved, chunks without owner and new tenants
+    """
+    if TENANT_CHUNK_COLLECTION not in client.collections.list_all():
+        create_document_chunk_collection(
+            client, TENANT_CHUNK_COLLECTION, multi_tenancy=True
+        )
+    target = client.collections.get(TENANT_CHUNK_COLLECTION)
+    owners = {
+        file_path: user_email
+        for file_path, user_email in db.query(
+            models.TaskStatus.file_path, models.TaskStatus.user_email
+        )
+        if file_path and user_email
+    }
+    new_tenants = sorted(
+        {tenant_name(user) for user in owners.values()} - set(target.tenants.get())
+    )
+    for start in range(0, len(new_tenants), TENANT_BATCH_SIZE):
+        target.tenants.create(
+            [
+                Tenant(name=name)
+                for name in new_tenants[start : start + TENANT_BATCH_SIZE]
+            ]
+        )
+
+    moved = orphaned = 0
+    with client.batch.fixed_size(batch_size=200) as batch:
+        for obj in client.collections.get("DocumentChunk").iterator(
+            include_vector=True
+        ):
+            owner = owners.get(obj.properties.get("document_name"))
+            if owner is None:
+                orphaned += 1
+                continue
+            batch.add_object(
+                collection=TENANT_CHUNK_COLLECTION,
+                properties=with_document_id(obj.properties),
+                vector=obj.vector or None,
+                uuid=obj.uuid,
+                tenant=tenant_name(owner),
+            )
+            moved += 1
+    failed = client.batch.failed_objects
+    if failed:
+        raise Exception(f"Failed to move {len(failed)} chunks to tenants")
+
+    if delete_source and not orphaned:
+        client.collections.delete("DocumentChunk")
+    return {"moved": moved, "orphaned": orphaned, "tenants": len(new_tenants)}
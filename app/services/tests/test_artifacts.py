@@ -0,0 +1,115 @@
+import pytest
+
+from app.core import models
+from app.core.database import SessionLocal
+from app.services.artifacts import LocalArtifactStore
+from app.services.embedding import HashingEmbedder
+from app.services.ingestion import DeadlineExceeded, process_document
+
+
+def test_corrupt_artifacts_read_as_missing(tmp_path):
+    """
+    Test that a blob whose payload does not match its checksum is ignored.
+    """
+    store = LocalArtifactStore(root_dir=str(tmp_path))
+    store.put("checkpoints/1/abc/text.json", b'"hello"')
+    assert store.get("checkpoints/1/abc/text.json") == b'"hello"'
+
+    path = tmp_path / "checkpoints/1/abc/text.json"
+    path.write_bytes(path.read_bytes()[:-2])
+    assert store.get("checkpoints/1/abc/text.json") is None
+
+    store.delete_prefix("checkpoints/1/")
+    assert not (tmp_path / "checkpoints/1").exists()
+
+
+class FlakyStore:
+    def __init__(self):
+        self.stored = []
+        self.fail = True
+
+    def delete_document_chunks(self, document_name, tenant=None):
+        pass
+
+    def store_chunks(self, chunks, tenant=None):
+        if self.fail:
+            raise Exception("weaviate unavailable")
+        self.stored.extend(chunks)
+
+
+class CountingEmbedder(HashingEmbedder):
+    calls = 0
+
+    def embed_batch_array(self, texts):
+        CountingEmbedder.calls += 1
+        return super().embed_batch_array(texts)
+
+
+def make_task(tmp_path, text):
+    path = tmp_path / "notes.txt"
+    path.write_text(text)
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name="notes.txt",
+        file_path=str(path),
+        user_email="resume@example.com",
+        status="processing",
+    )
+    db.add(task)
+    db.commit()
+    task_id = task.task_id
+    db.close()
+    return task_id
+
+
+def test_retry_resumes_after_the_embed_stage(monkeypatch, tmp_path):
+    """
+    Test that a retry after a failed vector store write reuses the
+    checkpointed chunks and embeddings instead of embedding again.
+    """
+    store = FlakyStore()
+    artifacts = LocalArtifactStore(root_dir=str(tmp_path / "artifacts"))
+    monkeypatch.setattr("app.services.ingestion.development", True)
+    monkeypatch.setattr("app.services.ingestion.get_vector_store", lambda: store)
+    monkeypatch.setattr("app.services.ingestion.get_artifact_store", lambda: artifacts)
+    monkeypatch.setattr(
+        "app.services.embedding.get_embedder", lambda: CountingEmbedder(dimensions=16)
+    )
+    task_id = make_task(tmp_path, "The refund policy allows returns. " * 50)
+
+    with pytest.raises(Exception):
+        process_document(task_id)
+    assert CountingEmbedder.calls == 1
+
+    store.fail = False
+    monkeypatch.setattr(
+        "app.services.ingestion.parse_document",
+        lambda *args, **kwargs: pytest.fail("text should come from the checkpoint"),
+    )
+    process_document(task_id)
+
+    assert CountingEmbedder.calls == 1
+    assert store.stored and all(len(c["embedding"]) == 16 for c in store.stored)
+    assert not (tmp_path / "artifacts" / "checkpoints" / str(task_id)).exists()
+
+
+def test_deadline_stops_before_the_next_stage(monkeypatch, tmp_path):
+    """
+    Test that a worker out of time raises DeadlineExceeded without
+    failing the task.
+    """
+    monkeypatch.setattr("app.services.ingestion.development", True)
+    monkeypatch.setattr("app.services.ingestion.get_vector_store", FlakyStore)
+    monkeypatch.setattr(
+        "app.services.ingestion.get_artifact_store",
+        lambda: LocalArtifactStore(root_dir=str(tmp_path / "artifacts")),
+    )
+    task_id = make_task(tmp_path, "Short text.")
+
+    with pytest.raises(DeadlineExceeded):
+        process_document(task_id, deadline=0)
+
+    db = SessionLocal()
+    task = db.query(models.TaskStatus).filter_by(task_id=task_id).first()
+    assert task.status == "processing"
+    db.close()
@@ -0,0 +1,81 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.benchmarks.corpus import generate_records
+from app.benchmarks.fakes import FakeWeaviateClient
+from app.services import weaviate_client
+from app.services.datasets import flatten_record, infer_schema, numeric_fields
+
+
+def test_infer_schema_types_and_property_names():
+    """
+    Test that field types are inferred from the values, numbers written as
+    strings included, and that every field gets a valid property name.
+    """
+    rows = [
+        flatten_record(record)
+        for record in [
+            {"id": 1, "Price": "9.50", "zip": "01234", "in stock": True, "tags": ["a"]},
+            {"id": 2, "Price": 12, "zip": "04567", "in stock": "false", "x": {"y": 1}},
+            {"id": "n/a", "Price": None, "zip": "11111", "in stock": False},
+        ]
+    ]
+
+    schema = infer_schema(rows, sample_size=2)
+
+    assert {field: spec["type"] for field, spec in schema.items()} == {
+        "id": "int",
+        "Price": "number",
+        "zip": "text",
+        "in stock": "boolean",
+        "tags": "text",
+        "x.y": "int",
+    }
+    assert {field: spec["property"] for field, spec in schema.items()} == {
+        "id": "id_",
+        "Price": "price",
+        "zip": "zip",
+        "in stock": "in_stock",
+        "tags": "tags",
+        "x.y": "x_y",
+    }
+    assert numeric_fields(schema) == ["id", "Price", "x.y"]
+
+
+def test_weaviate_dataset_aggregation():
+    """
+    Test that a dataset gets its own range-indexed collection and that the
+    aggregator finds its numeric fields, nested ones included, from it.
+    """
+    client = FakeWeaviateClient({})
+    rows = [flatten_record(record) for record in generate_records(50)]
+    with patch.object(weaviate_client, "get_client", lambda: client):
+        weaviate_client.store_structured_json_in_weaviate(
+            "a@example.com/records.json", rows, infer_schema(rows)
+        )
+        collection = client.collections.get(
+            weaviate_client.dataset_collection_name("a@example.com/records.json")
+        )
+        config = {p.description: p for p in collection.config.get().properties}
+        assert config["address.zip"].index_range_filters
+        assert not config["membership"].index_range_filters
+
+        spent = weaviate_client.aggregate_structured_json(
+            "a@example.com/records.json", "total_spent"
+        )
+        assert spent["count"] == 50
+        assert spent["maximum"] == max(row["total_spent"] for row in rows)
+        assert spent["max_user_details"][0]["address.city"] in ("Pune", "Delhi")
+
+        zips = weaviate_client.aggregate_structured_json(
+            "a@example.com/records.json", "address.zip"
+        )
+        assert zips["total"] == sum(row["address.zip"] for row in rows)
+
+        with pytest.raises(ValueError, match="cannot be aggregated"):
+            weaviate_client.aggregate_structured_json(
+                "a@example.com/records.json", "membership"
+            )
+        weaviate_client.delete_existing_json_agg("a@example.com/records.json")
+        assert not client.collections.exists(collection.name)
@@ -0,0 +1,84 @@
+from app.core.metrics import collect_stages, track_stage
+from app.services.chunks import Chunk
+from app.services.embedding import HashingEmbedder, embed_chunks
+import numpy as np
+
+
+def test_hashing_embedder_is_deterministic():
+    """
+    Test that the hashing embedder returns the same normalized vector
+    for the same text.
+    """
+    embedder = HashingEmbedder(dimensions=64)
+
+    first, second = embedder.embed(["Refund policy", "Refund policy"])
+
+    assert first == second
+    assert len(first) == 64
+    assert np.isclose(np.linalg.norm(first), 1.0)
+
+
+def test_hashing_embedder_batches_preserve_order():
+    """
+    Test that texts split over several batches come back in input order.
+    """
+    texts = [f"document number {i}" for i in range(10)]
+    batched = HashingEmbedder(dimensions=32, batch_size=3, workers=2)
+    single = HashingEmbedder(dimensions=32, batch_size=100)
+
+    assert batched.embed(texts) == single.embed(texts)
+
+
+def test_hashing_embedder_similar_texts_are_closer():
+    """
+    Test that texts sharing words are closer than unrelated texts.
+    """
+    embedder = HashingEmbedder(dimensions=256)
+    query, related, unrelated = np.array(
+        embedder.embed(
+            [
+                "what is the refund policy",
+                "the refund policy covers 30 days",
+                "quarterly revenue grew in europe",
+            ]
+        )
+    )
+
+    assert query @ related > query @ unrelated
+
+
+def test_embedded_chunks_share_one_matrix(monkeypatch):
+    """
+    Test that chunks embedded in several batches hold float32 row views of
+    one matrix, equal to the vectors `embed` returns.
+    """
+    embedder = HashingEmbedder(dimensions=32, batch_size=3, workers=2)
+    monkeypatch.setattr("app.services.embedding.get_embedder", lambda: embedder)
+    chunks = [Chunk("doc.txt", i, f"chunk number {i}") for i in range(8)]
+
+    embed_chunks(chunks)
+
+    matrix = chunks[0].embedding.base
+    assert matrix.dtype == np.float32 and matrix.shape == (8, 32)
+    assert all(np.shares_memory(chunk.embedding, matrix) for chunk in chunks)
+    np.testing.assert_allclose(
+        [chunk.embedding for chunk in chunks],
+        embedder.embed([chunk.text for chunk in chunks]),
+    )
+
+
+def test_batches_embedded_on_the_pool_are_timed_into_the_callers_timer():
+    """
+    Test that stages run on the embedding thread pool are attributed to
+    the StageTimer of the ingestion that submitted them.
+    """
+
+    class TimedEmbedder(HashingEmbedder):
+        def embed_batch_array(self, texts):
+            with track_stage("embed_batch"):
+                return super().embed_batch_array(texts)
+
+    embedder = TimedEmbedder(dimensions=16, batch_size=2, workers=3)
+    with collect_stages() as timer:
+        embedder.embed_array([f"text {i}" for i in range(10)])
+    assert "embed_batch" in timer.stages
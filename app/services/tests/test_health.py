@@ -0,0 +1,87 @@
+import time
+
+from app.benchmarks.fakes import FakeWeaviateClient
+from app.services import weaviate_client
+from app.services.health import HealthMonitor, warm_up
+from app.services.vector_store import WeaviateVectorStore
+
+
+def test_health_is_served_from_the_last_check():
+    """
+    Test that probes read the cached status, that a failing dependency is
+    reported with its error, and that an expired status is checked again.
+    """
+    calls = []
+
+    def database():
+        calls.append("database")
+        raise Exception("connection refused")
+
+    monitor = HealthMonitor(
+        checks={"vector_store": lambda: {"backend": "local"}, "database": database},
+        max_age=0.05,
+    )
+    status = monitor.status()
+    assert monitor.status()["dependencies"] == status["dependencies"]
+    assert calls == ["database"]
+
+    assert status["status"] == "degraded"
+    assert status["dependencies"]["vector_store"]["ok"] is True
+    assert status["dependencies"]["vector_store"]["backend"] == "local"
+    assert status["dependencies"]["database"]["error"] == "connection refused"
+    assert status["dependencies"]["database"]["latency_ms"] >= 0
+
+    time.sleep(0.1)
+    monitor.status()
+    assert calls == ["database", "database"]
+
+
+def test_background_refresh():
+    """
+    Test that a started monitor keeps refreshing on its own.
+    """
+    calls = []
+    monitor = HealthMonitor(checks={"queue": lambda: calls.append(1)}, interval=0.02)
+    monitor.start()
+    time.sleep(0.2)
+    monitor.stop()
+    assert len(calls) > 2
+    assert monitor.status()["status"] == "ok"
+
+
+def test_warm_up_connects_the_shared_weaviate_client(monkeypatch):
+    """
+    Test that requests after warm-up reuse the client the lifespan opened,
+    that closing it per request keeps it open, and that the store's
+    close() disconnects it.
+    """
+    connected = []
+
+    class Client(FakeWeaviateClient):
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    def connect():
+        connected.append(Client({}))
+        return connected[-1]
+
+    store = WeaviateVectorStore()
+    monkeypatch.setattr(weaviate_client, "connect", connect)
+    monkeypatch.setattr("app.services.health.get_vector_store", lambda: store)
+    monkeypatch.setattr("app.services.health.USE_S3", False)
+    monkeypatch.setattr("app.services.health.JOB_QUEUE", "local")
+    monkeypatch.setattr("app.services.health.get_embedder", lambda: None)
+
+    store.connect()
+    try:
+        warm_up()
+        assert connected[0].collections.list_all()
+        assert store.is_ready()
+        weaviate_client.delete_existing_json_agg("missing.json")
+        assert len(connected) == 1
+        assert not connected[0].closed
+    finally:
+        store.close()
+    assert connected[0].closed
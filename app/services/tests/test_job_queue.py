@@ -0,0 +1,37 @@
+import sqlite3
+
+from app.services.job_queue import LocalJobQueue
+
+
+def test_local_job_queue_runs_worker_handler(monkeypatch):
+    """
+    Test that queued jobs are processed by app.worker.handle_message.
+    """
+    handled = []
+    monkeypatch.setattr("app.worker.handle_message", handled.append)
+    jobs = LocalJobQueue(workers=2, db_path="")
+
+    for task_id in range(5):
+        jobs.enqueue({"task_id": task_id, "structured_json": "False"})
+    jobs.join()
+
+    assert sorted(job["task_id"] for job in handled) == list(range(5))
+
+
+def test_local_job_queue_resumes_persisted_jobs(monkeypatch, tmp_path):
+    """
+    Test that jobs still queued when the process stopped run on restart,
+    and are removed once processed.
+    """
+    db_path = str(tmp_path / "jobs.db")
+    stopped = LocalJobQueue(workers=0, db_path=db_path)
+    stopped.enqueue({"task_id": 1, "structured_json": "True"})
+
+    handled = []
+    monkeypatch.setattr("app.worker.handle_message", handled.append)
+    restarted = LocalJobQueue(workers=1, db_path=db_path)
+    restarted.join()
+
+    assert handled == [{"task_id": 1, "structured_json": "True"}]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 0
@@ -0,0 +1,152 @@
+import datetime
+import uuid
+
+import numpy as np
+
+from app.core import models
+from app.core.database import SessionLocal
+from app.services.embedding import HashingEmbedder
+from app.services.ingestion import process_document
+from app.services.library import (
+    backfill_summary_vectors,
+    candidate_tasks,
+    pack_vector,
+    search_library,
+    unpack_vector,
+)
+from app.services.vector_store import LocalVectorStore
+
+TOPICS = {
+    "fruit.txt": "Apples pears and plums ripen in the orchard every autumn. ",
+    "space.txt": "Rockets launch satellites into orbit around the planet. ",
+    "music.txt": "Violins cellos and flutes play in the symphony orchestra. ",
+}
+
+
+def test_library_query_only_searches_closest_documents(monkeypatch, tmp_path):
+    """
+    Test that ingestion stores a summary vector per document and that a
+    library query only returns chunks of the closest candidate document.
+    """
+    store = LocalVectorStore(root_dir=str(tmp_path / "store"))
+    monkeypatch.setattr("app.services.ingestion.development", True)
+    monkeypatch.setattr("app.services.ingestion.CHECKPOINTS_ENABLED", False)
+    monkeypatch.setattr("app.services.ingestion.get_vector_store", lambda: store)
+    monkeypatch.setattr(
+        "app.services.embedding.get_embedder", lambda: HashingEmbedder(dimensions=256)
+    )
+    user_email = f"{uuid.uuid4().hex}@example.com"
+    db = SessionLocal()
+    for file_name, text in TOPICS.items():
+        path = tmp_path / file_name
+        path.write_text("\n\n".join(text * 20 for _ in range(3)))
+        task = models.TaskStatus(
+            file_name=file_name,
+            file_path=str(path),
+            user_email=user_email,
+            status="processing",
+        )
+        db.add(task)
+        db.commit()
+        process_document(task.task_id)
+    db.expire_all()
+
+    tasks = db.query(models.TaskStatus).filter_by(user_email=user_email).all()
+    for task in tasks:
+        assert np.isclose(np.linalg.norm(unpack_vector(task.summary_vector)), 1.0)
+
+    vector = HashingEmbedder(dimensions=256).embed_batch(
+        ["Rockets launch satellites into orbit"]
+    )[0]
+    hits = search_library(db, store, user_email, vector, limit=5, documents=1)
+    db.close()
+
+    assert hits and {hit["file_name"] for hit in hits} == {"space.txt"}
+    assert [hit["distance"] for hit in hits] == sorted(hit["distance"] for hit in hits)
+
+
+def test_candidates_skip_other_dimensions_and_old_documents():
+    """
+    Test that summary vectors of another embedding size are skipped rather
+    than compared, and that only the most recently completed documents are
+    scanned, documents without a summary vector filling what is left.
+    """
+    user_email = f"{uuid.uuid4().hex}@example.com"
+    now = datetime.datetime.now(datetime.timezone.utc)
+    db = SessionLocal()
+    summaries = {
+        "old.txt": ([1.0, 0.0], now - datetime.timedelta(days=2)),
+        "recent.txt": ([0.0, 1.0], now - datetime.timedelta(days=1)),
+        "resized.txt": ([1.0, 0.0, 0.0], now),
+        "legacy.txt": (None, now),
+        "older-legacy.txt": (None, now - datetime.timedelta(days=3)),
+    }
+    for file_name, (vector, completed_at) in summaries.items():
+        db.add(
+            models.TaskStatus(
+                file_name=file_name,
+                file_path=file_name,
+                user_email=user_email,
+                status="completed",
+                completed_at=completed_at,
+                summary_vector=pack_vector(vector),
+            )
+        )
+    db.commit()
+
+    tasks = candidate_tasks(db, user_email, [1.0, 0.0], limit=1)
+    assert [task.file_name for task in tasks] == [
+        "old.txt",
+        "legacy.txt",
+        "older-legacy.txt",
+    ]
+    tasks = candidate_tasks(db, user_email, [1.0, 0.0], limit=1, scanned=3)
+    assert [task.file_name for task in tasks] == ["old.txt", "legacy.txt"]
+    tasks = candidate_tasks(db, user_email, [1.0, 0.0], limit=1, scanned=1)
+    assert [task.file_name for task in tasks] == ["recent.txt"]
+    db.close()
+
+
+def test_backfill_gives_old_documents_a_summary_vector(tmp_path):
+    """
+    Test that documents stored without a summary vector get one computed
+    from their stored chunk vectors, and are then picked by similarity.
+    """
+    store = LocalVectorStore(root_dir=str(tmp_path / "store"))
+    user_email = f"{uuid.uuid4().hex}@example.com"
+    db = SessionLocal()
+    for file_name, vector in (("x.txt", [1.0, 0.0]), ("y.txt", [0.0, 1.0])):
+        store.store_chunks(
+            [
+                {
+                    "document_name": file_name,
+                    "chunk_index": 0,
+                    "text": file_name,
+                    "embedding": vector,
+                }
+            ]
+        )
+        db.add(
+            models.TaskStatus(
+                file_name=file_name,
+                file_path=file_name,
+                user_email=user_email,
+                status="completed",
+                completed_at=datetime.datetime.now(datetime.timezone.utc),
+            )
+        )
+    db.add(
+        models.TaskStatus(
+            file_name="empty.txt",
+            file_path="empty.txt",
+            user_email=user_email,
+            status="completed",
+        )
+    )
+    db.commit()
+
+    assert backfill_summary_vectors(db, store) == {"updated": 2, "skipped": 1}
+    db.expire_all()
+    tasks = candidate_tasks(db, user_email, [0.0, 1.0], limit=1)
+    assert [task.file_name for task in tasks] == ["y.txt", "empty.txt"]
+    db.close()
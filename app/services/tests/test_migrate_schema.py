@@ -0,0 +1,71 @@
+from unittest.mock import patch
+
+from weaviate.collections.classes.config import DataType, Property
+
+from app.benchmarks.fakes import FakeWeaviateClient
+from app.services import weaviate_client
+from app.services.utils.migrate_schema import migrate_schema
+
+
+def old_schema_client():
+    """
+    Collections created before `document_id` and dataset collections existed.
+    """
+    client = FakeWeaviateClient({})
+    chunks = client.collections.create(
+        "DocumentChunk",
+        properties=[Property(name="document_name", data_type=DataType.TEXT)],
+    )
+    players = client.collections.create(
+        "StructureJSONPlayer",
+        properties=[
+            Property(name="document_name", data_type=DataType.TEXT),
+            Property(name="age", data_type=DataType.NUMBER),
+        ],
+    )
+    for i, name in enumerate(["a@example.com/doc.pdf", "a@example.com/doc.pdf.bak"]):
+        chunks.add({"document_name": name, "text": f"chunk {i}"}, [1.0, float(i)])
+        players.add({"document_name": name, "age": 30 + i})
+    return client
+
+
+def test_migration_backfills_document_id_and_splits_datasets():
+    """
+    Test that migrated chunks are searched and deleted by exact document_id,
+    and that every document's structured JSON records get their own
+    aggregatable dataset, without mixing documents sharing a name prefix.
+    """
+    client = old_schema_client()
+    assert migrate_schema(client, dry_run=True)
+    assert (
+        "document_id"
+        not in client.collections.get("DocumentChunk").objects[0].properties
+    )
+
+    migrate_schema(client)
+
+    assert not client.collections.exists("StructureJSONPlayer")
+    dataset = client.collections.get(
+        weaviate_client.dataset_collection_name("a@example.com/doc.pdf")
+    )
+    config = {p.name: p for p in dataset.config.get().properties}
+    assert config["age"].index_range_filters
+    assert len(dataset.objects) == 1
+    chunks = client.collections.get("DocumentChunk")
+    assert all(o.vector is not None for o in chunks.objects)
+    # Already migrated: nothing left to do
+    assert migrate_schema(client) == []
+
+    with patch.object(weaviate_client, "get_client", lambda: client):
+        hits = weaviate_client.search_document_chunks(
+            "a@example.com/doc.pdf", [[1.0, 0.0]], limit=5
+        )[0]
+        assert [hit["text"] for hit in hits] == ["chunk 0"]
+        result = weaviate_client.aggregate_structured_json(
+            "a@example.com/doc.pdf", "age"
+        )
+        assert result["count"] == 1
+        assert result["maximum"] == 30
+
+        weaviate_client.delete_existing_document_chunks("a@example.com/doc.pdf")
+        assert [o.properties["text"] for o in chunks.objects] == ["chunk 1"]
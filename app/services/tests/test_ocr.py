@@ -0,0 +1,67 @@
+import fitz
+import pytest
+
+from app.benchmarks.corpus import generate_pdf
+from app.benchmarks.fakes import FakeTextract
+from app.services.ocr import TextractOCR
+
+
+@pytest.fixture
+def textract_pdf(tmp_path):
+    generate_pdf(str(tmp_path / "doc.pdf"), pages=6)
+    with fitz.open(tmp_path / "doc.pdf") as pdf:
+        expected = [page.get_text() for page in pdf]
+    return tmp_path, expected
+
+
+def _ocr(engine, path, page_nums, s3_key=None):
+    with fitz.open(path) as pdf:
+        return list(engine.ocr_pages(pdf, page_nums, s3_key=s3_key))
+
+
+def test_textract_async_job_and_per_page_calls_agree(textract_pdf):
+    """
+    Test that a whole document in S3 is read by one polled, paginated
+    Textract job, that other pages are sent one by one, and that both give
+    the same text in page order.
+    """
+    root, expected = textract_pdf
+    client = FakeTextract(str(root), polls_in_progress=2, blocks_per_response=7)
+    engine = TextractOCR(
+        bucket="test", concurrency=3, async_min_pages=5, poll_seconds=0, client=client
+    )
+
+    whole = _ocr(engine, root / "doc.pdf", range(6), s3_key="doc.pdf")
+    assert client.calls["start_document_text_detection"] == 1
+    assert client.calls["get_document_text_detection"] > 3
+    assert client.calls["detect_document_text"] == 0
+
+    some = _ocr(engine, root / "doc.pdf", [4, 1, 2], s3_key="doc.pdf")
+    assert client.calls["start_document_text_detection"] == 1
+    assert client.calls["detect_document_text"] == 3
+
+    assert [page for page, _ in whole] == list(range(6))
+    assert [page for page, _ in some] == [4, 1, 2]
+    texts = dict(whole)
+    for page, text in some:
+        assert text == texts[page]
+    for page, text in whole:
+        assert text.split() == expected[page].split()
+
+
+def test_failed_textract_job_raises(textract_pdf):
+    """
+    Test that a failed asynchronous job is reported instead of returning
+    empty pages.
+    """
+    root, _ = textract_pdf
+    client = FakeTextract(str(root))
+    client.get_document_text_detection = lambda JobId, NextToken=None: {
+        "JobStatus": "FAILED",
+        "StatusMessage": "Unsupported document",
+    }
+    engine = TextractOCR(
+        bucket="test", async_min_pages=1, poll_seconds=0, client=client
+    )
+    with pytest.raises(Exception, match="FAILED: Unsupported document"):
+        _ocr(engine, root / "doc.pdf", range(6), s3_key="doc.pdf")
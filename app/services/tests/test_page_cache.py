@@ -0,0 +1,76 @@
+from unittest.mock import patch
+
+from app.benchmarks.corpus import generate_pdf
+from app.services import parser
+from app.services.artifacts import LocalArtifactStore
+from app.services.page_cache import PageTextCache
+
+
+class CountingTesseract:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, image):
+        self.calls += 1
+        return f"page text {self.calls}"
+
+
+def test_ocr_reuses_cached_pages(tmp_path):
+    """
+    Test that OCR of an already seen PDF (even re-uploaded under another
+    name) reads every page from the cache instead of running Tesseract.
+    """
+    generate_pdf(str(tmp_path / "scan.pdf"), 3, scanned=True)
+    generate_pdf(str(tmp_path / "copy.pdf"), 3, scanned=True)
+    cache = PageTextCache(LocalArtifactStore(str(tmp_path / "artifacts")))
+    tesseract = CountingTesseract()
+
+    with patch.object(parser, "get_page_cache", lambda: cache), patch(
+        "app.services.ocr.pytesseract.image_to_string", tesseract
+    ):
+        first = parser.ocr_pdf(str(tmp_path / "scan.pdf"))
+        assert tesseract.calls == 3
+        second = parser.ocr_pdf(str(tmp_path / "copy.pdf"))
+        assert tesseract.calls == 3
+        assert second == first
+
+        # A new extractor version does not reuse old text
+        with patch.object(parser, "ocr_extractor_version", lambda: "tesseract-next"):
+            parser.ocr_pdf(str(tmp_path / "scan.pdf"), pages=[0])
+        assert tesseract.calls == 4
+
+
+def test_eviction_keeps_cache_under_bound(tmp_path):
+    """
+    Test that eviction drops the least recently used pages first.
+    """
+    cache = PageTextCache(LocalArtifactStore(str(tmp_path)), max_bytes=400)
+    for i in range(5):
+        cache.put("v1", f"{i:064x}", "x" * 100)
+    # Reading a page marks it as recently used
+    assert cache.get("v1", f"{0:064x}") == "x" * 100
+
+    cache.evict()
+    entries = cache.store.list_blobs(cache.prefix)
+    assert sum(size for _, size, _ in entries) <= 400
+    assert cache.get("v1", f"{0:064x}") is not None
+    assert cache.get("v1", f"{1:064x}") is None
+
+
+def test_eviction_lists_the_store_only_when_over_bound(tmp_path):
+    """
+    Test that once the cache size is known, eviction does not list the
+    store again until enough new text was written to exceed the bound.
+    """
+    store = LocalArtifactStore(str(tmp_path))
+    cache = PageTextCache(store, max_bytes=10_000)
+    cache.put("v1", f"{0:064x}", "x" * 100)
+    with patch.object(store, "list_blobs", wraps=store.list_blobs) as list_blobs:
+        cache.evict()
+        cache.put("v1", f"{1:064x}", "x" * 100)
+        cache.evict()
+        assert list_blobs.call_count == 1
+
+        cache.put("v1", f"{2:064x}", "x" * 10_000)
+        cache.evict()
+        assert list_blobs.call_count == 2
@@ -0,0 +1,49 @@
+from app.services.query_cache import QueryCache
+
+
+def test_query_cache_normalizes_questions():
+    """
+    Test that case, whitespace and trailing punctuation share an entry.
+    """
+    cache = QueryCache()
+    cache.set(1, "What is the  refund policy?", 3, ["answer"], version="v1")
+
+    assert cache.get("1", "what is the refund policy", 3, version="v1") == ["answer"]
+    assert cache.get(1, "what is the refund policy", 5, version="v1") is None
+
+
+def test_query_cache_misses_on_new_version_and_invalidation():
+    """
+    Test that a re-ingested task never serves stale answers.
+    """
+    cache = QueryCache()
+    cache.set(1, "question", 3, ["old"], version="v1")
+
+    assert cache.get(1, "question", 3, version="v2") is None
+
+    cache.set(1, "question", 3, ["old"], version="v1")
+    cache.invalidate(1)
+    assert cache.get(1, "question", 3, version="v1") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_query_cache_ttl_and_lru_eviction():
+    """
+    Test expiry after the TTL and eviction of the least recently used entry.
+    """
+    expired = QueryCache(ttl_seconds=0)
+    expired.set(1, "question", 3, ["answer"])
+    assert expired.get(1, "question", 3) is None
+
+    cache = QueryCache(max_entries=2)
+    cache.set(1, "a", 3, ["a"])
+    cache.set(1, "b", 3, ["b"])
+    cache.get(1, "a", 3)
+    cache.set(1, "c", 3, ["c"])
+
+    assert cache.get(1, "b", 3) is None
+    assert cache.get(1, "a", 3) == ["a"]
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["hit_rate"] == 2 / 3
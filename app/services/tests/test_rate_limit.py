@@ -0,0 +1,60 @@
+import uuid
+
+import pytest
+
+from app.services import rate_limit
+from app.services.rate_limit import (
+    ConcurrencyLimiter,
+    MemoryBucketStore,
+    RateLimitExceeded,
+    SQLBucketStore,
+    admit,
+)
+
+
+@pytest.mark.parametrize("store", [MemoryBucketStore(), SQLBucketStore()])
+def test_bucket_allows_burst_then_reports_wait(store):
+    """
+    Test that a new bucket allows `capacity` requests at once, then tells
+    how long until the next one is allowed.
+    """
+    key = f"test:{uuid.uuid4().hex}"
+    assert [store.take(key, rate=1.0, capacity=3) for _ in range(3)] == [0, 0, 0]
+
+    wait = store.take(key, rate=1.0, capacity=3)
+    assert 0.9 < wait <= 1.0
+    # A refused request takes no tokens
+    assert 0.9 < store.take(key, rate=1.0, capacity=3) <= 1.0
+    assert store.take(f"{key}:other", rate=1.0, capacity=3) == 0
+
+
+@pytest.mark.parametrize("store", [MemoryBucketStore(), SQLBucketStore()])
+def test_global_refusal_does_not_charge_the_user(monkeypatch, store):
+    """
+    Test that requests refused because every user together is over the
+    limit leave the user's own quota untouched.
+    """
+    action = f"test-{uuid.uuid4().hex}"
+    monkeypatch.setitem(rate_limit.RATE_LIMITS, action, (2, 1))
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limit, "get_bucket_store", lambda: store)
+
+    admit(action, "other@example.com")
+    for _ in range(3):
+        with pytest.raises(RateLimitExceeded):
+            admit(action, "user@example.com")
+    assert store.take(f"{action}:user:user@example.com", 2 / 60, 2, 2) == 0
+
+
+def test_concurrency_limiter_refuses_with_503():
+    """
+    Test that callers beyond the limit are refused while the slots are held.
+    """
+    limiter = ConcurrencyLimiter(1)
+    with limiter.slot("queries"):
+        with pytest.raises(RateLimitExceeded) as refused:
+            with limiter.slot("queries"):
+                pass
+    assert refused.value.status_code == 503
+    with limiter.slot("queries"):
+        pass
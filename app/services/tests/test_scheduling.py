@@ -0,0 +1,135 @@
+import datetime
+import json
+import uuid
+
+import pytest
+
+from app.benchmarks.corpus import generate_pdf, generate_text
+from app.core import models
+from app.core.metrics import TASK_STAGE_DURATION
+from app.core.database import SessionLocal
+from app.services import scheduling
+from app.services.scheduling import (
+    IngestionLease,
+    IngestionSuperseded,
+    StageMetricsExport,
+    claim_task,
+    estimate_job_cost,
+    lane_for_cost,
+)
+
+
+def test_scanned_pdfs_go_to_the_large_lane(tmp_path):
+    """
+    Test that OCR-bound PDFs cost more than text PDFs and text files.
+    """
+    generate_pdf(str(tmp_path / "text.pdf"), 20)
+    generate_pdf(str(tmp_path / "scanned.pdf"), 20, scanned=True)
+    text_cost = estimate_job_cost("notes.txt", generate_text(2000).encode())
+    text_pdf_cost = estimate_job_cost("text.pdf", (tmp_path / "text.pdf").read_bytes())
+    scanned_cost = estimate_job_cost(
+        "scanned.pdf", (tmp_path / "scanned.pdf").read_bytes()
+    )
+
+    assert lane_for_cost(text_cost) == "small"
+    assert lane_for_cost(text_pdf_cost) == "small"
+    assert lane_for_cost(scanned_cost) == "large"
+    assert scanned_cost > text_pdf_cost > text_cost
+
+
+@pytest.mark.parametrize(
+    "lanes", [("large", "large"), (None, None), (None, "small"), ("small", None)]
+)
+def test_claim_task_caps_running_jobs_per_user(monkeypatch, lanes):
+    """
+    Test that a user's second job in a lane waits until the first finishes,
+    counting tasks without a lane as small ones.
+    """
+    monkeypatch.setitem(scheduling.USER_JOB_CAPS, lanes[0] or "small", 1)
+    user_email = f"{uuid.uuid4().hex}@example.com"
+    db = SessionLocal()
+    tasks = [
+        models.TaskStatus(
+            file_name=f"{i}.pdf",
+            file_path=f"{user_email}/{i}.pdf",
+            user_email=user_email,
+            status="processing",
+            lane=lane,
+        )
+        for i, lane in enumerate(lanes)
+    ]
+    db.add_all(tasks)
+    db.commit()
+    first, second = (task.task_id for task in tasks)
+
+    assert claim_task(first) is True
+    assert claim_task(second) is False
+
+    tasks[0].status = "completed"
+    db.commit()
+    db.close()
+    assert claim_task(second) is True
+
+
+def test_lease_stops_superseded_worker():
+    """
+    Test that a newer upload's job waits for the running one, which stops
+    at its next check, and that the older job is dropped afterwards.
+    """
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name="doc.pdf",
+        file_path=f"{uuid.uuid4().hex}/doc.pdf",
+        status="processing",
+        ingest_version=1,
+    )
+    db.add(task)
+    db.commit()
+
+    running = IngestionLease(task.task_id, 1)
+    assert running.acquire() is True
+    running.check()
+
+    task.ingest_version = 2
+    db.commit()
+    newer = IngestionLease(task.task_id, 2)
+    assert newer.acquire() is False
+    with pytest.raises(IngestionSuperseded):
+        running.check()
+    running.release()
+
+    assert newer.acquire() is True
+    with pytest.raises(IngestionSuperseded):
+        IngestionLease(task.task_id, 1).acquire()
+    newer.release()
+    db.close()
+
+
+def test_stage_timings_of_completed_tasks_are_exported_once():
+    """
+    Test that the stage timings a worker persisted are observed at scrape
+    time, each completed task only once.
+    """
+    export = StageMetricsExport(settle_seconds=0)
+    observed = TASK_STAGE_DURATION.labels(stage="embed")
+    before = observed.count
+
+    db = SessionLocal()
+    db.add(
+        models.TaskStatus(
+            file_name="report.pdf",
+            file_path="report.pdf",
+            user_email="metrics@example.com",
+            status="completed",
+            completed_at=datetime.datetime.now(datetime.timezone.utc),
+            processing_metrics=json.dumps(
+                {"stages": {"embed": 1.5, "parse": 0.2}, "counts": {}}
+            ),
+        )
+    )
+    db.commit()
+
+    assert export.collect(db) == 1
+    assert export.collect(db) == 0
+    assert observed.count == before + 1
+    db.close()
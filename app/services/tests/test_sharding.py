@@ -0,0 +1,143 @@
+import json
+
+import pytest
+
+from app.benchmarks.corpus import generate_pdf
+from app.core import models
+from app.core.database import SessionLocal
+from app.services.artifacts import LocalArtifactStore
+from app.services.embedding import HashingEmbedder
+from app.services.ingestion import (
+    complete_sharded_task,
+    parse_document,
+    process_document,
+    process_document_shard,
+)
+from app.services.scheduling import IngestionSuperseded
+from app.services.vector_store import LocalVectorStore
+
+
+class ListJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def enqueue(self, job, delay_seconds=0):
+        self.jobs.append(job)
+
+
+def test_large_pdf_is_processed_in_shards(monkeypatch, tmp_path):
+    """
+    Test that a PDF above SHARD_PAGES fans out one job per page range and
+    the task completes only after the last shard.
+    """
+    pdf_path = str(tmp_path / "long.pdf")
+    generate_pdf(pdf_path, 5)
+    store = LocalVectorStore(root_dir=str(tmp_path / "store"))
+    jobs = ListJobQueue()
+    monkeypatch.setattr("app.services.ingestion.SHARD_PAGES", 2)
+    monkeypatch.setattr("app.services.ingestion.development", True)
+    monkeypatch.setattr("app.services.ingestion.get_vector_store", lambda: store)
+    monkeypatch.setattr("app.services.ingestion.get_job_queue", lambda: jobs)
+    artifacts = LocalArtifactStore(root_dir=str(tmp_path / "artifacts"))
+    monkeypatch.setattr("app.services.ingestion.get_artifact_store", lambda: artifacts)
+    monkeypatch.setattr(
+        "app.services.embedding.get_embedder", lambda: HashingEmbedder(dimensions=32)
+    )
+
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name="long.pdf",
+        file_path=pdf_path,
+        user_email="shards@example.com",
+        status="processing",
+        lane="large",
+    )
+    db.add(task)
+    db.commit()
+    task_id = task.task_id
+
+    process_document(task_id)
+    assert [job["shard_index"] for job in jobs.jobs] == [0, 1, 2]
+    shards = (
+        db.query(models.DocumentShard)
+        .filter(models.DocumentShard.task_id == task_id)
+        .order_by(models.DocumentShard.shard_index)
+        .all()
+    )
+    assert [(s.page_start, s.page_end) for s in shards] == [(0, 2), (2, 4), (4, 5)]
+
+    for job in reversed(jobs.jobs):
+        db.refresh(task)
+        assert task.status == "processing"
+        process_document_shard(task_id, job["shard_index"])
+
+    db.refresh(task)
+    assert task.status == "completed"
+    assert json.loads(task.processing_metrics)["counts"]["pages"] == 5
+    hits = store.search(pdf_path, [1.0] * 32, limit=1000)
+    indices = [hit["chunk_index"] for hit in hits]
+    assert indices and len(indices) == len(set(indices))
+    assert {index // 100_000 for index in indices} == {0, 1, 2}
+    db.close()
+
+
+def test_shards_stop_once_the_task_failed_or_was_uploaded_again(monkeypatch, tmp_path):
+    """
+    Test that a running shard stops before storing anything when a sibling
+    shard fails the task, and that a stale version never completes it.
+    """
+    pdf_path = str(tmp_path / "long.pdf")
+    generate_pdf(pdf_path, 4)
+    store = LocalVectorStore(root_dir=str(tmp_path / "store"))
+    jobs = ListJobQueue()
+    monkeypatch.setattr("app.services.ingestion.SHARD_PAGES", 2)
+    monkeypatch.setattr("app.services.ingestion.development", True)
+    monkeypatch.setattr("app.services.ingestion.get_vector_store", lambda: store)
+    monkeypatch.setattr("app.services.ingestion.get_job_queue", lambda: jobs)
+    monkeypatch.setattr("app.services.ingestion.CHECKPOINTS_ENABLED", False)
+    monkeypatch.setattr(
+        "app.services.embedding.get_embedder", lambda: HashingEmbedder(dimensions=32)
+    )
+
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name="long.pdf",
+        file_path=pdf_path,
+        user_email="shards@example.com",
+        status="processing",
+        lane="large",
+        ingest_version=1,
+    )
+    db.add(task)
+    db.commit()
+    task_id = task.task_id
+    process_document(task_id)
+
+    def parse_while_a_sibling_fails(*args, **kwargs):
+        other = SessionLocal()
+        other.query(models.TaskStatus).filter(
+            models.TaskStatus.task_id == task_id
+        ).update({models.TaskStatus.status: "failed"})
+        other.commit()
+        other.close()
+        return parse_document(*args, **kwargs)
+
+    monkeypatch.setattr(
+        "app.services.ingestion.parse_document", parse_while_a_sibling_fails
+    )
+    with pytest.raises(IngestionSuperseded):
+        process_document_shard(task_id, 0, version=1)
+    assert store.search(pdf_path, [1.0] * 32, limit=10) == []
+
+    # Every shard finished, but the document was uploaded again meanwhile
+    db.refresh(task)
+    task.status = "processing"
+    task.ingest_version = 2
+    db.query(models.DocumentShard).filter(
+        models.DocumentShard.task_id == task_id
+    ).update({models.DocumentShard.status: "completed"})
+    db.commit()
+    assert not complete_sharded_task(task_id, version=1)
+    db.refresh(task)
+    assert task.status == "processing"
+    db.close()
@@ -0,0 +1,93 @@
+import datetime
+import uuid
+from unittest.mock import patch
+
+from weaviate.classes.tenants import Tenant
+
+from app.benchmarks.fakes import FakeWeaviateClient
+from app.core import models
+from app.core.database import SessionLocal
+from app.services import weaviate_client
+from app.services.tenants import migrate_to_tenants, offload_idle_tenants
+from app.services.weaviate_client import TENANT_CHUNK_COLLECTION, tenant_name
+
+
+def add_task(db, user_email, file_path, completed_days_ago=0):
+    completed_at = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        days=completed_days_ago
+    )
+    task = models.TaskStatus(
+        file_name=file_path.rsplit("/", 1)[-1],
+        file_path=file_path,
+        user_email=user_email,
+        status="completed",
+        created_at=completed_at,
+        completed_at=completed_at,
+    )
+    db.add(task)
+    db.commit()
+    return task
+
+
+def test_migrated_chunks_are_searched_per_tenant():
+    """
+    Test that migration moves each chunk to its owner's tenant, and that
+    tenant-aware searches and deletes only see that user's chunks.
+    """
+    alice, bob = (f"{name}-{uuid.uuid4().hex}@example.com" for name in ("a", "b"))
+    db = SessionLocal()
+    add_task(db, alice, f"{alice}/notes.txt")
+    add_task(db, bob, f"{bob}/notes.txt")
+    client = FakeWeaviateClient({})
+    chunks = client.collections.get("DocumentChunk")
+    for owner, vector in ((alice, [1.0, 0.0]), (bob, [0.0, 1.0])):
+        chunks.add({"document_name": f"{owner}/notes.txt", "text": owner}, vector)
+    chunks.add({"document_name": "unknown/notes.txt", "text": "orphan"}, [1.0, 1.0])
+
+    result = migrate_to_tenants(client, db, delete_source=True)
+    db.close()
+
+    assert result["moved"] == 2 and result["orphaned"] == 1
+    # Chunks without a known owner keep the source collection alive
+    assert client.collections.exists("DocumentChunk")
+    with patch.object(weaviate_client, "WEAVIATE_MULTI_TENANCY", True), patch.object(
+        weaviate_client, "get_client", lambda: client
+    ):
+        hits = weaviate_client.search_document_chunks(
+            f"{alice}/notes.txt", [[0.0, 1.0]], limit=5, tenant=alice
+        )[0]
+        assert [hit["text"] for hit in hits] == [alice]
+
+        weaviate_client.delete_existing_document_chunks(
+            f"{alice}/notes.txt", tenant=alice
+        )
+        # A user without a tenant yet has nothing to delete
+        weaviate_client.delete_existing_document_chunks(
+            "new@example.com/notes.txt", tenant="new@example.com"
+        )
+    tenants = client.collections.get(TENANT_CHUNK_COLLECTION)
+    assert tenants.with_tenant(tenant_name(alice)).objects == []
+    assert len(tenants.with_tenant(tenant_name(bob)).objects) == 1
+    assert not tenants.tenants.exists(tenant_name("new@example.com"))
+
+
+def test_idle_tenants_are_offloaded():
+    """
+    Test that only tenants of users idle for longer than the limit are
+    deactivated.
+    """
+    idle, active = (f"{name}-{uuid.uuid4().hex}@example.com" for name in ("i", "a"))
+    db = SessionLocal()
+    add_task(db, idle, f"{idle}/old.txt", completed_days_ago=30)
+    add_task(db, active, f"{active}/old.txt", completed_days_ago=30)
+    add_task(db, active, f"{active}/new.txt")
+    client = FakeWeaviateClient({})
+    tenants = client.collections.get(TENANT_CHUNK_COLLECTION)
+    tenants.tenants.create([Tenant(name=tenant_name(user)) for user in (idle, active)])
+
+    offloaded = offload_idle_tenants(client, db, idle_seconds=7 * 24 * 3600)
+    db.close()
+
+    assert tenant_name(idle) in offloaded
+    assert tenant_name(active) not in offloaded
+    assert tenants.tenants.get()[tenant_name(idle)].activity_status == "INACTIVE"
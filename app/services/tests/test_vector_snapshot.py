@@ -0,0 +1,89 @@
+import uuid
+
+import numpy as np
+import pytest
+
+from app.benchmarks.fakes import FakeWeaviateClient
+from app.core import models
+from app.core.database import SessionLocal
+from app.services.utils import vector_snapshot
+from app.services.weaviate_client import object_uuid, with_document_id
+
+
+def make_source(documents):
+    client = FakeWeaviateClient({})
+    chunks = client.collections.get("DocumentChunk")
+    for document_name, count in documents.items():
+        for i in range(count):
+            chunks.add(
+                with_document_id(
+                    {"document_name": document_name, "chunk_index": i, "text": str(i)}
+                ),
+                [float(i), 1.0, 0.5],
+                uuid=object_uuid(document_name, i),
+            )
+    return client
+
+
+def test_snapshot_import_resumes_after_failed_part(tmp_path, monkeypatch):
+    """
+    Test that a snapshot is imported into a new collection with its UUIDs
+    and vectors, and that a re-run only writes the parts that failed.
+    """
+    source = make_source({"a@example.com/a.txt": 3, "b@example.com/b.txt": 2})
+    manifest = vector_snapshot.export_snapshot(source, str(tmp_path), part_size=2)
+    assert manifest["objects"] == 5 and len(manifest["parts"]) == 3
+    assert np.load(tmp_path / "part-00000.npy").dtype == np.float32
+
+    target = FakeWeaviateClient({})
+    write_objects = vector_snapshot.write_objects
+
+    def failing_write(collection, objects):
+        if any(o["properties"]["document_name"].startswith("b@") for o in objects):
+            raise Exception("Failed to write 1 of 1 objects")
+        write_objects(collection, objects)
+
+    monkeypatch.setattr(vector_snapshot, "write_objects", failing_write)
+    with pytest.raises(Exception, match="Failed to write"):
+        vector_snapshot.import_snapshot(
+            str(tmp_path), "DocumentChunkV2", workers=2, client_factory=lambda: target
+        )
+
+    monkeypatch.setattr(vector_snapshot, "write_objects", write_objects)
+    result = vector_snapshot.import_snapshot(
+        str(tmp_path), "DocumentChunkV2", workers=2, client_factory=lambda: target
+    )
+
+    assert result["parts"] < 3 and result["skipped_parts"] == 3 - result["parts"]
+    copied = {str(o.uuid): o for o in target.collections.get("DocumentChunkV2").objects}
+    originals = source.collections.get("DocumentChunk").objects
+    assert set(copied) == {str(o.uuid) for o in originals}
+    for obj in originals:
+        np.testing.assert_array_equal(copied[str(obj.uuid)].vector, obj.vector)
+        assert copied[str(obj.uuid)].properties == obj.properties
+
+
+def test_snapshot_of_single_task(tmp_path):
+    """
+    Test that exporting a task only includes the chunks of its document.
+    """
+    owner = f"{uuid.uuid4().hex}@example.com"
+    document_name = f"{owner}/report.txt"
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name="report.txt",
+        file_path=document_name,
+        user_email=owner,
+        status="completed",
+    )
+    db.add(task)
+    db.commit()
+    task_id = task.task_id
+    db.close()
+    source = make_source({document_name: 4, "other@example.com/x.txt": 3})
+
+    manifest = vector_snapshot.export_snapshot(source, str(tmp_path), [task_id])
+
+    _, rows = vector_snapshot.read_part(str(tmp_path), manifest["parts"][0]["name"])
+    assert manifest["objects"] == 4
+    assert {row["properties"]["document_name"] for row in rows} == {document_name}
@@ -0,0 +1,116 @@
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.datasets import infer_schema
+from app.services.vector_store import LocalVectorStore
+
+
+def make_chunks(document_name, vectors):
+    return [
+        {
+            "document_name": document_name,
+            "chunk_index": i,
+            "text": f"chunk {i}",
+            "embedding": list(v),
+        }
+        for i, v in enumerate(vectors)
+    ]
+
+
+def test_local_search_returns_nearest_chunks(tmp_path):
+    """
+    Test exact top-k search of the local vector store.
+    """
+    store = LocalVectorStore(root_dir=str(tmp_path))
+    vectors = np.eye(4, dtype=np.float32)
+    store.store_chunks(make_chunks("doc.txt", vectors))
+
+    hits = store.search("doc.txt", [0.1, 0.9, 0.0, 0.0], limit=2)
+
+    assert [hit["text"] for hit in hits] == ["chunk 1", "chunk 0"]
+    assert hits[0]["distance"] < hits[1]["distance"]
+    assert "embedding" not in hits[0]
+
+
+def test_local_search_is_scoped_to_document(tmp_path):
+    """
+    Test that chunks of other documents are never returned.
+    """
+    store = LocalVectorStore(root_dir=str(tmp_path))
+    store.store_chunks(make_chunks("a.txt", np.eye(2)))
+    store.store_chunks(make_chunks("b.txt", np.eye(2)))
+    store.delete_document_chunks("a.txt")
+
+    assert store.search("a.txt", [1.0, 0.0]) == []
+    assert len(store.search("b.txt", [1.0, 0.0])) == 2
+
+
+def test_local_search_during_writes(tmp_path):
+    """
+    Test that searches running while chunks are appended always find a
+    property for every vector they read.
+    """
+    store = LocalVectorStore(root_dir=str(tmp_path), ann_threshold=8)
+    rng = np.random.default_rng(0)
+    store.store_chunks(make_chunks("doc.txt", rng.normal(size=(4, 8))))
+    errors = []
+
+    def search(seed):
+        queries = np.random.default_rng(seed).normal(size=(50, 8))
+        try:
+            for query in queries:
+                assert store.search("doc.txt", query, limit=4)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=search, args=(i,)) for i in range(4)]
+    for reader in readers:
+        reader.start()
+    for _ in range(30):
+        store.store_chunks(make_chunks("doc.txt", rng.normal(size=(4, 8))))
+    for reader in readers:
+        reader.join()
+    assert errors == []
+
+
+def test_local_ann_matches_exact_search(tmp_path):
+    """
+    Test that the IVF index finds the same nearest chunk as exact search.
+    """
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(500, 16)).astype(np.float32)
+    exact = LocalVectorStore(root_dir=str(tmp_path / "exact"))
+    ann = LocalVectorStore(root_dir=str(tmp_path / "ann"), ann_threshold=100)
+    exact.store_chunks(make_chunks("doc.txt", vectors))
+    ann.store_chunks(make_chunks("doc.txt", vectors))
+
+    queries = vectors[:20] + 0.01
+    exact_hits = exact.search_many("doc.txt", queries, limit=1)
+    ann_hits = ann.search_many("doc.txt", queries, limit=1)
+
+    assert [h[0]["chunk_index"] for h in ann_hits] == [
+        h[0]["chunk_index"] for h in exact_hits
+    ]
+
+
+def test_local_aggregate(tmp_path):
+    """
+    Test aggregation of a numeric field over a structured JSON dataset.
+    """
+    store = LocalVectorStore(root_dir=str(tmp_path))
+    rows = [
+        {"name": "a", "age": 20, "address.zip": "01234"},
+        {"name": "b", "age": "40", "address.zip": "05678"},
+    ]
+    store.store_structured_json("players.json", rows, infer_schema(rows))
+
+    result = store.aggregate("players.json", "age")
+
+    assert result["count"] == 2
+    assert result["maximum"] == 40
+    assert result["mean"] == 30
+    assert result["min_user_details"][0]["name"] == "a"
+    with pytest.raises(ValueError, match="numeric fields: age"):
+        store.aggregate("players.json", "address.zip")
@@ -0,0 +1,156 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.benchmarks.fakes import FakeWeaviateClient
+from app.core import models
+from app.core.database import SessionLocal
+from app.services import weaviate_client
+from app.services.embedding import HashingEmbedder
+from app.services.ingestion import process_document
+from app.services.vector_store import WeaviateVectorStore
+
+
+class FlakyBatch:
+    """
+    Batch that rejects every odd chunk `failures` times before storing it.
+    """
+
+    def __init__(self, collection, failures: dict, attempts: int):
+        self.collection = collection
+        self.failures = failures
+        self.attempts = attempts
+
+    def __enter__(self):
+        self.collection.batch.failed_objects = []
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_object(self, properties, vector=None, uuid=None):
+        if properties["chunk_index"] % 2:
+            self.failures.setdefault(uuid, self.attempts)
+            if self.failures[uuid]:
+                self.failures[uuid] -= 1
+                self.collection.batch.failed_objects.append(
+                    SimpleNamespace(
+                        object_=SimpleNamespace(uuid=uuid), message="timeout"
+                    )
+                )
+                return
+        self.collection.add(properties, vector, uuid=uuid)
+
+
+@pytest.fixture
+def flaky_weaviate(monkeypatch):
+    client = FakeWeaviateClient({})
+    failures = {}
+
+    def use(attempts):
+        monkeypatch.setattr(
+            weaviate_client,
+            "open_batch",
+            lambda collection: FlakyBatch(collection, failures, attempts),
+        )
+        return client.collections.get("DocumentChunk")
+
+    monkeypatch.setattr(weaviate_client, "get_client", lambda: client)
+    monkeypatch.setattr(weaviate_client, "BATCH_RETRY_BACKOFF_SECONDS", 0)
+    return use
+
+
+def make_chunks(count):
+    return [
+        {
+            "document_name": "w@example.com/doc.txt",
+            "chunk_index": i,
+            "text": str(i),
+            "embedding": [1.0, float(i)],
+        }
+        for i in range(count)
+    ]
+
+
+def test_only_failed_objects_are_retried(flaky_weaviate):
+    """
+    Test that objects failing twice are rewritten without duplicating the
+    ones already stored, and that the caller's chunks are left intact.
+    """
+    collection = flaky_weaviate(attempts=2)
+    chunks = make_chunks(6)
+
+    weaviate_client.store_batch_chunks_in_weaviate(chunks)
+
+    assert sorted(o.properties["chunk_index"] for o in collection.objects) == list(
+        range(6)
+    )
+    assert all("embedding" in chunk for chunk in chunks)
+
+
+def test_lost_objects_fail_the_task(flaky_weaviate, monkeypatch, tmp_path):
+    """
+    Test that a document whose chunks cannot all be written is marked
+    failed, with the write counts in its processing metrics.
+    """
+    flaky_weaviate(attempts=100)
+    monkeypatch.setattr(weaviate_client, "WEAVIATE_BATCH_RETRIES", 1)
+    monkeypatch.setattr("app.services.ingestion.development", True)
+    monkeypatch.setattr("app.services.ingestion.CHECKPOINTS_ENABLED", False)
+    monkeypatch.setattr(
+        "app.services.ingestion.get_vector_store", lambda: WeaviateVectorStore()
+    )
+    monkeypatch.setattr(
+        "app.services.embedding.get_embedder", lambda: HashingEmbedder(dimensions=16)
+    )
+    path = tmp_path / "doc.txt"
+    path.write_text("\n\n".join(f"Paragraph {i}. " * 40 for i in range(6)))
+    db = SessionLocal()
+    task = models.TaskStatus(
+        file_name="doc.txt",
+        file_path=str(path),
+        user_email="w@example.com",
+        status="processing",
+    )
+    db.add(task)
+    db.commit()
+
+    with pytest.raises(Exception, match="Failed to write"):
+        process_document(task.task_id)
+
+    db.refresh(task)
+    counts = json.loads(task.processing_metrics)["counts"]
+    assert task.status == "failed"
+    assert counts["vector_objects_failed"] > 0
+    assert (
+        counts["vector_objects"] + counts["vector_objects_failed"] == counts["chunks"]
+    )
+    db.close()
+
+
+@pytest.mark.parametrize(
+    "compression, quantizer", [("none", None), ("pq", "pq"), ("bq", "bq"), ("sq", "sq")]
+)
+def test_vector_index_quantizer(compression, quantizer):
+    """
+    Test that VECTOR_COMPRESSION selects the HNSW quantizer, and that BQ
+    and SQ rescore with the uncompressed vectors.
+    """
+    config = weaviate_client.document_chunk_vector_index_config(compression)
+
+    if quantizer is None:
+        assert config.quantizer is None
+    else:
+        assert config.quantizer.quantizer_name() == quantizer
+    if compression in ("bq", "sq"):
+        assert config.quantizer.rescoreLimit == weaviate_client.VECTOR_RESCORE_LIMIT
+
+
+def test_unknown_vector_compression_is_refused():
+    """
+    Test that a misspelled VECTOR_COMPRESSION fails instead of silently
+    creating an uncompressed index.
+    """
+    with pytest.raises(ValueError, match="Unsupported vector compression"):
+        weaviate_client.document_chunk_vector_index_config("rq")
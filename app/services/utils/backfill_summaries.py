@@ -0,0 +1,31 @@
+"""
+Store the summary vector of documents processed before summary vectors
+existed, so library queries pick them by similarity like any other.
+
+    python -m app.services.utils.backfill_summaries [--batch-size N]
+
+The vectors are computed from the chunk vectors already in the vector
+store; nothing is embedded again. Running it again only visits documents
+still without a summary vector.
+"""
+import argparse
+
+from ...core.database import SessionLocal
+from ..library import backfill_summary_vectors
+from ..vector_store import get_vector_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        print(backfill_summary_vectors(db, get_vector_store(), args.batch_size))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
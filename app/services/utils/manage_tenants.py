@@ -0,0 +1,45 @@
+"""
+Manage the per-user tenants of TenantDocumentChunk (WEAVIATE_MULTI_TENANCY).
+
+    python -m app.services.utils.manage_tenants migrate [--delete-source]
+    python -m app.services.utils.manage_tenants offload [--idle-seconds N]
+
+`migrate` copies the chunks of the global DocumentChunk collection to their
+owner's tenant; run it before enabling WEAVIATE_MULTI_TENANCY. `offload`
+moves the tenants of idle users to TENANT_IDLE_STATUS; run it periodically.
+"""
+import argparse
+
+from ...core.config import TENANT_IDLE_SECONDS
+from ...core.database import SessionLocal
+from ..tenants import migrate_to_tenants, offload_idle_tenants
+from ..weaviate_client import get_client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate")
+    migrate.add_argument("--delete-source", action="store_true")
+    offload = commands.add_parser("offload")
+    offload.add_argument("--idle-seconds", type=int, default=TENANT_IDLE_SECONDS)
+    offload.add_argument("--status", help="INACTIVE or OFFLOADED")
+    args = parser.parse_args()
+
+    client = get_client()
+    db = SessionLocal()
+    try:
+        if args.command == "migrate":
+            print(migrate_to_tenants(client, db, delete_source=args.delete_source))
+        else:
+            offloaded = offload_idle_tenants(
+                client, db, idle_seconds=args.idle_seconds, status=args.status
+            )
+            print(f"Offloaded {len(offloaded)} tenants")
+    finally:
+        db.close()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Bring existing Weaviate collections to the current schema.
+
+Adds the exact-match `document_id` filter property and backfills it on
+every object, and splits the records of the former fixed-schema
+StructureJSONPlayer collection into one dataset collection per document,
+with inferred field types. Run it once after deploying a schema change,
+before serving queries:
+
+    python -m app.services.utils.migrate_schema --dry-run   # report only
+    python -m app.services.utils.migrate_schema
+"""
+import argparse
+
+from ..datasets import infer_schema
+from ..weaviate_client import (
+    create_document_chunk_collection,
+    document_id_property,
+    get_client,
+    with_document_id,
+    write_dataset,
+)
+
+COLLECTIONS = {
+    "DocumentChunk": create_document_chunk_collection,
+}
+
+# Structured JSON collection of every document before datasets had their own
+LEGACY_STRUCTURED_JSON_COLLECTION = "StructureJSONPlayer"
+
+
+def copy_objects(source, target, missing_only: bool = False) -> int:
+    """
+    Write the objects of `source` to `target` with their UUIDs, vectors and
+    a `document_id`. Writing to the same collection upserts in place.
+    :param missing_only: Skip objects that already have a `document_id`
+    :return: Number of objects written
+    """
+    written = 0
+    with target.batch.fixed_size(batch_size=200) as batch:
+        for obj in source.iterator(include_vector=True):
+            if missing_only and obj.properties.get("document_id"):
+                continue
+            batch.add_object(
+                properties=with_document_id(obj.properties),
+                vector=obj.vector or None,
+                uuid=obj.uuid,
+            )
+            written += 1
+    failed = target.batch.failed_objects
+    if failed:
+        raise Exception(f"Failed to write {len(failed)} objects to {target.name}")
+    return written
+
+
+def split_legacy_datasets(client) -> tuple[int, int]:
+    """
+    Move the records of StructureJSONPlayer into a dataset collection per
+    document, then delete it.
+    :return: Number of datasets and of records written
+    """
+    legacy = client.collections.get(LEGACY_STRUCTURED_JSON_COLLECTION)
+    by_document = {}
+    for obj in legacy.iterator():
+        properties = dict(obj.properties)
+        document_name = properties.pop("document_name")
+        properties.pop("document_id", None)
+        by_document.setdefault(document_name, []).append(properties)
+    written = 0
+    for document_name, rows in by_document.items():
+        written += write_dataset(client, document_name, rows, infer_schema(rows))
+    client.collections.delete(LEGACY_STRUCTURED_JSON_COLLECTION)
+    return len(by_document), written
+
+
+def migrate_schema(client, dry_run: bool = False) -> list[str]:
+    """
+    Migrate every collection that is behind the current schema.
+    :return: Description of each change made (or needed, with `dry_run`)
+    """
+    changes = []
+    existing = client.collections.list_all()
+    for name, create in COLLECTIONS.items():
+        if name not in existing:
+            changes.append(f"{name}: create")
+            if not dry_run:
+                create(client)
+            continue
+
+        collection = client.collections.get(name)
+        properties = {p.name: p for p in collection.config.get().properties}
+        if "document_id" not in properties:
+            changes.append(f"{name}: add document_id")
+            if not dry_run:
+                collection.config.add_property(document_id_property())
+        if not dry_run:
+            backfilled = copy_objects(collection, collection, missing_only=True)
+            if backfilled:
+                changes.append(f"{name}: backfill document_id ({backfilled} objects)")
+
+    if LEGACY_STRUCTURED_JSON_COLLECTION in existing:
+        changes.append(
+            f"{LEGACY_STRUCTURED_JSON_COLLECTION}: split into dataset collections"
+        )
+        if not dry_run:
+            datasets, records = split_legacy_datasets(client)
+            changes[-1] += f" ({datasets} datasets, {records} records)"
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    client = get_client()
+    try:
+        changes = migrate_schema(client, dry_run=args.dry_run)
+    finally:
+        client.close()
+    for change in changes:
+        print(change)
+    if not changes:
+        print("Schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Export document chunks with their vectors, and import them again, so the
+schema can change or the data can move to another cluster without running
+`process_document` (and paying for embeddings) for every task.
+
+    python -m app.services.utils.vector_snapshot export SNAPSHOT_DIR [--task-id ID ...]
+    python -m app.services.utils.vector_snapshot import SNAPSHOT_DIR [--collection NAME]
+
+A snapshot is a directory of parts: `part-NNNNN.npy` holds the float32
+vectors and `part-NNNNN.jsonl` one line per vector with the object's UUID,
+tenant and properties. `manifest.json` is written last, so an interrupted
+export is never imported. Imports write parts in parallel and record the
+parts done in `import-<collection>.json`: running the same import again
+resumes after the last completed part. Point WEAVIATE_URL at another
+cluster to import there.
+"""
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from weaviate.classes.query import Sort
+
+from ...core import models
+from ...core.config import WEAVIATE_MULTI_TENANCY
+from ...core.database import SessionLocal
+from ..weaviate_client import (
+    TENANT_CHUNK_COLLECTION,
+    chunk_collection,
+    create_document_chunk_collection,
+    document_filter,
+    get_client,
+    with_document_id,
+    write_objects,
+)
+
+PART_SIZE = 5000
+# Objects fetched per request when exporting single documents
+PAGE_SIZE = 500
+
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class SnapshotWriter:
+    """
+    Buffers exported objects and writes them out a part at a time.
+    """
+
+    def __init__(self, out_dir: str, part_size: int = PART_SIZE):
+        self.out_dir = out_dir
+        self.part_size = part_size
+        self.parts = []
+        self.dimensions = None
+        self.skipped = 0
+        self._vectors = []
+        self._rows = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    def add(self, obj, tenant: str = None):
+        vector = next(iter((obj.vector or {}).values()), None)
+        if vector is None:
+            self.skipped += 1
+            return
+        self.dimensions = self.dimensions or len(vector)
+        self._vectors.append(vector)
+        self._rows.append(
+            {"uuid": str(obj.uuid), "tenant": tenant, "properties": obj.properties}
+        )
+        if len(self._rows) >= self.part_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        name = f"part-{len(self.parts):05d}"
+        vectors = np.asarray(self._vectors, dtype=np.float32)
+        _write_atomic(
+            os.path.join(self.out_dir, f"{name}.npy"), lambda f: np.save(f, vectors)
+        )
+        lines = "".join(json.dumps(row) + "\n" for row in self._rows)
+        _write_atomic(
+            os.path.join(self.out_dir, f"{name}.jsonl"),
+            lambda f: f.write(lines.encode("utf-8")),
+        )
+        self.parts.append({"name": name, "objects": len(self._rows)})
+        self._vectors, self._rows = [], []
+
+    def close(self, source: str) -> dict:
+        self._flush()
+        manifest = {
+            "source": source,
+            "dimensions": self.dimensions,
+            "objects": sum(part["objects"] for part in self.parts),
+            "parts": self.parts,
+        }
+        _write_atomic(
+            os.path.join(self.out_dir, "manifest.json"),
+            lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")),
+        )
+        return manifest
+
+
+def export_snapshot(
+    client, out_dir: str, task_ids: list[int] = None, part_size: int = PART_SIZE
+) -> dict:
+    """
+    Export the chunks of the given tasks, or of the whole chunk collection
+    (every tenant with WEAVIATE_MULTI_TENANCY), with their vectors.
+    :return: The snapshot manifest
+    """
+    writer = SnapshotWriter(out_dir, part_size)
+    if task_ids:
+        db = SessionLocal()
+        try:
+            tasks = (
+                db.query(models.TaskStatus)
+                .filter(models.TaskStatus.task_id.in_(task_ids))
+                .all()
+            )
+        finally:
+            db.close()
+        for task in tasks:
+            collection = chunk_collection(client, task.user_email)
+            offset = 0
+            while True:
+                page = collection.query.fetch_objects(
+                    filters=document_filter(task.file_path),
+                    include_vector=True,
+                    limit=PAGE_SIZE,
+                    offset=offset,
+                    sort=Sort.by_property("chunk_index"),
+                )
+                for obj in page.objects:
+                    writer.add(obj, tenant=collection.tenant)
+                if len(page.objects) < PAGE_SIZE:
+                    break
+                offset += PAGE_SIZE
+    elif WEAVIATE_MULTI_TENANCY:
+        collection = client.collections.get(TENANT_CHUNK_COLLECTION)
+        for tenant in sorted(collection.tenants.get()):
+            for obj in collection.with_tenant(tenant).iterator(include_vector=True):
+                writer.add(obj, tenant=tenant)
+    else:
+        for obj in client.collections.get("DocumentChunk").iterator(
+            include_vector=True
+        ):
+            writer.add(obj)
+
+    source = TENANT_CHUNK_COLLECTION if WEAVIATE_MULTI_TENANCY else "DocumentChunk"
+    manifest = writer.close(source)
+    if writer.skipped:
+        print(f"Skipped {writer.skipped} objects without a vector")
+    return manifest
+
+
+def read_part(snapshot_dir: str, name: str):
+    """
+    Vectors (memory-mapped) and rows of one part of a snapshot.
+    """
+    vectors = np.load(os.path.join(snapshot_dir, f"{name}.npy"), mmap_mode="r")
+    with open(os.path.join(snapshot_dir, f"{name}.jsonl"), encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    return vectors, rows
+
+
+def import_snapshot(
+    snapshot_dir: str,
+    collection_name: str = None,
+    workers: int = 4,
+    client_factory=get_client,
+) -> dict:
+    """
+    Write the objects of a snapshot to a collection, creating it with the
+    current schema if needed. Parts already imported into the collection
+    (per `import-<collection>.json`) are skipped.
+    :param collection_name: Target collection (default: the configured one)
+    :param workers: Parts written concurrently, each with its own client
+    :return: Counts of parts and objects imported and skipped
+    """
+    with open(os.path.join(snapshot_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    multi_tenancy = WEAVIATE_MULTI_TENANCY
+    collection_name = collection_name or (
+        TENANT_CHUNK_COLLECTION if multi_tenancy else "DocumentChunk"
+    )
+    state_path = os.path.join(snapshot_dir, f"import-{collection_name}.json")
+    done = set()
+    if os.path.exists(state_path):
+        with open(state_path, encoding="utf-8") as f:
+            done = set(json.load(f)["parts"])
+
+    client = client_factory()
+    try:
+        if collection_name not in client.collections.list_all():
+            create_document_chunk_collection(
+                client, collection_name, multi_tenancy=multi_tenancy
+            )
+    finally:
+        client.close()
+
+    lock = threading.Lock()
+
+    def import_part(part):
+        vectors, rows = read_part(snapshot_dir, part["name"])
+        by_tenant = {}
+        for vector, row in zip(vectors, rows):
+            if multi_tenancy and not row["tenant"]:
+                raise Exception(
+                    f"{part['name']} has no tenants: import it without "
+                    "WEAVIATE_MULTI_TENANCY and run manage_tenants migrate"
+                )
+            by_tenant.setdefault(row["tenant"] if multi_tenancy else None, []).append(
+                {
+                    "uuid": row["uuid"],
+                    "properties": with_document_id(row["properties"]),
+                    "vector": vector.tolist(),
+                }
+            )
+        part_client = client_factory()
+        try:
+            collection = part_client.collections.get(collection_name)
+            for tenant, objects in by_tenant.items():
+                target = collection.with_tenant(tenant) if tenant else collection
+                write_objects(target, objects)
+        finally:
+            part_client.close()
+        with lock:
+            done.add(part["name"])
+            _write_atomic(
+                state_path,
+                lambda f: f.write(json.dumps({"parts": sorted(done)}).encode("utf-8")),
+            )
+        return len(rows)
+
+    pending = [part for part in manifest["parts"] if part["name"] not in done]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        imported = sum(executor.map(import_part, pending))
+    return {
+        "parts": len(pending),
+        "objects": imported,
+        "skipped_parts": len(manifest["parts"]) - len(pending),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export")
+    export.add_argument("snapshot_dir")
+    export.add_argument("--task-id", type=int, action="append", dest="task_ids")
+    export.add_argument("--part-size", type=int, default=PART_SIZE)
+    import_ = commands.add_parser("import")
+    import_.add_argument("snapshot_dir")
+    import_.add_argument("--collection")
+    import_.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        client = get_client()
+        try:
+            manifest = export_snapshot(
+                client, args.snapshot_dir, args.task_ids, args.part_size
+            )
+        finally:
+            client.close()
+        print(
+            f"Exported {manifest['objects']} objects in "
+            f"{len(manifest['parts'])} parts to {args.snapshot_dir}"
+        )
+    else:
+        print(import_snapshot(args.snapshot_dir, args.collection, args.workers))
+
+
+if __name__ == "__main__":
+    main()
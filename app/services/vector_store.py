@@ -0,0 +1,464 @@
+# Pluggable vector store: Weaviate Cloud or a local in-process index
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from ..core.config import (
+    LOCAL_ANN_NPROBE,
+    LOCAL_ANN_THRESHOLD,
+    LOCAL_VECTOR_STORE_DIR,
+    VECTOR_STORE,
+)
+from . import weaviate_client
+from .chunks import Chunk, embedding_matrix
+from .datasets import aggregatable_field, dataset_rows
+
+
+class VectorStore:
+    """
+    Interface for storing document chunks with their embeddings,
+    searching them and aggregating structured JSON records.
+
+    Chunk methods take the `tenant` owning the documents (the user's email);
+    backends may keep each tenant's chunks in a separate index.
+    """
+
+    name = ""
+
+    def store_chunks(self, chunks: list[Chunk], tenant: str = None):
+        """
+        Store document chunks (Chunk records or chunk dicts), each with an
+        'embedding'.
+        """
+        raise NotImplementedError
+
+    def delete_document_chunks(self, document_name: str, tenant: str = None):
+        """
+        Delete all chunks of a document.
+        """
+        raise NotImplementedError
+
+    def search(
+        self, document_name: str, vector, limit: int = 3, tenant: str = None
+    ) -> list[dict]:
+        """
+        Return the `limit` chunks of a document closest to the vector.
+        """
+        return self.search_many(document_name, [vector], limit=limit, tenant=tenant)[0]
+
+    def search_many(
+        self, document_name: str, vectors: list, limit: int = 3, tenant: str = None
+    ) -> list[list[dict]]:
+        """
+        Return the `limit` closest chunks of a document for each vector.
+        Every hit is the chunk properties plus its cosine 'distance'.
+        """
+        raise NotImplementedError
+
+    def search_documents(
+        self, document_names: list[str], vector, limit: int = 3, tenant: str = None
+    ) -> list[dict]:
+        """
+        Return the `limit` chunks closest to the vector across several
+        documents, closest first.
+        """
+        hits = [
+            hit
+            for document_name in document_names
+            for hit in self.search_many(
+                document_name, [vector], limit=limit, tenant=tenant
+            )[0]
+        ]
+        return sorted(hits, key=lambda hit: hit["distance"])[:limit]
+
+    def document_vectors(self, document_name: str, tenant: str = None) -> np.ndarray:
+        """
+        The stored vectors of the chunks of a document, a float32 row per
+        chunk.
+        """
+        raise NotImplementedError
+
+    def store_structured_json(self, document_name: str, rows: list[dict], schema: dict):
+        """
+        Store the records of a structured JSON document as a dataset with
+        the given schema, replacing any earlier one.
+        :param rows: Records flattened with `datasets.flatten_record`
+        :param schema: Dataset schema from `datasets.infer_schema`
+        """
+        raise NotImplementedError
+
+    def delete_structured_json(self, document_name: str):
+        """
+        Delete the structured JSON dataset of a document.
+        """
+        raise NotImplementedError
+
+    def structured_json_schema(self, document_name: str) -> dict:
+        """
+        The schema of the structured JSON dataset of a document.
+        """
+        raise NotImplementedError
+
+    def aggregate(self, document_name: str, field: str) -> dict:
+        """
+        Aggregate a numeric field over the structured JSON records of a document.
+        """
+        raise NotImplementedError
+
+    def is_ready(self) -> bool:
+        raise NotImplementedError
+
+    def ensure_schema(self):
+        """
+        Create the collections or indexes the store needs, if missing.
+        """
+
+    def connect(self):
+        """
+        Open the connections kept for the life of the process, if any.
+        """
+
+    def close(self):
+        """
+        Close the connections opened by connect().
+        """
+
+
+class WeaviateVectorStore(VectorStore):
+    """
+    Vector store backed by Weaviate Cloud.
+    """
+
+    name = "weaviate"
+
+    def store_chunks(self, chunks, tenant=None):
+        weaviate_client.store_batch_chunks_in_weaviate(chunks, tenant=tenant)
+
+    def delete_document_chunks(self, document_name, tenant=None):
+        weaviate_client.delete_existing_document_chunks(document_name, tenant=tenant)
+
+    def search_many(self, document_name, vectors, limit=3, tenant=None):
+        return weaviate_client.search_document_chunks(
+            document_name, [list(v) for v in vectors], limit=limit, tenant=tenant
+        )
+
+    def search_documents(self, document_names, vector, limit=3, tenant=None):
+        return weaviate_client.search_document_chunks(
+            document_names, [list(vector)], limit=limit, tenant=tenant
+        )[0]
+
+    def document_vectors(self, document_name, tenant=None):
+        vectors = weaviate_client.fetch_document_vectors(document_name, tenant=tenant)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+
+    def store_structured_json(self, document_name, rows, schema):
+        weaviate_client.store_structured_json_in_weaviate(document_name, rows, schema)
+
+    def delete_structured_json(self, document_name):
+        weaviate_client.delete_existing_json_agg(document_name)
+
+    def structured_json_schema(self, document_name):
+        return weaviate_client.get_structured_json_schema(document_name)
+
+    def aggregate(self, document_name, field):
+        return weaviate_client.aggregate_structured_json(document_name, field)
+
+    def is_ready(self):
+        with weaviate_client.get_client() as client:
+            return client.is_ready()
+
+    def ensure_schema(self):
+        weaviate_client.create_schema()
+
+    def connect(self):
+        weaviate_client.open_shared_client()
+
+    def close(self):
+        weaviate_client.close_shared_client()
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores per row, best first.
+    """
+    if k >= scores.shape[1]:
+        return np.argsort(-scores, axis=1)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    return np.take_along_axis(part, np.argsort(-part_scores, axis=1), axis=1)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store for dev, tests and small-tenant deployments.
+
+    Every document gets its own directory holding a float32 matrix of
+    normalized embeddings (`vectors.npy`, opened memory-mapped), the chunk
+    properties (`chunks.json`) and the structured JSON dataset
+    (`records.json` and its `schema.json`). Search is an exact top-k over batched dot products;
+    documents with at least `ann_threshold` chunks also get an IVF index
+    (`ann.npz`) so only the closest `nprobe` clusters are scanned.
+    Documents are already isolated, so the `tenant` is not used.
+    """
+
+    name = "local"
+    search_block_size = 65536
+
+    def __init__(
+        self,
+        root_dir: str = LOCAL_VECTOR_STORE_DIR,
+        ann_threshold: int = LOCAL_ANN_THRESHOLD,
+        nprobe: int = LOCAL_ANN_NPROBE,
+    ):
+        self.root_dir = root_dir
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _document_dir(self, document_name: str) -> str:
+        digest = hashlib.sha1(document_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.root_dir, digest)
+
+    def _read_json(self, path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_json(self, path: str, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _load_vectors(self, doc_dir: str):
+        path = os.path.join(doc_dir, "vectors.npy")
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode="r")
+
+    def _write_vectors(self, doc_dir: str, vectors: np.ndarray):
+        tmp_path = os.path.join(doc_dir, "vectors.tmp.npy")
+        np.save(tmp_path, vectors)
+        os.replace(tmp_path, os.path.join(doc_dir, "vectors.npy"))
+
+        ann_path = os.path.join(doc_dir, "ann.npz")
+        if len(vectors) >= self.ann_threshold:
+            centroids, order, offsets = self._build_ivf(vectors)
+            tmp_path = os.path.join(doc_dir, "ann.tmp.npz")
+            np.savez(tmp_path, centroids=centroids, order=order, offsets=offsets)
+            os.replace(tmp_path, ann_path)
+        elif os.path.exists(ann_path):
+            os.remove(ann_path)
+
+    def _build_ivf(self, vectors: np.ndarray, iterations: int = 10):
+        """
+        Spherical k-means over the normalized vectors.
+        Returns the centroids, the vector indices sorted by cluster and the
+        start offset of every cluster in that order.
+        """
+        n = len(vectors)
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, self.search_block_size):
+            block = vectors[start : start + self.search_block_size]
+            assignment[start : start + len(block)] = np.argmax(
+                block @ centroids.T, axis=1
+            )
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        return centroids.astype(np.float32), order, offsets
+
+    def store_chunks(self, chunks, tenant=None):
+        by_document = {}
+        for chunk in map(Chunk.coerce, chunks):
+            by_document.setdefault(chunk.document_name, []).append(chunk)
+
+        with self._lock:
+            for document_name, doc_chunks in by_document.items():
+                doc_dir = self._document_dir(document_name)
+                os.makedirs(doc_dir, exist_ok=True)
+                new_vectors = _normalize(embedding_matrix(doc_chunks))
+                existing = self._load_vectors(doc_dir)
+                if existing is not None:
+                    new_vectors = np.concatenate([existing, new_vectors])
+                properties = self._read_json(os.path.join(doc_dir, "chunks.json"))
+                properties.extend(c.properties() for c in doc_chunks)
+                # Properties first, so a reader in another process never
+                # finds more vectors than properties
+                self._write_json(os.path.join(doc_dir, "chunks.json"), properties)
+                self._write_vectors(doc_dir, new_vectors)
+
+    def delete_document_chunks(self, document_name, tenant=None):
+        doc_dir = self._document_dir(document_name)
+        with self._lock:
+            for file_name in ("vectors.npy", "chunks.json", "ann.npz"):
+                path = os.path.join(doc_dir, file_name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def search_many(self, document_name, vectors, limit=3, tenant=None):
+        doc_dir = self._document_dir(document_name)
+        # Files of one version of the document; the memory map keeps
+        # reading the vectors it opened after a writer replaces them
+        with self._lock:
+            matrix = self._load_vectors(doc_dir)
+            if matrix is None or len(matrix) == 0:
+                return [[] for _ in vectors]
+            properties = self._read_json(os.path.join(doc_dir, "chunks.json"))
+            ann = None
+            ann_path = os.path.join(doc_dir, "ann.npz")
+            if os.path.exists(ann_path):
+                with np.load(ann_path) as index:
+                    ann = (index["centroids"], index["order"], index["offsets"])
+        queries = _normalize(np.asarray(vectors, dtype=np.float32))
+
+        if ann is not None:
+            indices, scores = self._search_ivf(matrix, queries, limit, *ann)
+        else:
+            indices, scores = self._search_exact(matrix, queries, limit)
+
+        return [
+            [
+                {**properties[i], "distance": float(1.0 - s)}
+                for i, s in zip(row_indices, row_scores)
+                if i < len(properties)
+            ]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def _search_exact(self, matrix, queries, limit):
+        """
+        Exact top-k, scanning the matrix in blocks so a large memory-mapped
+        document is never loaded into memory at once.
+        """
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(matrix), self.search_block_size):
+            block = np.asarray(matrix[start : start + self.search_block_size])
+            scores = queries @ block.T
+            candidates = np.concatenate([best_scores, scores], axis=1)
+            candidate_indices = np.concatenate(
+                [
+                    best_indices,
+                    np.broadcast_to(np.arange(start, start + len(block)), scores.shape),
+                ],
+                axis=1,
+            )
+            top = _top_k(candidates, limit)
+            best_scores = np.take_along_axis(candidates, top, axis=1)
+            best_indices = np.take_along_axis(candidate_indices, top, axis=1)
+        return best_indices, best_scores
+
+    def _search_ivf(self, matrix, queries, limit, centroids, order, offsets):
+        nprobe = min(self.nprobe, len(centroids))
+        probes = _top_k(queries @ centroids.T, nprobe)
+        all_indices, all_scores = [], []
+        for query, clusters in zip(queries, probes):
+            candidates = np.sort(
+                np.concatenate([order[offsets[c] : offsets[c + 1]] for c in clusters])
+            )
+            scores = (np.asarray(matrix[candidates]) @ query)[np.newaxis, :]
+            top = _top_k(scores, limit)[0]
+            all_indices.append(candidates[top])
+            all_scores.append(scores[0, top])
+        return all_indices, all_scores
+
+    def document_vectors(self, document_name, tenant=None):
+        with self._lock:
+            matrix = self._load_vectors(self._document_dir(document_name))
+            if matrix is None:
+                return np.empty((0, 0), dtype=np.float32)
+            return np.array(matrix)
+
+    def store_structured_json(self, document_name, rows, schema):
+        doc_dir = self._document_dir(document_name)
+        with self._lock:
+            os.makedirs(doc_dir, exist_ok=True)
+            self._write_json(
+                os.path.join(doc_dir, "records.json"), dataset_rows(rows, schema)
+            )
+            self._write_json(os.path.join(doc_dir, "schema.json"), schema)
+
+    def delete_structured_json(self, document_name):
+        doc_dir = self._document_dir(document_name)
+        with self._lock:
+            for name in ("records.json", "schema.json"):
+                if os.path.exists(os.path.join(doc_dir, name)):
+                    os.remove(os.path.join(doc_dir, name))
+
+    def structured_json_schema(self, document_name):
+        path = os.path.join(self._document_dir(document_name), "schema.json")
+        if not os.path.exists(path):
+            raise ValueError(f"No structured JSON dataset stored for {document_name}")
+        return self._read_json(path)
+
+    def aggregate(self, document_name, field):
+        aggregatable_field(self.structured_json_schema(document_name), field)
+        records = self._read_json(
+            os.path.join(self._document_dir(document_name), "records.json")
+        )
+        values = [r[field] for r in records if field in r]
+        if not values:
+            return {
+                "count": len(records),
+                "maximum": None,
+                "minimum": None,
+                "mean": None,
+                "total": None,
+                "max_user_details": [],
+                "min_user_details": [],
+            }
+        maximum, minimum = max(values), min(values)
+        return {
+            "count": len(records),
+            "maximum": maximum,
+            "minimum": minimum,
+            "mean": sum(values) / len(values),
+            "total": sum(values),
+            "max_user_details": [r for r in records if r.get(field) == maximum],
+            "min_user_details": [r for r in records if r.get(field) == minimum],
+        }
+
+    def is_ready(self):
+        return os.path.isdir(self.root_dir) and os.access(self.root_dir, os.W_OK)
+
+
+_stores = {}
+
+
+def get_vector_store(backend: str = None) -> VectorStore:
+    """
+    Return the vector store selected by the VECTOR_STORE config.
+    Stores are created once per process and reused.
+    """
+    backend = backend or VECTOR_STORE
+    if backend not in _stores:
+        if backend == "weaviate":
+            _stores[backend] = WeaviateVectorStore()
+        elif backend == "local":
+            _stores[backend] = LocalVectorStore()
+        else:
+            raise ValueError(f"Unsupported vector store: {backend}")
+    return _stores[backend]
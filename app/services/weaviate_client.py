@@ -1,15 +1,89 @@
-from ..core.config import weaviate_url, weaviate_admin_api_key
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core.config import (
+    QUERY_SEARCH_CONCURRENCY,
+    VECTOR_COMPRESSION,
+    VECTOR_PQ_SEGMENTS,
+    VECTOR_RESCORE_LIMIT,
+    WEAVIATE_BATCH_CONCURRENCY,
+    WEAVIATE_BATCH_MODE,
+    WEAVIATE_BATCH_RATE_LIMIT,
+    WEAVIATE_BATCH_RETRIES,
+    WEAVIATE_BATCH_SIZE,
+    WEAVIATE_MULTI_TENANCY,
+    weaviate_url,
+    weaviate_admin_api_key,
+)
+from ..core.metrics import VECTOR_STORE_OBJECTS, record_count, track_external_call
+from .chunks import Chunk
+from .datasets import (
+    NUMERIC_TYPES,
+    aggregatable_field,
+    dataset_rows,
+    record_from_properties,
+)
 import weaviate
 import weaviate.classes as wvc
-from weaviate.classes.query import Filter
+from weaviate.classes.query import Filter, MetadataQuery
+from weaviate.util import generate_uuid5
 from weaviate.collections.classes.config import (
     DataType,
     Property,
     Configure,
+    Tokenization,
 )
 
+# First delay between batch write retries, doubled on every retry
+BATCH_RETRY_BACKOFF_SECONDS = 1.0
 
-def get_client():
+# Objects fetched per request when reading back the vectors of a document
+FETCH_PAGE_SIZE = 500
+
+# Multi-tenant DocumentChunk collection, one tenant per user
+TENANT_CHUNK_COLLECTION = "TenantDocumentChunk"
+
+# Weaviate data types of the structured JSON dataset field types
+DATASET_DATA_TYPES = {
+    "int": DataType.INT,
+    "number": DataType.NUMBER,
+    "boolean": DataType.BOOL,
+    "text": DataType.TEXT,
+}
+
+
+# Client kept open by a long-running process between open_shared_client()
+# and close_shared_client(), reused by every call made meanwhile
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+class SharedClient:
+    """
+    The shared client as returned by get_client(): closing it is a no-op,
+    so callers close whichever client they get.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def connect():
     # Connect to Weaviate Cloud
     return weaviate.connect_to_weaviate_cloud(
         cluster_url=weaviate_url,
@@ -17,50 +91,209 @@ def get_client():
     )
 
 
+def get_client():
+    """
+    The shared client while one is open, otherwise a new connection.
+    """
+    if _shared_client is not None:
+        return SharedClient(_shared_client)
+    return connect()
+
+
+def open_shared_client():
+    """
+    Connect the client shared by the process, if not connected yet.
+    """
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = connect()
+
+
+def close_shared_client():
+    global _shared_client
+    with _shared_client_lock:
+        client, _shared_client = _shared_client, None
+    if client is not None:
+        client.close()
+
+
+def document_chunk_vector_index_config(compression: str = VECTOR_COMPRESSION):
+    """
+    HNSW index config for DocumentChunk with the configured quantizer.
+    PQ and SQ are trained on the first objects written to the collection;
+    BQ and SQ rescore the best candidates with the uncompressed vectors.
+    """
+    if compression == "none":
+        quantizer = None
+    elif compression == "pq":
+        quantizer = Configure.VectorIndex.Quantizer.pq(
+            segments=VECTOR_PQ_SEGMENTS or None
+        )
+    elif compression == "bq":
+        quantizer = Configure.VectorIndex.Quantizer.bq(
+            rescore_limit=VECTOR_RESCORE_LIMIT
+        )
+    elif compression == "sq":
+        quantizer = Configure.VectorIndex.Quantizer.sq(
+            rescore_limit=VECTOR_RESCORE_LIMIT
+        )
+    else:
+        raise ValueError(f"Unsupported vector compression: {compression}")
+    return Configure.VectorIndex.hnsw(quantizer=quantizer)
+
+
+def document_id_property():
+    """
+    Filter key of the document an object belongs to (its S3 key, like
+    `document_name`). FIELD tokenization indexes the whole value as one
+    token, so filtering on it is an exact inverted index lookup.
+    """
+    return Property(
+        name="document_id",
+        data_type=DataType.TEXT,
+        tokenization=Tokenization.FIELD,
+        index_filterable=True,
+        index_searchable=False,
+    )
+
+
+def document_filter(document_name: str):
+    """
+    Filter matching exactly the objects of one document.
+    """
+    return Filter.by_property("document_id").equal(document_name)
+
+
+def with_document_id(properties: dict) -> dict:
+    return {**properties, "document_id": properties["document_name"]}
+
+
+def tenant_name(user_email: str) -> str:
+    """
+    Weaviate tenant of a user. Tenant names allow only letters, digits, "-"
+    and "_", so the readable part is sanitised and a hash keeps it unique.
+    """
+    readable = re.sub(r"[^A-Za-z0-9_-]", "_", user_email)[:40]
+    digest = hashlib.sha1(user_email.lower().encode("utf-8")).hexdigest()[:16]
+    return f"{readable}-{digest}"
+
+
+def chunk_collection(client, tenant: str = None):
+    """
+    The collection DocumentChunk objects of a user live in: with
+    WEAVIATE_MULTI_TENANCY the user's tenant of TenantDocumentChunk.
+    :param tenant: Email of the user owning the documents
+    """
+    if not WEAVIATE_MULTI_TENANCY:
+        return client.collections.get("DocumentChunk")
+    if not tenant:
+        raise ValueError("A tenant is required with WEAVIATE_MULTI_TENANCY")
+    return client.collections.get(TENANT_CHUNK_COLLECTION).with_tenant(
+        tenant_name(tenant)
+    )
+
+
+def create_document_chunk_collection(
+    client, name: str = "DocumentChunk", multi_tenancy: bool = False
+):
+    """
+    Create a collection of document chunks. A multi-tenant one creates
+    tenants on first write and reactivates idle tenants on access.
+    """
+    return client.collections.create(
+        name=name,
+        properties=[
+            Property(
+                name="document_name",
+                data_type=DataType.TEXT,
+                index_searchable=True,
+            ),
+            document_id_property(),
+            Property(name="chunk_index", data_type=DataType.INT),
+            Property(name="text", data_type=DataType.TEXT),
+            Property(name="page_number", data_type=DataType.TEXT),
+        ],
+        vectorizer_config=[
+            Configure.NamedVectors.none(
+                name="custom_vector",
+                vector_index_config=document_chunk_vector_index_config(),
+            )
+        ],
+        multi_tenancy_config=(
+            Configure.multi_tenancy(
+                enabled=True, auto_tenant_creation=True, auto_tenant_activation=True
+            )
+            if multi_tenancy
+            else None
+        ),
+    )
+
+
+def dataset_collection_name(document_name: str) -> str:
+    """
+    Collection holding the structured JSON dataset of a document.
+    """
+    digest = hashlib.sha1(document_name.encode("utf-8")).hexdigest()[:20]
+    return f"Dataset_{digest}"
+
+
+def create_dataset_collection(client, name: str, schema: dict):
+    """
+    Create the collection of a structured JSON dataset: one typed property
+    per field, described by the field's name in the upload. Numeric fields
+    are range indexed so they can be aggregated and range-filtered.
+    :param schema: Dataset schema from `datasets.infer_schema`
+    """
+    return client.collections.create(
+        name=name,
+        properties=[
+            Property(
+                name=spec["property"],
+                data_type=DATASET_DATA_TYPES[spec["type"]],
+                description=field,
+                index_range_filters=spec["type"] in NUMERIC_TYPES,
+            )
+            for field, spec in schema.items()
+        ],
+        vectorizer_config=[Configure.NamedVectors.none(name="custom_vector")],
+    )
+
+
+def read_dataset_schema(collection) -> dict:
+    """
+    The schema of a dataset collection, as `datasets.infer_schema` returns it.
+    """
+    field_types = {
+        data_type: field_type for field_type, data_type in DATASET_DATA_TYPES.items()
+    }
+    return {
+        prop.description
+        or prop.name: {
+            "property": prop.name,
+            "type": field_types.get(prop.data_type, "text"),
+        }
+        for prop in collection.config.get().properties
+    }
+
+
 def create_schema():
     """
-    Create the schema for the DocumentChunk class in Weaviate
+    Create the schema for the DocumentChunk class in Weaviate.
+    Existing collections are brought to the current schema by
+    `app.services.utils.migrate_schema`.
     """
     client = get_client()
-    # if "StructureJSONPlayer" in client.collections.list_all():
-    #     print("Deleting existing StructureJSONPlayer collection...")
-    #     client.collections.delete("StructureJSONPlayer")
     try:
-        if "DocumentChunk" not in client.collections.list_all():
-            client.collections.create(
-                name="DocumentChunk",
-                properties=[
-                    Property(
-                        name="document_name",
-                        data_type=DataType.TEXT,
-                        index_searchable=True,
-                    ),
-                    Property(name="chunk_index", data_type=DataType.INT),
-                    Property(name="text", data_type=DataType.TEXT),
-                    Property(name="page_number", data_type=DataType.TEXT),
-                ],
-                vectorizer_config=[Configure.NamedVectors.none(name="custom_vector")],
-            )
-        if "StructureJSONPlayer" not in client.collections.list_all():
-            client.collections.create(
-                name="StructureJSONPlayer",
-                properties=[
-                    Property(
-                        name="document_name",
-                        data_type=DataType.TEXT,
-                        index_searchable=True,
-                    ),
-                    Property(name="customer_id", data_type=DataType.NUMBER),
-                    Property(name="name", data_type=DataType.TEXT),
-                    Property(name="age", data_type=DataType.NUMBER),
-                    Property(name="membership", data_type=DataType.TEXT),
-                    Property(name="purchases_last_6_months", data_type=DataType.NUMBER),
-                    Property(name="preferred_category", data_type=DataType.TEXT),
-                    Property(name="last_purchase_date", data_type=DataType.TEXT),
-                    Property(name="nearest_store", data_type=DataType.TEXT),
-                    Property(name="total_spent", data_type=DataType.NUMBER),
-                ],
-                vectorizer_config=[Configure.NamedVectors.none(name="custom_vector")],
+        # A single lookup per collection: listing every collection would
+        # fetch the config of each dataset collection too
+        if not client.collections.exists("DocumentChunk"):
+            create_document_chunk_collection(client)
+        if WEAVIATE_MULTI_TENANCY and not client.collections.exists(
+            TENANT_CHUNK_COLLECTION
+        ):
+            create_document_chunk_collection(
+                client, TENANT_CHUNK_COLLECTION, multi_tenancy=True
             )
 
     except Exception as e:
@@ -69,101 +302,348 @@ def create_schema():
         client.close()
 
 
-def store_chunks_in_weaviate(chunk_data: dict):
+def object_uuid(document_name: str, key) -> str:
+    """
+    Deterministic UUID of an object of a document, so a retried or repeated
+    write replaces the object instead of duplicating it.
+    """
+    return generate_uuid5(f"{document_name}#{key}")
+
+
+def open_batch(collection, mode: str = None):
+    """
+    Batch context of a collection with the configured WEAVIATE_BATCH_MODE.
+    """
+    mode = mode or WEAVIATE_BATCH_MODE
+    if mode == "dynamic":
+        return collection.batch.dynamic()
+    if mode == "fixed":
+        return collection.batch.fixed_size(
+            batch_size=WEAVIATE_BATCH_SIZE,
+            concurrent_requests=WEAVIATE_BATCH_CONCURRENCY,
+        )
+    if mode == "rate_limit":
+        return collection.batch.rate_limit(
+            requests_per_minute=WEAVIATE_BATCH_RATE_LIMIT
+        )
+    raise ValueError(f"Unsupported Weaviate batch mode: {mode}")
+
+
+def write_objects(collection, objects: list[dict], retries: int = None) -> dict:
+    """
+    Batch-write objects, retrying only the ones that failed.
+    Write counts are added to the current task's processing metrics.
+    :param objects: Dicts with 'uuid', 'properties' and 'vector' (or None)
+    :param retries: Attempts after the first (default WEAVIATE_BATCH_RETRIES)
+    :return: Counts of objects written and retried
+    :raises Exception: When objects still fail after the last retry
+    """
+    retries = WEAVIATE_BATCH_RETRIES if retries is None else retries
+    pending = objects
+    retried = lost = 0
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(BATCH_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+        with track_external_call("weaviate", "batch_insert"):
+            with open_batch(collection) as batch:
+                for obj in pending:
+                    batch.add_object(
+                        properties=obj["properties"],
+                        vector=obj["vector"],
+                        uuid=obj["uuid"],
+                    )
+        failed = collection.batch.failed_objects
+        if not failed:
+            break
+        failed_uuids = {str(error.object_.uuid) for error in failed}
+        pending = [o for o in pending if str(o["uuid"]) in failed_uuids] or pending
+        error = failed[0].message
+        if attempt < retries:
+            print(f"Retrying {len(pending)} failed Weaviate objects: {error}")
+            retried += len(pending)
+    else:
+        lost = len(pending)
+
+    written = len(objects) - lost
+    for outcome, count in (
+        ("written", written),
+        ("retried", retried),
+        ("failed", lost),
+    ):
+        VECTOR_STORE_OBJECTS.labels(collection=collection.name, outcome=outcome).inc(
+            count
+        )
+    record_count("vector_objects", written)
+    record_count("vector_objects_retried", retried)
+    if lost:
+        record_count("vector_objects_failed", lost)
+        raise Exception(
+            f"Failed to write {lost} of {len(objects)} objects "
+            f"to {collection.name}: {error}"
+        )
+    return {"written": written, "retried": retried}
+
+
+def store_chunks_in_weaviate(chunk_data: dict, tenant: str = None):
     """
     Store a document chunk in Weaviate.
     :param chunk_data: Dictionary containing the chunk data
         with 'embedding' key.
+    :param tenant: Email of the user owning the document
+    """
+    store_batch_chunks_in_weaviate([chunk_data], tenant=tenant)
+
+
+def store_batch_chunks_in_weaviate(chunk_data: list[Chunk], tenant: str = None):
+    """
+    Store multiple document chunks in Weaviate. The chunks are not modified.
+    :param chunk_data: Chunk records (or chunk dicts) with an 'embedding'
+    :param tenant: Email of the user owning the documents
     """
+    objects = []
+    for chunk in map(Chunk.coerce, chunk_data):
+        objects.append(
+            {
+                "uuid": object_uuid(chunk.document_name, chunk.chunk_index),
+                "properties": with_document_id(chunk.properties()),
+                "vector": chunk.embedding,
+            }
+        )
     client = get_client()
     try:
-        embedding = chunk_data.pop("embedding")
-        client.collections.get("DocumentChunk").data.insert(
-            properties=chunk_data,
-            vector=embedding,
-        )
+        print(f"Storing {len(objects)} chunks in Weaviate...")
+        write_objects(chunk_collection(client, tenant), objects)
+    finally:
+        client.close()
+
+
+def write_dataset(client, document_name: str, rows: list[dict], schema: dict) -> int:
+    """
+    Replace the dataset collection of a document with the given records.
+    :return: Number of objects written
+    """
+    name = dataset_collection_name(document_name)
+    if client.collections.exists(name):
+        client.collections.delete(name)
+    collection = create_dataset_collection(client, name, schema)
+    objects = [
+        {
+            "uuid": object_uuid(document_name, i),
+            "properties": {
+                schema[field]["property"]: value for field, value in record.items()
+            },
+            "vector": None,
+        }
+        for i, record in enumerate(dataset_rows(rows, schema))
+    ]
+    write_objects(collection, objects)
+    return len(objects)
+
+
+def store_structured_json_in_weaviate(
+    document_name: str, rows: list[dict], schema: dict
+):
+    """
+    Store the records of a structured JSON document in its own collection.
+    :param rows: Records flattened with `datasets.flatten_record`
+    :param schema: Dataset schema from `datasets.infer_schema`
+    """
+    client = get_client()
+    try:
+        print(f"Storing {len(rows)} records of {document_name} in Weaviate...")
+        write_dataset(client, document_name, rows, schema)
     except Exception as e:
-        raise Exception(f"Error storing chunk in Weaviate: {e}")
+        raise Exception(f"Error storing structured JSON dataset in Weaviate: {e}")
     finally:
         client.close()
 
 
-def store_batch_chunks_in_weaviate(chunk_data: list[dict]):
+def delete_existing_document_chunks(document_name: str, tenant: str = None):
     """
-    Store multiple document chunks in Weaviate.
-    :param chunk_data: List of dictionaries containing the chunk data
-        with 'embedding' key.
+    Delete existing document chunks in Weaviate for a given document name.
     """
     client = get_client()
     try:
-        collection = client.collections.get("DocumentChunk")
-        print(f"Storing {len(chunk_data)} chunks in Weaviate...")
-        with collection.batch.fixed_size(batch_size=200) as batch:
-            for data_row in chunk_data:
-                embedding = data_row.pop("embedding")
-                batch.add_object(
-                    properties=data_row,
-                    vector=embedding,
-                )
+        collection = chunk_collection(client, tenant)
+        with track_external_call("weaviate", "delete_chunks"):
+            # A user's first upload has no tenant yet
+            if WEAVIATE_MULTI_TENANCY and not client.collections.get(
+                TENANT_CHUNK_COLLECTION
+            ).tenants.exists(collection.tenant):
+                return
+            collection.data.delete_many(
+                where=document_filter(document_name),
+            )
+
+    except Exception as e:
+        raise Exception(f"Error deleting existing document chunks: {e}")
     finally:
         client.close()
 
 
-def store_structured_json_in_weaviate(data: list[dict]):
+def delete_existing_json_agg(document_name: str):
     """
-    Store a StructureJSONPlayer in Weaviate.
-    :param data: Dictionary containing the player data.
+    Delete the structured JSON dataset collection of a document, if any.
     """
     client = get_client()
     try:
-        client.collections.get("StructureJSONPlayer").data.insert_many(
-            data,
-        )
+        name = dataset_collection_name(document_name)
+        with track_external_call("weaviate", "delete_structured_json"):
+            if client.collections.exists(name):
+                client.collections.delete(name)
+
     except Exception as e:
-        raise Exception(f"Error storing StructureJSONPlayer in Weaviate: {e}")
+        raise Exception(f"Error deleting existing structured JSON dataset: {e}")
     finally:
         client.close()
 
 
-def delete_existing_document_chunks(document_name: str):
+def dataset_collection(client, document_name: str):
     """
-    Delete existing document chunks in Weaviate for a given document name.
+    The dataset collection of a document, raising ValueError when the
+    document has no structured JSON dataset.
+    """
+    name = dataset_collection_name(document_name)
+    if not client.collections.exists(name):
+        raise ValueError(f"No structured JSON dataset stored for {document_name}")
+    return client.collections.get(name)
+
+
+def get_structured_json_schema(document_name: str) -> dict:
+    """
+    The inferred schema of the structured JSON dataset of a document.
     """
     client = get_client()
     try:
-        existing = client.collections.get("DocumentChunk").query.bm25(
-            query=document_name, query_properties=["document_name"], limit=1
-        )
-        if existing and existing.objects:
+        return read_dataset_schema(dataset_collection(client, document_name))
+    finally:
+        client.close()
 
-            client.collections.get("DocumentChunk").data.delete_many(
-                where=Filter.by_property("document_name").like(document_name),
-                verbose=True,
-            )
 
-    except Exception as e:
-        raise Exception(f"Error deleting existing document chunks: {e}")
+def fetch_document_vectors(document_name: str, tenant: str = None) -> list:
+    """
+    The stored vectors of every chunk of a document.
+    """
+    client = get_client()
+    try:
+        collection = chunk_collection(client, tenant)
+        vectors = []
+        offset = 0
+        while True:
+            with track_external_call("weaviate", "fetch_objects"):
+                page = collection.query.fetch_objects(
+                    filters=document_filter(document_name),
+                    include_vector=True,
+                    limit=FETCH_PAGE_SIZE,
+                    offset=offset,
+                )
+            for obj in page.objects:
+                vector = next(iter((obj.vector or {}).values()), None)
+                if vector is not None:
+                    vectors.append(vector)
+            if len(page.objects) < FETCH_PAGE_SIZE:
+                return vectors
+            offset += FETCH_PAGE_SIZE
     finally:
         client.close()
 
 
-def delete_existing_json_agg(document_name: str):
+def search_document_chunks(
+    document_name: str | list[str],
+    vectors: list[list[float]],
+    limit: int = 3,
+    tenant: str = None,
+) -> list[list[dict]]:
     """
-    Delete existing json player object in Weaviate for a given document name.
+    Run a near_vector search per query vector, restricted to one document
+    or a list of documents. Searches share one client and run concurrently.
+    :param document_name: Name of the document(s) to search in
+    :param vectors: Query vectors
+    :param limit: Number of chunks to return per query vector
+    :param tenant: Email of the user owning the document
+    :return: One list of chunk properties (plus 'distance') per query vector
     """
+    filters = (
+        document_filter(document_name)
+        if isinstance(document_name, str)
+        else Filter.by_property("document_id").contains_any(document_name)
+    )
     client = get_client()
     try:
-        existing = client.collections.get("StructureJSONPlayer").query.bm25(
-            query=document_name, query_properties=["document_name"], limit=1
-        )
-        if existing and existing.objects:
+        collection = chunk_collection(client, tenant)
+
+        def search(vector):
+            with track_external_call("weaviate", "near_vector"):
+                response = collection.query.near_vector(
+                    near_vector=vector,
+                    filters=filters,
+                    limit=limit,
+                    return_metadata=MetadataQuery(distance=True),
+                )
+            return [
+                {**obj.properties, "distance": obj.metadata.distance}
+                for obj in response.objects
+            ]
+
+        if len(vectors) == 1:
+            return [search(vectors[0])]
+        with ThreadPoolExecutor(
+            max_workers=min(QUERY_SEARCH_CONCURRENCY, len(vectors))
+        ) as executor:
+            return list(executor.map(search, vectors))
+    finally:
+        client.close()
 
-            client.collections.get("StructureJSONPlayer").data.delete_many(
-                where=Filter.by_property("document_name").like(document_name),
-                verbose=True,
+
+def aggregate_structured_json(document_name: str, field: str) -> dict:
+    """
+    Aggregate a numeric field of the structured JSON dataset of a document.
+    The aggregatable fields are read from the dataset collection's schema.
+    :param document_name: Name of the document the dataset belongs to
+    :param field: Numeric field to aggregate, as named in the upload
+    :return: Dictionary with count, maximum, minimum, mean, total and the
+        records holding the maximum and minimum values
+    """
+    client = get_client()
+    try:
+        collection = dataset_collection(client, document_name)
+        schema = read_dataset_schema(collection)
+        spec = aggregatable_field(schema, field)
+        prop = spec["property"]
+        metrics = wvc.query.Metrics(prop)
+        metrics = metrics.integer if spec["type"] == "int" else metrics.number
+        with track_external_call("weaviate", "aggregate"):
+            agg_result = collection.aggregate.over_all(
+                total_count=True,
+                return_metrics=metrics(
+                    count=True,
+                    maximum=True,
+                    minimum=True,
+                    mean=True,
+                    sum_=True,
+                ),
             )
+        result = agg_result.properties[prop]
 
-    except Exception as e:
-        raise Exception(f"Error deleting existing document chunks: {e}")
+        def holders(value) -> list[dict]:
+            if value is None:
+                return []
+            response = collection.query.fetch_objects(
+                filters=Filter.by_property(prop).equal(value)
+            )
+            return [
+                record_from_properties(obj.properties, schema)
+                for obj in response.objects
+            ]
+
+        return {
+            "count": agg_result.total_count,
+            "maximum": result.maximum,
+            "minimum": result.minimum,
+            "mean": result.mean,
+            "total": result.sum_,
+            "max_user_details": holders(result.maximum),
+            "min_user_details": holders(result.minimum),
+        }
     finally:
         client.close()
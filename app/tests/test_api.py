@@ -1,15 +1,34 @@
-from unittest.mock import patch
+import asyncio
+import uuid
+from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
+from app import main
 from app.main import app
+from app.services.health import HealthMonitor
+from app.services.rate_limit import ConcurrencyLimiter
 
 client = TestClient(app)
 
 
-@patch("app.main.get_client")
-def test_health(mock_get_client):
+class FakeJobQueue:
+    jobs = []
+
+    def enqueue(self, job):
+        self.jobs.append(job)
+
+
+@patch("app.services.health.get_vector_store")
+def test_health(mock_get_vector_store, monkeypatch):
+    monkeypatch.setattr("app.main.health_monitor", HealthMonitor())
+    mock_get_vector_store.return_value.name = "weaviate"
+    mock_get_vector_store.return_value.is_ready.return_value = True
     response = client.get("/health")
     assert response.status_code == 200
-    assert "weaviate" in response.json()
+    assert response.json()["status"] == "ok"
+    assert response.json()["dependencies"]["vector_store"]["backend"] == "weaviate"
+
+    client.get("/health")
+    assert mock_get_vector_store.return_value.is_ready.call_count == 1
 
 
 def test_root():
@@ -31,15 +50,175 @@ def test_get_users_tasks_empty():
 
 
 def test_upload_document(monkeypatch):
-    monkeypatch.setattr("app.main.development", True)
-    monkeypatch.setattr(
-        "app.main.process_document", lambda task_id, structured_json: None
-    )
+    monkeypatch.setattr("app.main.get_job_queue", lambda: FakeJobQueue())
 
     response = client.post(
         "/upload-document",
         files={"file": ("test.txt", b"Test content")},
-        data={"user_email": "test@example.com"},
+        data={"user_email": f"{uuid.uuid4().hex}@example.com"},
     )
     assert response.status_code == 200
     assert "task_id" in response.json()
+    assert FakeJobQueue.jobs[-1] == {
+        "task_id": response.json()["task_id"],
+        "structured_json": "False",
+        "lane": "small",
+        "ingest_version": 1,
+    }
+
+
+def test_duplicate_upload_joins_running_job(monkeypatch):
+    """
+    Test that uploading a document again while it is processed queues no
+    second job, unless its content changed.
+    """
+    monkeypatch.setattr("app.main.get_job_queue", lambda: FakeJobQueue())
+    user_email = f"{uuid.uuid4().hex}@example.com"
+
+    def upload(content):
+        jobs = len(FakeJobQueue.jobs)
+        response = client.post(
+            "/upload-document",
+            files={"file": ("report.txt", content)},
+            data={"user_email": user_email},
+        )
+        return response.json()["task_id"], FakeJobQueue.jobs[jobs:]
+
+    task_id, jobs = upload(b"First draft")
+    assert [job["ingest_version"] for job in jobs] == [1]
+    assert upload(b"First draft") == (task_id, [])
+
+    again, jobs = upload(b"Second draft")
+    assert again == task_id
+    assert [job["ingest_version"] for job in jobs] == [2]
+
+
+def test_query_batch_embeds_once(monkeypatch):
+    monkeypatch.setattr("app.main.get_job_queue", lambda: FakeJobQueue())
+    task_id = client.post(
+        "/upload-document",
+        files={"file": ("batch.txt", b"Test content")},
+        data={"user_email": "batch@example.com"},
+    ).json()["task_id"]
+
+    embedding_calls = []
+
+    def fake_embedding(text):
+        embedding_calls.append([t["text"] for t in text])
+        return [[1.0, 0.0] for _ in text]
+
+    class FakeStore:
+        def search_many(self, document_name, vectors, limit=3, tenant=None):
+            return [[{"text": f"hit {i}"}] * limit for i in range(len(vectors))]
+
+    monkeypatch.setattr("app.main.generate_embedding", fake_embedding)
+    monkeypatch.setattr("app.main.get_vector_store", lambda: FakeStore())
+
+    response = client.post(
+        "/document/query/batch",
+        json={"task_id": str(task_id), "questions": ["first", "second"], "limit": 2},
+    )
+    assert response.status_code == 200
+    assert response.json()["answers"] == {
+        "first": ["hit 0", "hit 0"],
+        "second": ["hit 1", "hit 1"],
+    }
+    assert embedding_calls == [["first", "second"]]
+
+
+def test_metrics():
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert (
+        'rag_http_request_duration_seconds_count{method="GET",route="/",status="200"}'
+        in response.text
+    )
+    assert "rag_query_cache_hit_rate" in response.text
+
+
+def test_upload_over_rate_limit(monkeypatch):
+    monkeypatch.setattr("app.main.get_job_queue", lambda: FakeJobQueue())
+    monkeypatch.setattr("app.services.rate_limit.RATE_LIMITS", {"upload": (2, 100)})
+    user_email = f"{uuid.uuid4().hex}@example.com"
+
+    statuses = [
+        client.post(
+            "/upload-document",
+            files={"file": (f"limited{i}.txt", b"Test content")},
+            data={"user_email": user_email},
+        )
+        for i in range(3)
+    ]
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert int(statuses[-1].headers["Retry-After"]) >= 1
+
+
+def test_upload_rate_limit_runs_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr("app.main.get_job_queue", lambda: FakeJobQueue())
+    loops = []
+
+    def admit(action, user_email, cost=1):
+        try:
+            loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            loops.append(None)
+
+    monkeypatch.setattr("app.main.admit", admit)
+    response = client.post(
+        "/upload-document",
+        files={"file": ("offloop.txt", b"Test content")},
+        data={"user_email": f"{uuid.uuid4().hex}@example.com"},
+    )
+    assert response.status_code == 200
+    assert loops == [None]
+
+
+def test_query_sheds_load_when_saturated(monkeypatch):
+    monkeypatch.setattr("app.main.get_job_queue", lambda: FakeJobQueue())
+    task_id = client.post(
+        "/upload-document",
+        files={"file": ("busy.txt", b"Test content")},
+        data={"user_email": "busy@example.com"},
+    ).json()["task_id"]
+    monkeypatch.setattr("app.services.rate_limit.query_limiter", ConcurrencyLimiter(0))
+
+    response = client.post(
+        "/document/query", json={"task_id": str(task_id), "question": "hi"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_lambda_starts_up_once_per_container(monkeypatch):
+    """
+    Test that Lambda invocations reuse the clients of the first one instead
+    of warming up and connecting on every request.
+    """
+    warm_ups = []
+    store = MagicMock()
+    monkeypatch.setattr(main, "_started", False)
+    monkeypatch.setattr(main, "STARTUP_WARMUP", True)
+    monkeypatch.setattr(main, "warm_up", lambda: warm_ups.append(1))
+    monkeypatch.setattr(main, "health_monitor", MagicMock())
+    monkeypatch.setattr(main, "get_vector_store", lambda: store)
+    event = {
+        "version": "2.0",
+        "routeKey": "GET /",
+        "rawPath": "/",
+        "rawQueryString": "",
+        "headers": {"host": "api.example.com"},
+        "requestContext": {
+            "http": {"method": "GET", "path": "/", "sourceIp": "127.0.0.1"},
+            "stage": "$default",
+        },
+        "isBase64Encoded": False,
+    }
+
+    for _ in range(2):
+        response = main.handler(event, None)
+        assert response["statusCode"] == 200
+    assert warm_ups == [1]
+    assert store.connect.call_count == 1
+    assert main.health_monitor.start.call_count == 1
+    assert store.close.call_count == 0
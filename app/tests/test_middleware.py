@@ -0,0 +1,68 @@
+import os
+import time
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware import add_profiling_middleware
+
+
+def busy_handler_work():
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def make_app(tmp_path, max_files=50):
+    app = FastAPI()
+    with patch("app.middleware.PROFILING_ENABLED", True):
+        add_profiling_middleware(app)
+
+    @app.get("/work")
+    def work():
+        busy_handler_work()
+        return {"done": True}
+
+    patches = [
+        patch("app.middleware.PROFILE_DIR", str(tmp_path)),
+        patch("app.middleware.PROFILE_MAX_FILES", max_files),
+        patch("app.middleware.PROFILING_INTERVAL_SECONDS", 0.001),
+    ]
+    for p in patches:
+        p.start()
+    return TestClient(app), patches
+
+
+def test_profiling_captures_sync_handler(tmp_path):
+    client, patches = make_app(tmp_path)
+    try:
+        plain = client.get("/work")
+        assert "X-Profile-File" not in plain.headers
+
+        response = client.get("/work", headers={"X-Profile": "1"})
+        assert response.json() == {"done": True}
+        file_name = response.headers["X-Profile-File"]
+        with open(os.path.join(tmp_path, file_name), encoding="utf-8") as f:
+            assert "busy_handler_work" in f.read()
+
+        inline = client.get("/work", headers={"X-Profile": "inline"})
+        body = inline.json()
+        assert body["status_code"] == 200
+        assert body["samples"] > 0 and body["top_functions"]
+        assert "busy_handler_work" in body["folded"]
+    finally:
+        for p in patches:
+            p.stop()
+
+
+def test_profile_dir_is_bounded(tmp_path):
+    client, patches = make_app(tmp_path, max_files=2)
+    try:
+        for _ in range(4):
+            client.get("/work", headers={"X-Profile": "1"})
+            time.sleep(0.01)
+        assert len(os.listdir(tmp_path)) == 2
+    finally:
+        for p in patches:
+            p.stop()
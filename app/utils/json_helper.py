@@ -31,34 +31,3 @@ def json_to_text_snippet(obj):
     for k, v in obj.items():
         parts.append(f"{k.capitalize()}: {v}")
     return ", ".join(parts)
-
-
-def validate_json(json_data):
-    """
-    Validate the structure of a player JSON object.
-    Args:
-        player_json (dict): The JSON object representing a player.
-    Returns:
-        bool: True if the JSON object is valid, raises an error otherwise.
-    """
-    required_fields = {
-        "customer_id": int,
-        "name": str,
-        "age": int,
-        "membership": str,
-        "purchases_last_6_months": int,
-        "total_spent": (int, float),
-        "preferred_category": str,
-        "last_purchase_date": str,
-        "nearest_store": str,
-    }
-
-    for field, expected_type in required_fields.items():
-        if field not in json_data:
-            raise ValueError(f"Missing required field: {field}")
-        if not isinstance(json_data[field], expected_type):
-            raise TypeError(
-                f"Field {field} must be of type {expected_type}, got {type(json_data[field])}"
-            )
-
-    return True
@@ -3,7 +3,8 @@ import boto3
 from fastapi import UploadFile
 import os
 
-from ..core.config import USE_S3, FILE_SIZE_LIMIT, BUCKET_NAME
+from ..core.config import USE_S3, FILE_SIZE_LIMIT, BUCKET_NAME, UPLOAD_DIR
+from ..core.metrics import track_external_call
 
 
 async def upload_file_to_s3(file: UploadFile, user_email: str):
@@ -13,11 +14,12 @@ async def upload_file_to_s3(file: UploadFile, user_email: str):
     if USE_S3:
         s3 = boto3.client("s3")
         s3_key = f"{user_email}/{file.filename}"
-        s3.upload_fileobj(io.BytesIO(contents), BUCKET_NAME, s3_key)
+        with track_external_call("s3", "upload_fileobj"):
+            s3.upload_fileobj(io.BytesIO(contents), BUCKET_NAME, s3_key)
         file_location = s3_key
     else:
         # Local storage
-        upload_dir = f"uploaded_files/{user_email}"
+        upload_dir = os.path.join(UPLOAD_DIR, user_email)
         os.makedirs(upload_dir, exist_ok=True)
         file_path = os.path.join(upload_dir, file.filename)
         with open(file_path, "wb") as f:
@@ -1,14 +1,100 @@
 import json
-from app.services.ingestion import process_document
+import time
+from app.core.config import JOB_RETRY_DELAY_SECONDS
+from app.services.ingestion import (
+    DeadlineExceeded,
+    process_document,
+    process_document_shard,
+)
+from app.services.job_queue import get_job_queue
+from app.services.scheduling import (
+    IngestionLease,
+    IngestionSuperseded,
+    claim_task,
+)
 
 
-def lambda_handler(event, context):
-    for record in event["Records"]:
-        body = json.loads(record["body"])
-        task_id = int(body["task_id"])
+def handle_message(body: dict, deadline: float = None):
+    """
+    Process one document processing job, as sent by `/upload-document`.
+    Shared by the SQS Lambda handler and the local job queue workers.
+
+    When the worker gets close to `deadline` (a time.monotonic() value) the
+    job is queued again and resumes from its checkpoints.
+
+    When the user already runs as many jobs in the lane as allowed, the job
+    is queued again with a delay instead of being processed. Shard jobs of
+    an already started task are not limited.
+
+    Jobs of an older upload of the document ("ingest_version") are dropped,
+    and stop between stages once the document is uploaded again. While
+    another worker holds the task's lease the job is retried later.
+    """
+    task_id = int(body["task_id"])
+    structured_json = str(body.get("structured_json", "false")).lower()
+    version = body.get("ingest_version")
+
+    if "shard_index" in body:
+        shard_index = int(body["shard_index"])
+        print(f"Processing task_id: {task_id} shard: {shard_index}")
+        try:
+            process_document_shard(
+                task_id, shard_index, deadline=deadline, version=version
+            )
+        except DeadlineExceeded as e:
+            print(f"{e}, re-queueing task_id {task_id} shard {shard_index}")
+            get_job_queue().enqueue(body)
+            return
+        except IngestionSuperseded as e:
+            print(f"{e}, dropping task_id {task_id} shard {shard_index}")
+            return
+        print(f"Completed processing task_id: {task_id} shard: {shard_index}")
+        return
+
+    lease = IngestionLease(task_id, version)
+    try:
+        if not lease.acquire():
+            print(
+                f"Task_id {task_id} is processed by another worker, retrying "
+                f"in {JOB_RETRY_DELAY_SECONDS}s"
+            )
+            get_job_queue().enqueue(body, delay_seconds=JOB_RETRY_DELAY_SECONDS)
+            return
+    except IngestionSuperseded as e:
+        print(f"{e}, dropping task_id {task_id}")
+        return
+
+    try:
+        if not claim_task(task_id):
+            print(
+                f"User job limit reached, retrying task_id {task_id} "
+                f"in {JOB_RETRY_DELAY_SECONDS}s"
+            )
+            get_job_queue().enqueue(body, delay_seconds=JOB_RETRY_DELAY_SECONDS)
+            return
 
         print(f"Processing task_id: {task_id}")
-        process_document(task_id)
+        try:
+            process_document(
+                task_id, structured_json=structured_json, deadline=deadline, lease=lease
+            )
+        except DeadlineExceeded as e:
+            print(f"{e}, re-queueing task_id {task_id}")
+            get_job_queue().enqueue(body)
+            return
+        except IngestionSuperseded as e:
+            print(f"{e}, stopping task_id {task_id}")
+            return
         print(f"Completed processing task_id: {task_id}")
+    finally:
+        lease.release()
+
+
+def lambda_handler(event, context):
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000
+    for record in event["Records"]:
+        handle_message(json.loads(record["body"]), deadline=deadline)
 
     return {"statusCode": 200, "body": json.dumps("Processed all tasks successfully")}
@@ -0,0 +1,30 @@
+"""Add processing metrics to task status
+
+Revision ID: 3f9a1c2b7d4e
+Revises: dbe3de9b18ee
+Create Date: 2026-10-19 10:12:41.532918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9a1c2b7d4e"
+down_revision: Union[str, None] = "dbe3de9b18ee"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "task_status", sa.Column("processing_metrics", sa.String(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("task_status", "processing_metrics")
@@ -0,0 +1,50 @@
+"""Add document shards
+
+Revision ID: 5e7f9a0b2c4d
+Revises: 8c2d4e6f1a3b
+Create Date: 2026-10-19 12:21:05.618342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e7f9a0b2c4d"
+down_revision: Union[str, None] = "8c2d4e6f1a3b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "document_shard",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("task_id", sa.Integer(), nullable=True),
+        sa.Column("shard_index", sa.Integer(), nullable=True),
+        sa.Column("page_start", sa.Integer(), nullable=True),
+        sa.Column("page_end", sa.Integer(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("chunk_count", sa.Integer(), nullable=True),
+        sa.Column("error_message", sa.String(), nullable=True),
+        sa.Column("processing_metrics", sa.String(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["task_id"], ["task_status.task_id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_document_shard_id"), "document_shard", ["id"], unique=False
+    )
+    op.create_index(
+        op.f("ix_document_shard_task_id"), "document_shard", ["task_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_document_shard_task_id"), table_name="document_shard")
+    op.drop_index(op.f("ix_document_shard_id"), table_name="document_shard")
+    op.drop_table("document_shard")
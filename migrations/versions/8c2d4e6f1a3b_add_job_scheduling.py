@@ -0,0 +1,34 @@
+"""Add job scheduling columns to task status
+
+Revision ID: 8c2d4e6f1a3b
+Revises: 3f9a1c2b7d4e
+Create Date: 2026-10-19 11:03:17.204611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c2d4e6f1a3b"
+down_revision: Union[str, None] = "3f9a1c2b7d4e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("task_status", sa.Column("lane", sa.String(), nullable=True))
+    op.add_column("task_status", sa.Column("estimated_cost", sa.Float(), nullable=True))
+    op.add_column("task_status", sa.Column("queued_at", sa.DateTime(), nullable=True))
+    op.add_column("task_status", sa.Column("started_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("task_status", "started_at")
+    op.drop_column("task_status", "queued_at")
+    op.drop_column("task_status", "estimated_cost")
+    op.drop_column("task_status", "lane")
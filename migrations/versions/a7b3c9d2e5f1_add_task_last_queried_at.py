@@ -0,0 +1,30 @@
+"""Add last queried time to task status
+
+Revision ID: a7b3c9d2e5f1
+Revises: 5e7f9a0b2c4d
+Create Date: 2026-10-19 14:47:52.381906
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7b3c9d2e5f1"
+down_revision: Union[str, None] = "5e7f9a0b2c4d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "task_status", sa.Column("last_queried_at", sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("task_status", "last_queried_at")
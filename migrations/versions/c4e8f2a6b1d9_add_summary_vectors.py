@@ -0,0 +1,34 @@
+"""Add document summary vectors
+
+Revision ID: c4e8f2a6b1d9
+Revises: a7b3c9d2e5f1
+Create Date: 2026-10-19 16:05:13.204871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8f2a6b1d9"
+down_revision: Union[str, None] = "a7b3c9d2e5f1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "task_status", sa.Column("summary_vector", sa.LargeBinary(), nullable=True)
+    )
+    op.add_column(
+        "document_shard", sa.Column("summary_vector", sa.LargeBinary(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("document_shard", "summary_vector")
+    op.drop_column("task_status", "summary_vector")
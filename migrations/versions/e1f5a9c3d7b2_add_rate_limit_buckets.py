@@ -0,0 +1,34 @@
+"""Add rate limit buckets
+
+Revision ID: e1f5a9c3d7b2
+Revises: c4e8f2a6b1d9
+Create Date: 2026-10-19 17:22:41.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e1f5a9c3d7b2"
+down_revision: Union[str, None] = "c4e8f2a6b1d9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "rate_limit_bucket",
+        sa.Column("key", sa.String(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=True),
+        sa.Column("updated_at", sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint("key"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("rate_limit_bucket")
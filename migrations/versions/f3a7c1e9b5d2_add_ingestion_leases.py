@@ -0,0 +1,39 @@
+"""Add ingestion versions and leases
+
+Revision ID: f3a7c1e9b5d2
+Revises: e1f5a9c3d7b2
+Create Date: 2026-10-19 19:04:12.730415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3a7c1e9b5d2"
+down_revision: Union[str, None] = "e1f5a9c3d7b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "task_status",
+        sa.Column("ingest_version", sa.Integer(), nullable=True, server_default="0"),
+    )
+    op.add_column("task_status", sa.Column("content_hash", sa.String(), nullable=True))
+    op.add_column("task_status", sa.Column("lease_owner", sa.String(), nullable=True))
+    op.add_column(
+        "task_status", sa.Column("lease_expires_at", sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("task_status", "lease_expires_at")
+    op.drop_column("task_status", "lease_owner")
+    op.drop_column("task_status", "content_hash")
+    op.drop_column("task_status", "ingest_version")